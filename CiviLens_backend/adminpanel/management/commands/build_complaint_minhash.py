@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from db_connection import db
+from complaints import duplicates
+
+
+class Command(BaseCommand):
+    help = ("Compute MinHash signatures of existing complaint descriptions into complaint_minhash, which web "
+            "processes load as their near-duplicate index; safe to re-run")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Complaints per write batch')
+        parser.add_argument('--days', type=int, default=duplicates.WINDOW_DAYS,
+                            help='Only complaints created in the last N days (0: all)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options['batch_size']))
+        days = max(0, int(options['days']))
+        cutoff = int(time.time() * 1000) - days * 86400000 if days else None
+        duplicates.ensure_indexes(db)
+
+        t0 = time.time()
+        stored = scanned = 0
+        batch = []
+        # created_at is mixed (epoch ms, ISO strings), so the window is applied per document
+        cursor = db['complaints'].find({'description': {'$type': 'string'}}, {'description': 1, 'created_at': 1})
+        for doc in cursor.batch_size(batch_size):
+            scanned += 1
+            if cutoff is not None and (duplicates.created_ms(doc) or 0) < cutoff:
+                continue
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                stored += duplicates.store_signatures(db, batch)
+                batch.clear()
+                self.stdout.write(f'  {stored} signatures stored ({scanned} complaints scanned)')
+        if batch:
+            stored += duplicates.store_signatures(db, batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} signatures from {scanned} complaints in {time.time() - t0:.1f}s'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from db_connection import db
+from sentiment import ingest
+
+
+class Command(BaseCommand):
+    help = ("Register an IVR / SMS feedback partner (or rotate its key) for POST /api/sentiment/ingest/ "
+            "and print the API key once; only its hash is stored")
+
+    def add_arguments(self, parser):
+        parser.add_argument('partner_id', type=str, help='Stable partner id stored on every record, e.g. ivr-odisha')
+        parser.add_argument('--name', type=str, default='', help='Display name')
+        parser.add_argument('--deactivate', action='store_true', help='Revoke the partner key instead')
+
+    def handle(self, *args, **options):
+        ingest.ensure_indexes(db)
+        pid = options['partner_id']
+        if options['deactivate']:
+            res = db[ingest.PARTNERS].update_one({'_id': pid}, {'$set': {'active': False}})
+            msg = f'Deactivated {pid}' if res.matched_count else f'No partner {pid}'
+            self.stdout.write(self.style.SUCCESS(msg) if res.matched_count else self.style.WARNING(msg))
+            return
+        key = ingest.create_partner(db, pid, options['name'])
+        self.stdout.write(self.style.SUCCESS(f'Partner {pid} ready. API key (shown once):'))
+        self.stdout.write(key)
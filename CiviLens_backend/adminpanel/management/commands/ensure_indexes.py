@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from db_connection import db
+from complaints import duplicates, feed, geo, votes
+from core import outbox, timeseries
+from sentiment import ingest, rollups, windows
+from users import indexes as user_indexes
+
+# Modules that own collections and the indexes their queries rely on. geo is last: its
+# 2dsphere build fails until migrate_complaint_geo has rewritten legacy geo values.
+INDEX_OWNERS = (rollups, windows, ingest, timeseries, feed, votes, duplicates, user_indexes, outbox, geo)
+
+
+class Command(BaseCommand):
+    help = 'Create the MongoDB indexes the API queries rely on (idempotent)'
+
+    def handle(self, *args, **options):
+        for owner in INDEX_OWNERS:
+            owner.ensure_indexes(db)
+            self.stdout.write(f'Ensured indexes for {owner.__name__}')
+        self.stdout.write(self.style.SUCCESS('Indexes up to date'))
@@ -0,0 +1,43 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sentiment import onnx_backend
+from sentiment.nlp_utils import ENGLISH_MODEL_NAME, MULTILINGUAL_MODEL_NAME, ST_MODEL_NAME
+
+
+class Command(BaseCommand):
+    help = ("Export the MiniLM sentence encoder, the multilingual and the English sentiment classifiers "
+            "to ONNX with dynamic int8 quantization for SENTIMENT_BACKEND=onnx")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--out', type=str, default=settings.SENTIMENT_ONNX_DIR, help='Output directory')
+        parser.add_argument('--only', choices=['encoder', 'classifier', 'english'], help='Export just one model')
+        parser.add_argument('--classifier', type=str, default=MULTILINGUAL_MODEL_NAME,
+                            help='HF multilingual sentiment model to export')
+        parser.add_argument('--english', type=str, default=ENGLISH_MODEL_NAME,
+                            help='HF English sentiment model to export (language routing)')
+        parser.add_argument('--no-quantize', action='store_true', help='Keep only the fp32 export')
+
+    def handle(self, *args, **options):
+        if not onnx_backend.available():
+            raise CommandError('onnxruntime and transformers are required (pip install onnxruntime onnx)')
+        out = options['out']
+        quantize = not options['no_quantize']
+
+        if options['only'] in (None, 'encoder'):
+            from sentence_transformers import SentenceTransformer
+            st = SentenceTransformer(ST_MODEL_NAME)
+            meta = onnx_backend.export_encoder(st, os.path.join(out, 'encoder'), ST_MODEL_NAME, quantize)
+            self.stdout.write(self.style.SUCCESS(f"Exported encoder ({meta['dim']}d, {meta['pooling']} pooling)"))
+
+        for kind, subdir, name in (('classifier', 'classifier', options['classifier']),
+                                   ('english', 'classifier_en', options['english'])):
+            if options['only'] not in (None, kind):
+                continue
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+            model = AutoModelForSequenceClassification.from_pretrained(name)
+            tokenizer = AutoTokenizer.from_pretrained(name)
+            meta = onnx_backend.export_classifier(model, tokenizer, os.path.join(out, subdir), name, quantize)
+            self.stdout.write(self.style.SUCCESS(f"Exported {kind} classifier {name} ({len(meta['id2label'])} labels)"))
+
+        self.stdout.write(f'Set SENTIMENT_BACKEND=onnx and SENTIMENT_ONNX_DIR={out} to serve from it')
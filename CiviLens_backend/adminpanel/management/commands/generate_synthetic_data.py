@@ -2,6 +2,7 @@ import random
 import string
 import time
 from datetime import datetime, timedelta
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from db_connection import db
 """
@@ -253,7 +254,7 @@ class Command(BaseCommand):
                             'region': region,
                             'label': lab,
                             'text': 'Generated citizen feedback text',
-                            'created_at': sent_when.isoformat(),
+                            'created_at': sent_when,  # BSON date: time field of the time-series layout
                         })
                         total_sentiments += 1
                 t += timedelta(days=7)
@@ -284,7 +285,7 @@ class Command(BaseCommand):
                         'region': region,
                         'label': random.choice(['negative','negative','neutral','positive']),
                         'text': 'Burst-related negative feedback',
-                        'created_at': (when + timedelta(days=random.randint(-2,2))).isoformat(),
+                        'created_at': when + timedelta(days=random.randint(-2,2)),
                     })
                     total_sentiments += 1
 
@@ -297,6 +298,10 @@ class Command(BaseCommand):
         if bulk_sentiments:
             _chunked_insert(sentiments_col, bulk_sentiments, batch_size=2000, ordered=False)
 
+        # Imported rows bypass the labelling worker and the feed counters; rebuild both from them
+        call_command('rebuild_sentiment_rollups', stdout=self.stdout)
+        call_command('rebuild_complaint_counters', stdout=self.stdout)
+
         self.stdout.write(self.style.SUCCESS(
             f"Created {len(schemes)} schemes, {len(bulk_complaints)} complaints, {len(bulk_sentiments)} sentiment records"
         ))
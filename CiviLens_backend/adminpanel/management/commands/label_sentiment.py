@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from db_connection import db
+from sentiment import labeling, rollups
+
+
+class Command(BaseCommand):
+    help = ("Label queued complaint / sentiment_record texts once and store sentiment, sentiment_model "
+            "and labelled_at on the source documents (dashboards read the stored labels)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256, help='Texts per model call')
+        parser.add_argument('--interval', type=int, default=10, help='Seconds to sleep between polls')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue existing documents that have no sentiment/label yet')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options['batch_size']))
+        interval = max(1, int(options['interval']))
+        rollups.ensure_indexes(db)
+
+        if options['backfill']:
+            for source in labeling.SOURCES:
+                n = labeling.enqueue_unlabelled(db, source)
+                self.stdout.write(f'Queued {n} unlabelled {source}')
+
+        while True:
+            try:
+                res = labeling.drain(db, batch_size=batch_size)
+                if res['labelled']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Labelled {res['labelled']} texts ({res['pending']} still queued)"
+                    ))
+                elif res['pending']:
+                    self.stdout.write(self.style.WARNING(
+                        f"{res['pending']} texts queued but no sentiment model is available"
+                    ))
+            except (AutoReconnect, NetworkTimeout) as e:
+                self.stdout.write(self.style.WARNING(f'Transient Mongo error, retrying next round: {e}'))
+            if options['once']:
+                break
+            time.sleep(interval)
@@ -2,9 +2,11 @@ import os
 import csv
 import time
 from datetime import datetime
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from pymongo.errors import AutoReconnect, NetworkTimeout
 from db_connection import db
+from core.timeseries import event_time
 
 # Simple chunked insert with retries
 def _chunked_insert(col, docs, batch_size=2000, max_retries=5, **kwargs):
@@ -107,11 +109,15 @@ class Command(BaseCommand):
                     'region': row.get('region'),
                     'label': row.get('label'),
                     'text': row.get('text') or '',
-                    'created_at': row.get('created_at'),
+                    'created_at': event_time(row.get('created_at')),  # BSON date (time-series time field)
                 })
         if sentiments:
             _chunked_insert(sentiments_col, sentiments, batch_size=2000, ordered=False)
 
+        # Imported rows bypass the labelling worker and the feed counters; rebuild both from them
+        call_command('rebuild_sentiment_rollups', stdout=self.stdout)
+        call_command('rebuild_complaint_counters', stdout=self.stdout)
+
         self.stdout.write(self.style.SUCCESS(
             f"Loaded {len(schemes)} schemes, {len(complaints)} complaints, {len(sentiments)} sentiments from {data_dir}"
         ))
@@ -0,0 +1,51 @@
+import os
+from urllib.parse import urlparse, unquote
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from db_connection import db
+from complaints import attachments
+
+
+class Command(BaseCommand):
+    help = ("Move legacy flat MEDIA_ROOT/complaints/<ms>_<name> uploads into the content-addressed "
+            "attachment store and point their complaints at it")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-files', action='store_true', help='Leave the legacy files in place')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        legacy_dir = os.path.join(settings.MEDIA_ROOT, 'complaints')
+        media_prefix = '/' + settings.MEDIA_URL.strip('/') + '/complaints/'
+        moved = missing = 0
+        migrated_files = set()
+        query = {'document_url': {'$exists': True, '$ne': None}, 'attachment': {'$exists': False}}
+        for doc in db['complaints'].find(query, {'document_url': 1}):
+            path = unquote(urlparse(doc['document_url']).path)
+            if not path.startswith(media_prefix):
+                continue
+            stored_name = path[len(media_prefix):]
+            src = os.path.join(legacy_dir, stored_name)
+            if not os.path.isfile(src):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"{doc['_id']}: {src} not found, left as is"))
+                continue
+            if options['dry_run']:
+                moved += 1
+                continue
+            # Legacy names are "<ms>_<original name>"
+            original = stored_name.split('_', 1)[1] if '_' in stored_name else stored_name
+            with open(src, 'rb') as fh:
+                record = attachments.store(db, iter(lambda: fh.read(64 * 1024), b''), original)
+            db['complaints'].update_one({'_id': doc['_id']}, {'$set': {
+                'attachment': record,
+                # Relative; ComplaintDetailView makes it absolute per request
+                'document_url': attachments.url_path(record['sha256']),
+            }})
+            migrated_files.add(src)
+            moved += 1
+        if not options['keep_files'] and not options['dry_run']:
+            for src in migrated_files:
+                os.remove(src)
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} attachments ({missing} legacy files missing)'))
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from db_connection import db
+from complaints import geo
+
+
+class Command(BaseCommand):
+    help = ("Rewrite legacy free-form complaints.geo values as GeoJSON points (dropping unusable ones) and "
+            "build the 2dsphere index; safe to re-run")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Complaints per write batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would change')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options['batch_size']))
+        t0 = time.time()
+        converted = dropped = unchanged = 0
+        ops = []
+        for doc in db['complaints'].find({geo.GEO_FIELD: {'$exists': True}}, {geo.GEO_FIELD: 1}).batch_size(batch_size):
+            raw = doc.get(geo.GEO_FIELD)
+            point = geo.normalize(raw)
+            if point == raw:
+                unchanged += 1
+                continue
+            if point is None:
+                dropped += 1
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$unset': {geo.GEO_FIELD: ''}}))
+            else:
+                converted += 1
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {geo.GEO_FIELD: point}}))
+            if len(ops) >= batch_size and not options['dry_run']:
+                db['complaints'].bulk_write(ops, ordered=False)
+                ops = []
+        if options['dry_run']:
+            self.stdout.write(f'Would convert {converted} and drop {dropped} geo values ({unchanged} already points)')
+            return
+        if ops:
+            db['complaints'].bulk_write(ops, ordered=False)
+        # Index builds fail on malformed geo, so only after the rewrite
+        geo.ensure_indexes(db)
+        self.stdout.write(self.style.SUCCESS(
+            f'Converted {converted}, dropped {dropped}, kept {unchanged} geo values in {time.time() - t0:.1f}s'))
@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from db_connection import db
+from complaints import votes
+
+
+class Command(BaseCommand):
+    help = ("Move the legacy complaints.upvoters arrays into complaint_votes (one document per vote) and "
+            "drop the arrays; safe to re-run, existing votes are skipped")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Complaints per write batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be moved')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options['batch_size']))
+        votes.ensure_indexes(db)
+        query = {'upvoters': {'$exists': True}}
+        if options['dry_run']:
+            n_docs = n_votes = 0
+            for doc in db['complaints'].find(query, {'upvoters': 1}):
+                n_docs += 1
+                n_votes += len(doc.get('upvoters') or [])
+            self.stdout.write(f'Would move {n_votes} votes from {n_docs} complaints')
+            return
+
+        t0 = time.time()
+        moved = complaints = 0
+        batch = []
+
+        def flush():
+            nonlocal moved, complaints
+            now = int(time.time() * 1000)
+            rows = [{'complaint_id': doc['_id'], 'user_id': str(uid), 'created_at': now}
+                    for doc in batch for uid in dict.fromkeys(doc.get('upvoters') or []) if uid]
+            moved += votes.insert_votes(db, rows)
+            # Arrays are dropped only once their votes are stored
+            db['complaints'].bulk_write([UpdateOne({'_id': doc['_id']}, {'$unset': {'upvoters': ''}})
+                                         for doc in batch], ordered=False)
+            complaints += len(batch)
+            batch.clear()
+
+        for doc in db['complaints'].find(query, {'upvoters': 1}).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                flush()
+                self.stdout.write(f'  {complaints} complaints processed')
+        if batch:
+            flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} votes from {complaints} complaints into {votes.VOTES} in {time.time() - t0:.1f}s'))
@@ -0,0 +1,67 @@
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from db_connection import db
+from core import timeseries
+from sentiment import ingest
+
+
+class Command(BaseCommand):
+    help = ("Move sentiment_records and user_activities into native MongoDB time-series collections "
+            "(requires MongoDB 7.0+); the originals are kept as <name>_pre_timeseries unless --drop-backup")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collections', type=str, default=','.join(timeseries.SPECS),
+                            help='Comma-separated subset of: ' + ', '.join(timeseries.SPECS))
+        parser.add_argument('--batch-size', type=int, default=5000, help='Documents per insert_many')
+        parser.add_argument('--drop-backup', action='store_true',
+                            help='Drop <name>_pre_timeseries after a verified copy')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be migrated')
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['collections'].split(',') if n.strip()]
+        unknown = [n for n in names if n not in timeseries.SPECS]
+        if unknown:
+            raise CommandError(f"Unknown collection(s): {', '.join(unknown)}")
+        version = timeseries.server_version(db)
+        if version < timeseries.MIN_SERVER_VERSION:
+            raise CommandError(f'MongoDB {".".join(map(str, version))} found; time-series collections with '
+                               f'updates/deletes by _id need {".".join(map(str, timeseries.MIN_SERVER_VERSION))}+')
+
+        migrated = False
+        for name in names:
+            if timeseries.is_timeseries(db, name):
+                self.stdout.write(f'{name} is already a time-series collection')
+                continue
+            count = db[name].estimated_document_count()
+            opts = timeseries.SPECS[name][0]
+            if options['dry_run']:
+                self.stdout.write(f'Would migrate ~{count} {name} documents with {opts}')
+                continue
+
+            t0 = time.time()
+            try:
+                copied = timeseries.migrate(
+                    db, name, batch_size=max(1, int(options['batch_size'])),
+                    progress=lambda n, name=name: self.stdout.write(f'  {name}: {n} copied'),
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            backup = timeseries.backup_name(name)
+            original = db[backup].count_documents({})
+            if copied != original:
+                raise CommandError(f'{name}: copied {copied} of {original} documents; {backup} left in place')
+            self.stdout.write(self.style.SUCCESS(f'Migrated {copied} {name} in {time.time() - t0:.1f}s'))
+            if options['drop_backup']:
+                db[backup].drop()
+                self.stdout.write(f'Dropped {backup}')
+            migrated = True
+
+        if ingest.RECORDS in names and not options['dry_run']:
+            # The unique (partner, partner_message_id) index is gone on the time-series collection;
+            # claims take over deduplication for records ingested before they existed
+            self.stdout.write(f'Claimed {ingest.backfill_claims(db)} earlier ingested records in {ingest.CLAIMS}')
+
+        if migrated:
+            # Secondary indexes (e.g. created_at for window reads) live on the new collections
+            call_command('ensure_indexes', stdout=self.stdout)
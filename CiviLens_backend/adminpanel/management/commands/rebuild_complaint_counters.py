@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from db_connection import db
+from complaints import feed
+
+
+class Command(BaseCommand):
+    help = ("Recompute the complaint feed totals (all complaints and per user) returned by "
+            "GET /api/complaints/?total=1")
+
+    def handle(self, *args, **options):
+        t0 = time.time()
+        n = feed.refresh_counts(db)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt complaint counters from {n} complaints in {time.time() - t0:.1f}s'))
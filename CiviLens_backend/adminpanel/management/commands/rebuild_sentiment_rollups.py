@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from db_connection import db
+from sentiment import labeling, rollups
+
+
+class Command(BaseCommand):
+    help = ("Recompute the sentiment rollups (day x region x category counts and per-day keyword terms) "
+            "from the labels stored on complaints and sentiment_records")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=5000, help='Documents per rollup write batch')
+
+    def handle(self, *args, **options):
+        t0 = time.time()
+        sources = {name: (field, labeling.stored_sentiment) for name, field in labeling.SOURCES.items()}
+        counted = rollups.rebuild(db, sources, chunk=max(1, int(options['chunk'])))
+        summary = ', '.join(f'{n} {name}' for name, n in counted.items())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sentiment rollups from {summary} in {time.time() - t0:.1f}s'))
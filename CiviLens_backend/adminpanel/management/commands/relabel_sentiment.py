@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from django.core.management.base import BaseCommand, CommandError
+from db_connection import db
+from sentiment import labeling, nlp_utils, relabel
+
+
+class Command(BaseCommand):
+    help = ("Relabel stored sentiment on sentiment_records / complaints with the current model: shards each "
+            "collection by _id range across worker processes, checkpoints every batch and resumes unfinished runs")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run-id', type=str, default='', help='Run to start or resume (default: relabel-<today>-<hash of the current model ids>)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        parser.add_argument('--shards', type=int, default=0, help='_id shards per collection (default: 2 x workers)')
+        parser.add_argument('--batch-size', type=int, default=512, help='Documents per model call / bulk_write')
+        parser.add_argument('--collections', type=str, default=','.join(labeling.SOURCES),
+                            help='Comma-separated source collections')
+        parser.add_argument('--restart', action='store_true', help='Discard checkpoints of --run-id and start over')
+        parser.add_argument('--include-current', action='store_true',
+                            help='Also relabel documents already labelled by the current model')
+        parser.add_argument('--report-every', type=int, default=10, help='Seconds between throughput reports')
+
+    def default_run_id(self) -> str:
+        # A model change the same day starts a new run instead of finding today's run complete
+        model_ids = nlp_utils.current_model_ids()
+        if not model_ids:
+            raise CommandError('No sentiment model available; pass --run-id to resume a run anyway')
+        self.stdout.write(f"Current models: {', '.join(model_ids)}")
+        digest = hashlib.blake2b('\n'.join(model_ids).encode('utf-8'), digest_size=4).hexdigest()
+        return time.strftime(f'relabel-%Y%m%d-{digest}', time.gmtime())
+
+    def handle(self, *args, **options):
+        sources = {}
+        for name in [c.strip() for c in options['collections'].split(',') if c.strip()]:
+            if name not in labeling.SOURCES:
+                raise CommandError(f'Unknown collection {name}; expected one of {", ".join(labeling.SOURCES)}')
+            sources[name] = labeling.SOURCES[name]
+        workers = max(1, int(options['workers']))
+        shards = max(1, int(options['shards'] or 2 * workers))
+        batch_size = max(1, int(options['batch_size']))
+        run_id = options['run_id'] or self.default_run_id()
+
+        pending = relabel.plan_run(db, run_id, sources, shards, restart=options['restart'])
+        start = relabel.progress(db, run_id)
+        if not pending:
+            self.stdout.write(self.style.SUCCESS(f'Run {run_id} already complete ({start["labelled"]} labelled)'))
+            return
+        self.stdout.write(f'Run {run_id}: {len(pending)} of {start["shards"]} shards left, {workers} workers, '
+                          f'resuming at {start["scanned"]} scanned')
+
+        t0 = last_t = time.time()
+        last_scanned = start['scanned']
+        failures = []
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=relabel.init_worker) as ex:
+            futures = {
+                ex.submit(relabel.relabel_shard, ck['_id'], sources[ck['source']], batch_size,
+                          not options['include_current']): ck['_id']
+                for ck in pending
+            }
+            remaining = set(futures)
+            while remaining:
+                finished, remaining = wait(remaining, timeout=max(1, int(options['report_every'])),
+                                           return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        failures.append(futures[fut])
+                        self.stdout.write(self.style.ERROR(f'Shard {futures[fut]} failed: {e} (rerun to resume)'))
+                now = time.time()
+                if now - last_t >= int(options['report_every']) or not remaining:
+                    p = relabel.progress(db, run_id)
+                    rate = (p['scanned'] - last_scanned) / max(now - last_t, 1e-6)
+                    self.stdout.write(f"{p['done']}/{p['shards']} shards, {p['scanned']} scanned, "
+                                      f"{p['labelled']} labelled, {rate:.0f} docs/s")
+                    last_t, last_scanned = now, p['scanned']
+
+        p = relabel.progress(db, run_id)
+        elapsed = time.time() - t0
+        overall = (p['scanned'] - start['scanned']) / max(elapsed, 1e-6)
+        if failures:
+            raise CommandError(f'{len(failures)} shard(s) failed; rerun with --run-id {run_id} to resume')
+        self.stdout.write(self.style.SUCCESS(
+            f"Run {run_id} complete: {p['labelled']} labelled, {p['scanned']} scanned in {elapsed:.1f}s "
+            f"({overall:.0f} docs/s)"
+        ))
@@ -0,0 +1,58 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from db_connection import db
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = ("Deliver queued email_outbox messages (e.g. complaint assignment notifications) over one "
+            "persistent SMTP connection, retrying temporary failures with exponential backoff")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per batch')
+        parser.add_argument('--interval', type=int, default=5, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--idle-close', type=int, default=60,
+                            help='Close the SMTP connection after this many idle seconds')
+        parser.add_argument('--max-attempts', type=int, default=outbox.MAX_ATTEMPTS,
+                            help='Attempts before a message is marked failed')
+        parser.add_argument('--once', action='store_true', help='Deliver everything due now and exit')
+
+    def handle(self, *args, **options):
+        sender = outbox.SmtpSender.from_env()
+        if sender is None:
+            raise CommandError('SMTP is not configured: set EMAIL_HOST and EMAIL_FROM / EMAIL_HOST_USER')
+        batch_size = max(1, int(options['batch_size']))
+        interval = max(1, int(options['interval']))
+        max_attempts = max(1, int(options['max_attempts']))
+        verbose = options['verbosity'] >= 2 or os.environ.get('EMAIL_DEBUG', '').lower() in ('1', 'true', 'yes', 'on')
+        outbox.ensure_indexes(db)
+
+        idle_since = time.monotonic()
+        try:
+            while True:
+                try:
+                    docs = outbox.claim(db, batch_size)
+                    if docs:
+                        counts = outbox.deliver(db, sender, docs, max_attempts=max_attempts)
+                        idle_since = time.monotonic()
+                        self.stdout.write(self.style.SUCCESS(
+                            f"Sent {counts[outbox.SENT]}, retrying {counts[outbox.PENDING]}, "
+                            f"failed {counts[outbox.FAILED]} (SMTP connections opened: {sender.connections})"
+                        ))
+                        if verbose:
+                            for doc in db[outbox.OUTBOX].find({'_id': {'$in': [d['_id'] for d in docs]}},
+                                                              {'to': 1, 'status': 1, 'last_error': 1}):
+                                self.stdout.write(f"  {doc['to']}: {doc['status']} {doc.get('last_error') or ''}")
+                        if len(docs) == batch_size:
+                            continue
+                except (AutoReconnect, NetworkTimeout) as e:
+                    self.stdout.write(self.style.WARNING(f'Transient Mongo error, retrying next round: {e}'))
+                if options['once']:
+                    break
+                if time.monotonic() - idle_since > options['idle_close']:
+                    sender.close()
+                time.sleep(interval)
+        finally:
+            sender.close()
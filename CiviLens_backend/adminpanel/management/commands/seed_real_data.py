@@ -1,6 +1,7 @@
 import time
 import random
 from datetime import datetime, timedelta
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from pymongo.errors import AutoReconnect, NetworkTimeout
 from db_connection import db
@@ -231,7 +232,7 @@ class Command(BaseCommand):
                     'region': region,
                     'label': pos[1],
                     'text': pos[0],
-                    'created_at': (when1 + timedelta(days=1)).isoformat(),
+                    'created_at': when1 + timedelta(days=1),  # BSON date (time-series time field)
                 })
                 sid_list = region_to_scheme_ids.get(region) or []
                 sid = random.choice(sid_list) if sid_list else None
@@ -250,12 +251,16 @@ class Command(BaseCommand):
                     'region': region,
                     'label': neg[1],
                     'text': neg[0],
-                    'created_at': (when2 + timedelta(days=1)).isoformat(),
+                    'created_at': when2 + timedelta(days=1),
                 })
 
         _chunked_insert(db['complaints'], complaints, ordered=False)
         _chunked_insert(db['sentiment_records'], sentiments, ordered=False)
 
+        # Imported rows bypass the labelling worker and the feed counters; rebuild both from them
+        call_command('rebuild_sentiment_rollups', stdout=self.stdout)
+        call_command('rebuild_complaint_counters', stdout=self.stdout)
+
         self.stdout.write(self.style.SUCCESS(
             f"Seeded {len(schemes)} schemes, {len(complaints)} complaints, {len(sentiments)} sentiments"
         ))
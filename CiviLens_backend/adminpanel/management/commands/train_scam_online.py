@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from db_connection import db
+from ml import train_online
+
+
+class Command(BaseCommand):
+    help = ("Incrementally train the scam classifier (hashing vectorizer + SGD partial_fit) from new "
+            "training_samples and admin labels, writing a versioned checkpoint after each round")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256, help='Labels per partial_fit mini-batch')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds to sleep between polls')
+        parser.add_argument('--once', action='store_true', help='Consume pending labels once and exit')
+        parser.add_argument('--reset', action='store_true', help='Drop watermarks and relearn all labels from scratch')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options['batch_size']))
+        interval = max(1, int(options['interval']))
+
+        if options['reset']:
+            train_online.reset(db)
+            self.stdout.write(self.style.WARNING('Online model state reset; relearning from all labels'))
+
+        while True:
+            try:
+                res = train_online.run_once(db, batch_size=batch_size)
+                if res['learned']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Learned {res['learned']} labels -> checkpoint {res['version']}"
+                    ))
+            except (AutoReconnect, NetworkTimeout) as e:
+                self.stdout.write(self.style.WARNING(f'Transient Mongo error, retrying next round: {e}'))
+            if options['once']:
+                break
+            time.sleep(interval)
@@ -1,5 +1,6 @@
 import random
 from datetime import datetime, timedelta
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from bson import ObjectId
 from db_connection import db
@@ -69,7 +70,7 @@ class Command(BaseCommand):
             # Add 3 negative sentiments in region (does not affect heatmap)
             neg_sents = []
             for i in range(3):
-                when = (now - timedelta(days=random.randint(0, 6))).isoformat()
+                when = now - timedelta(days=random.randint(0, 6))  # BSON date (time-series time field)
                 neg_sents.append({
                     'region': reg,
                     'label': 'negative',
@@ -124,5 +125,7 @@ class Command(BaseCommand):
 
             ops_summary['success'].append({'scheme_id': str(sid), 'region': reg, 'closed_complaints_added': len(closed_cs)})
 
+        if not dry:
+            call_command('rebuild_complaint_counters', stdout=self.stdout)
         self.stdout.write(self.style.SUCCESS(f"Tuning applied. Risky targets: {len(risky_targets)}, Success targets: {len(success_targets)}"))
         self.stdout.write(str(ops_summary))
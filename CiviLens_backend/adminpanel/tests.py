@@ -1,5 +1,40 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+
+from django.test import TestCase, SimpleTestCase
+
+from adminpanel import exports
+
 
 class BasicTest(TestCase):
     def test_placeholder(self):
         self.assertTrue(True)
+
+
+class StreamRowsTest(SimpleTestCase):
+    fields = ('id', 'title', 'upvotes')
+
+    def rows(self, n):
+        for i in range(n):
+            yield {'id': str(i), 'title': f'Water supply, ward "{i}"\nline two', 'upvotes': i}
+
+    def test_csv_header_first_then_bounded_chunks(self):
+        chunks = list(exports.stream_rows(self.rows(2000), self.fields, 'csv', flush_bytes=4096))
+        self.assertEqual(chunks[0], b'id,title,upvotes\n')
+        self.assertTrue(all(len(c) < 4096 + 200 for c in chunks))
+        parsed = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        self.assertEqual(len(parsed), 2001)
+        self.assertEqual(parsed[5], ['4', 'Water supply, ward "4"\nline two', '4'])
+
+    def test_ndjson_gzip_round_trip(self):
+        chunks = list(exports.stream_rows(self.rows(500), self.fields, 'ndjson', gzipped=True, flush_bytes=2048))
+        lines = gzip.decompress(b''.join(chunks)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['upvotes'] for line in lines], list(range(500)))
+
+    def test_csv_neutralises_formulas(self):
+        rows = [{'id': '1', 'title': '=HYPERLINK("http://x")', 'upvotes': -3}]
+        body = b''.join(exports.stream_rows(rows, self.fields, 'csv')).decode('utf-8')
+        self.assertIn('\'=HYPERLINK', body)
+        self.assertIn(',-3', body)
@@ -8,7 +8,9 @@ from .views import (
     AdminRiskySchemesView,
     AdminSuccessPredictionView,
     AdminComplaintsListView,
+    AdminComplaintsExportView,
     AdminComplaintsHeatmapView,
+    AdminComplaintsClustersView,
 )
 
 urlpatterns = [
@@ -22,5 +24,7 @@ urlpatterns = [
     path('analytics/schemes/success/', AdminSuccessPredictionView.as_view(), name='admin-success-prediction'),
     # Complaints (admin)
     path('complaints/', AdminComplaintsListView.as_view(), name='admin-complaints-list'),
+    path('complaints/export/', AdminComplaintsExportView.as_view(), name='admin-complaints-export'),
     path('complaints/heatmap/', AdminComplaintsHeatmapView.as_view(), name='admin-complaints-heatmap'),
+    path('complaints/clusters/', AdminComplaintsClustersView.as_view(), name='admin-complaints-clusters'),
 ]
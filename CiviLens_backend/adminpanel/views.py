@@ -1,5 +1,5 @@
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from db_connection import db
@@ -7,6 +7,10 @@ from bson import ObjectId
 from collections import defaultdict
 from datetime import datetime, timedelta
 from regions.views import _normalize_region, STATES
+from sentiment.rollups import daily_counts
+from sentiment.windows import daily_label_counts
+from complaints import geo as complaint_geo
+from . import exports
 try:
     # Optional ML inference utilities. If unavailable, views fall back to heuristics.
     from ml.infer_schemes import predict_risk_for_schemes, predict_success_for_schemes
@@ -59,6 +63,106 @@ class AdminUsersView(View):
         return JsonResponse({'success': True, 'data': results})
 
 
+EXPORT_FIELDS = ('id', 'title', 'category', 'scheme', 'region', 'status', 'created_at', 'assignee', 'upvotes',
+                 'description')
+# Documents read from the database per getMore during an export
+EXPORT_BATCH = 2000
+EXPORT_PROJECTION = {'title': 1, 'topic': 1, 'category': 1, 'scheme': 1, 'scheme_name': 1, 'region': 1, 'state': 1,
+                     'location': 1, 'status': 1, 'created_at': 1, 'assignee': 1, 'upvotes': 1, 'description': 1}
+
+
+def _admin_complaints_query(request):
+    """Filters shared by the admin complaints list and export: (query, has_filters).
+    Query params: start_date (YYYY-MM-DD), end_date (YYYY-MM-DD), region, scheme, status (open|closed)
+    """
+    q = {}
+    # status
+    status = (request.GET.get('status') or '').lower().strip()
+    if status in ('open','closed'):
+        q['status'] = status
+    # date range on created_at (stored as epoch ms or iso)
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    if start_date or end_date:
+        num_cond = {}
+        iso_cond = {}
+        try:
+            if start_date:
+                dt = datetime.fromisoformat(start_date)
+                num_cond['$gte'] = int(dt.timestamp()*1000)
+                iso_cond['$gte'] = dt.isoformat()
+            if end_date:
+                dt2 = datetime.fromisoformat(end_date) + timedelta(days=1)
+                num_cond['$lt'] = int(dt2.timestamp()*1000)
+                iso_cond['$lt'] = dt2.isoformat()
+        except Exception:
+            pass
+        ors = []
+        if num_cond:
+            ors.append({'created_at': num_cond})
+            ors.append({'updated_at': num_cond})
+        if iso_cond:
+            ors.append({'date': iso_cond})
+            ors.append({'created_at': iso_cond})
+            ors.append({'updated_at': iso_cond})
+        if ors:
+            q['$and'] = (q.get('$and') or []) + [{ '$or': ors }]
+    # region/state text
+    region = request.GET.get('region')
+    if region:
+        try:
+            import re
+            q['$or'] = [
+                {'region': {'$regex': re.escape(region), '$options': 'i'}},
+                {'state': {'$regex': re.escape(region), '$options': 'i'}},
+                {'location': {'$regex': re.escape(region), '$options': 'i'}},
+            ]
+        except Exception:
+            q['region'] = region
+    # scheme text id/name (best-effort)
+    scheme = request.GET.get('scheme')
+    if scheme:
+        try:
+            import re
+            q.setdefault('$or', [])
+            q['$or'] += [
+                {'scheme': {'$regex': re.escape(scheme), '$options': 'i'}},
+                {'scheme_name': {'$regex': re.escape(scheme), '$options': 'i'}},
+                {'title': {'$regex': re.escape(scheme), '$options': 'i'}},
+            ]
+        except Exception:
+            q['scheme'] = scheme
+    # detect if filters are provided
+    has_filters = any([
+        bool(status in ('open','closed')),
+        bool(start_date),
+        bool(end_date),
+        bool(region),
+        bool(scheme),
+    ])
+    return q, has_filters
+
+
+def _admin_complaint_row(d):
+    created = d.get('created_at')
+    try:
+        if isinstance(created, (int, float)):
+            created_fmt = datetime.utcfromtimestamp(created/1000).isoformat()
+        else:
+            created_fmt = str(created)
+    except Exception:
+        created_fmt = ''
+    return {
+        'id': str(d.get('_id')),
+        'title': d.get('title') or d.get('topic') or 'Complaint',
+        'scheme': d.get('scheme') or d.get('scheme_name'),
+        'region': d.get('region') or d.get('state') or d.get('location'),
+        'status': (d.get('status') or 'open').lower(),
+        'created_at': created_fmt,
+        'assignee': d.get('assignee', ''),
+    }
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AdminComplaintsListView(View):
     """Admin list complaints with filters.
@@ -68,72 +172,8 @@ class AdminComplaintsListView(View):
         if not _authorize_admin(request):
             return JsonResponse({'success': False, 'error': {'message': 'Admin required'}}, status=403)
         complaints = db['complaints']
-        q = {}
-        # status
-        status = (request.GET.get('status') or '').lower().strip()
-        if status in ('open','closed'):
-            q['status'] = status
-        # date range on created_at (stored as epoch ms or iso)
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        if start_date or end_date:
-            num_cond = {}
-            iso_cond = {}
-            try:
-                if start_date:
-                    dt = datetime.fromisoformat(start_date)
-                    num_cond['$gte'] = int(dt.timestamp()*1000)
-                    iso_cond['$gte'] = dt.isoformat()
-                if end_date:
-                    dt2 = datetime.fromisoformat(end_date) + timedelta(days=1)
-                    num_cond['$lt'] = int(dt2.timestamp()*1000)
-                    iso_cond['$lt'] = dt2.isoformat()
-            except Exception:
-                pass
-            ors = []
-            if num_cond:
-                ors.append({'created_at': num_cond})
-                ors.append({'updated_at': num_cond})
-            if iso_cond:
-                ors.append({'date': iso_cond})
-                ors.append({'created_at': iso_cond})
-                ors.append({'updated_at': iso_cond})
-            if ors:
-                q['$and'] = (q.get('$and') or []) + [{ '$or': ors }]
-        # region/state text
-        region = request.GET.get('region')
-        if region:
-            try:
-                import re
-                q['$or'] = [
-                    {'region': {'$regex': re.escape(region), '$options': 'i'}},
-                    {'state': {'$regex': re.escape(region), '$options': 'i'}},
-                    {'location': {'$regex': re.escape(region), '$options': 'i'}},
-                ]
-            except Exception:
-                q['region'] = region
-        # scheme text id/name (best-effort)
-        scheme = request.GET.get('scheme')
-        if scheme:
-            try:
-                import re
-                q.setdefault('$or', [])
-                q['$or'] += [
-                    {'scheme': {'$regex': re.escape(scheme), '$options': 'i'}},
-                    {'scheme_name': {'$regex': re.escape(scheme), '$options': 'i'}},
-                    {'title': {'$regex': re.escape(scheme), '$options': 'i'}},
-                ]
-            except Exception:
-                q['scheme'] = scheme
+        q, has_filters = _admin_complaints_query(request)
         # fetch with optional limit and default cap when no filters
-        # detect if filters are provided
-        has_filters = any([
-            bool(status in ('open','closed')),
-            bool(start_date),
-            bool(end_date),
-            bool(region),
-            bool(scheme),
-        ])
         # parse limit
         limit_param = request.GET.get('limit')
         try:
@@ -173,28 +213,49 @@ class AdminComplaintsListView(View):
             docs = list(cursor)
         except Exception:
             docs = []
-        out = []
-        for d in docs:
-            created = d.get('created_at')
-            try:
-                if isinstance(created, (int, float)):
-                    created_fmt = datetime.utcfromtimestamp(created/1000).isoformat()
-                else:
-                    created_fmt = str(created)
-            except Exception:
-                created_fmt = ''
-            out.append({
-                'id': str(d.get('_id')),
-                'title': d.get('title') or d.get('topic') or 'Complaint',
-                'scheme': d.get('scheme') or d.get('scheme_name'),
-                'region': d.get('region') or d.get('state') or d.get('location'),
-                'status': (d.get('status') or 'open').lower(),
-                'created_at': created_fmt,
-                'assignee': d.get('assignee', ''),
-            })
+        out = [_admin_complaint_row(d) for d in docs]
         return JsonResponse({'success': True, 'data': out})
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AdminComplaintsExportView(View):
+    """Stream every complaint matching the admin list filters as CSV or NDJSON.
+    Query params: the AdminComplaintsListView filters, format (csv|ndjson, default csv), gzip=1.
+    Rows come from one server cursor in _id (insertion) order, EXPORT_BATCH documents per
+    round trip, and are written as they arrive, so memory does not grow with the export.
+    """
+    def get(self, request):
+        if not _authorize_admin(request):
+            return JsonResponse({'success': False, 'error': {'message': 'Admin required'}}, status=403)
+        fmt = (request.GET.get('format') or 'csv').lower().strip()
+        if fmt not in exports.FORMATS:
+            msg = f"format must be one of: {', '.join(exports.FORMATS)}"
+            return JsonResponse({'success': False, 'error': {'message': msg}}, status=400)
+        gzipped = (request.GET.get('gzip') or '').lower().strip() in ('1', 'true', 'yes')
+        q, _ = _admin_complaints_query(request)
+        cursor = db['complaints'].find(q, EXPORT_PROJECTION).sort('_id', 1).batch_size(EXPORT_BATCH)
+
+        def rows():
+            try:
+                for d in cursor:
+                    row = _admin_complaint_row(d)
+                    row['category'] = d.get('category') or d.get('topic') or 'general'
+                    row['upvotes'] = d.get('upvotes', 0)
+                    row['description'] = d.get('description', '')
+                    yield row
+            finally:
+                cursor.close()
+
+        content_type, ext = exports.FORMATS[fmt]
+        filename = f"complaints-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{ext}"
+        if gzipped:
+            content_type, filename = exports.GZIP_CONTENT_TYPE, filename + '.gz'
+        response = StreamingHttpResponse(exports.stream_rows(rows(), EXPORT_FIELDS, fmt, gzipped),
+                                         content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AdminComplaintsHeatmapView(View):
     """Admin heatmap with same filters as list; counts active by region."""
@@ -278,6 +339,36 @@ class AdminComplaintsHeatmapView(View):
         out.sort(key=lambda x: x['complaint_count'], reverse=True)
         return JsonResponse({'success': True, 'data': out})
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AdminComplaintsClustersView(View):
+    """Complaint map buckets: points grouped into a grid sized by zoom, counted in the database.
+    Query params: the AdminComplaintsListView filters, bbox=minLng,minLat,maxLng,maxLat (default: world),
+    zoom (0-20, default 4).
+    Output: [ { lat, lng, count, open_count, bounds, id (single-complaint buckets) } ]
+    """
+    def get(self, request):
+        if not _authorize_admin(request):
+            return JsonResponse({'success': False, 'error': {'message': 'Admin required'}}, status=403)
+        try:
+            box = complaint_geo.parse_bbox(request.GET.get('bbox') or '-180,-90,180,90')
+        except complaint_geo.GeoError as e:
+            return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
+        try:
+            zoom = int(request.GET.get('zoom') or 4)
+        except ValueError:
+            zoom = 4
+        size = complaint_geo.cell_size(zoom, box)
+        q, _ = _admin_complaints_query(request)
+        match = complaint_geo.within_box(box)
+        if q:
+            match = {'$and': [q, match]}
+        buckets = db['complaints'].aggregate(complaint_geo.cluster_pipeline(match, size))
+        out = [complaint_geo.cluster_row(b, size) for b in buckets]
+        out.sort(key=lambda x: x['count'], reverse=True)
+        return JsonResponse({'success': True, 'data': out, 'cell_deg': size,
+                             'total': sum(r['count'] for r in out)})
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AdminUserDetailView(View):
     def _authorize(self, request):
@@ -358,30 +449,21 @@ class AdminSentimentTrendsView(View):
     def get(self, request):
         if not _authorize_admin(request):
             return JsonResponse({'success': False, 'error': {'message': 'Admin required'}}, status=403)
-        col = db['sentiment_records']
         now = datetime.utcnow()
         start = now - timedelta(days=7)
+        # Served from the sentiment_daily rollup (same counts as the public overview)
         try:
-            rows = list(col.find({'created_at': { '$gte': start.isoformat() }}, {'label': 1, 'created_at': 1}))
+            daily = daily_counts(db, 'date', start.date().isoformat(), now.date().isoformat())
         except Exception:
-            rows = []
-        # bucket by date (UTC)
-        daily = defaultdict(lambda: {'positive': 0, 'neutral': 0, 'negative': 0})
-        for r in rows:
-            ts = r.get('created_at')
+            daily = {}
+        if not any(sum(v.values()) for v in daily.values()):
+            # Rollups not built yet: group the time-series sentiment_records window in Mongo
             try:
-                # created_at may be iso string or epoch ms
-                if isinstance(ts, (int, float)):
-                    d = datetime.utcfromtimestamp(ts/1000).date().isoformat()
-                else:
-                    d = datetime.fromisoformat(str(ts)).date().isoformat()
+                daily = daily_label_counts(db['sentiment_records'], datetime(start.year, start.month, start.day))
             except Exception:
-                d = now.date().isoformat()
-            lab = (r.get('label') or '').lower()
-            if lab in ['positive','neutral','negative']:
-                daily[d][lab] += 1
+                daily = {}
         # order by date ascending and compute net score = (pos - neg) / total
-        days_sorted = sorted(daily.keys())
+        days_sorted = sorted(d for d in daily.keys() if sum(daily[d].values()))
         series = []
         for d in days_sorted:
             pos = daily[d]['positive']; neg = daily[d]['negative']; neu = daily[d]['neutral']
@@ -0,0 +1,58 @@
+import csv
+import os
+from typing import Any, Dict, List, Optional
+
+
+class MemCollection:
+    """Just enough of a pymongo collection for the read paths under benchmark: find() over
+    every document (the benchmarked code never filters) with an optional projection, plus
+    limit(). A non-empty filter is rejected rather than silently ignored."""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        if filter:
+            raise ValueError(f'MemCollection.find accepts only an empty filter, got {filter!r}')
+        if not projection:
+            return _Cursor(list(self.docs))
+        keys = [k for k, v in projection.items() if v]
+        return _Cursor([{k: d[k] for k in keys + ['_id'] if k in d} for d in self.docs])
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+
+class _Cursor(list):
+    def limit(self, n):
+        return _Cursor(self[:n]) if n else self
+
+
+class MemDB(dict):
+    def __getitem__(self, name):
+        if name not in self:
+            self[name] = MemCollection([])
+        return dict.__getitem__(self, name)
+
+
+def _read_csv(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def load_generated(data_dir: str) -> MemDB:
+    """Shape generate_csv_data output like the load_csv_data command stores it in Mongo."""
+    mem = MemDB()
+    schemes = _read_csv(os.path.join(data_dir, 'schemes.csv'))
+    mem['schemes'] = MemCollection([{
+        '_id': r['scheme_id'],
+        'name': r['name'],
+        'region': r['region'],
+        'status': r['status'],
+        'created_at': r['created_at'],
+        'updated_at': r['updated_at'] or r['created_at'],
+    } for r in schemes])
+    complaints = _read_csv(os.path.join(data_dir, 'complaints.csv'))
+    mem['complaints'] = MemCollection([{**r, 'closed_at': r.get('closed_at') or None} for r in complaints])
+    mem['sentiment_records'] = MemCollection(_read_csv(os.path.join(data_dir, 'sentiments.csv')))
+    return mem
@@ -0,0 +1,252 @@
+"""ML inference benchmarks with latency/throughput budgets.
+
+Generates synthetic data with ml/generate_csv_data.py at each size, times the
+production inference entry points and writes a JSON report. Exits non-zero when
+any result breaks its budget in benchmarks/ml/budgets.json, when a case raises, or when
+a case that has a budget cannot run (e.g. its model no longer loads).
+
+Run from CiviLens_backend/:
+    python -m benchmarks.ml.run --sizes 200,1000 --report bench_ml.json
+
+Scheme-level benchmarks read from an in-memory copy of the generated data by
+default; pass --mongo-uri to load it into a scratch database on a real mongod.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from ml import generate_csv_data  # noqa: E402
+from benchmarks.ml.memdb import load_generated, _read_csv  # noqa: E402
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'budgets.json')
+DEFAULT_SIZES = [200, 1000]
+REPEATS = 5
+MAX_SINGLE_CALLS = 500
+
+
+def summarize(times: List[float], rows_per_call: int) -> Dict[str, Any]:
+    ms = np.array(times) * 1000.0
+    total = float(np.sum(times))
+    return {
+        'calls': len(times),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'rows_per_sec': round(rows_per_call * len(times) / total, 1) if total > 0 else None,
+    }
+
+
+def time_calls(fn: Callable[[], Any], repeats: int = REPEATS, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+# -------------------- benchmark cases --------------------
+# Each case takes the per-size context and returns a result dict (or None when
+# the model/dependency behind it is unavailable in this environment).
+
+def bench_predict_single(ctx):
+    from ml.predict import predict_verification, available
+    if not available():
+        return None
+    samples = ctx['samples'][:MAX_SINGLE_CALLS]
+    predict_verification(samples[0])
+    times = []
+    for s in samples:
+        t0 = time.perf_counter()
+        predict_verification(s)
+        times.append(time.perf_counter() - t0)
+    return {'rows': len(samples), **summarize(times, 1)}
+
+
+def bench_predict_batch(ctx):
+    from ml.predict import predict_verification_batch, available
+    if not available():
+        return None
+    samples = ctx['samples']
+    return {'rows': len(samples), **summarize(time_calls(lambda: predict_verification_batch(samples)), len(samples))}
+
+
+def bench_analyze_sentiments(ctx):
+    from sentiment.nlp_utils import analyze_sentiments
+    texts = ctx['texts']
+    if analyze_sentiments(texts[:2]) is None:
+        return None
+    return {'rows': len(texts), **summarize(time_calls(lambda: analyze_sentiments(texts), repeats=3), len(texts))}
+
+
+def bench_top_tfidf_keywords(ctx):
+    from sentiment.nlp_utils import top_tfidf_keywords
+    texts = ctx['texts']
+    return {'rows': len(texts), **summarize(time_calls(lambda: top_tfidf_keywords(texts, top_k=12)), len(texts))}
+
+
+def bench_build_features(ctx):
+    from ml import infer_schemes
+    n = ctx['n_schemes']
+    return {'rows': n, **summarize(time_calls(infer_schemes._build_features_per_scheme), n)}
+
+
+def bench_predict_risk(ctx):
+    from ml import infer_schemes
+    infer_schemes._load_models()
+    if infer_schemes._risk_model is None:
+        return None
+    n = ctx['n_schemes']
+    return {'rows': n, **summarize(time_calls(infer_schemes.predict_risk_for_schemes), n)}
+
+
+CASES = {
+    'predict_verification_single': bench_predict_single,
+    'predict_verification_batch': bench_predict_batch,
+    'analyze_sentiments': bench_analyze_sentiments,
+    'top_tfidf_keywords': bench_top_tfidf_keywords,
+    'build_features_per_scheme': bench_build_features,
+    'predict_risk_for_schemes': bench_predict_risk,
+}
+
+
+# -------------------- data + harness --------------------
+def build_context(size: int, work_dir: str, mongo_uri: str | None) -> Dict[str, Any]:
+    data_dir = os.path.join(work_dir, f"n{size}")
+    random.seed(size)
+    generate_csv_data.generate(size, 'csv', data_dir)
+
+    from ml import infer_schemes
+    mem = load_generated(data_dir)
+    if mongo_uri:
+        from pymongo import MongoClient
+        bench_db = MongoClient(mongo_uri)['civlens_bench']
+        for name in ('schemes', 'complaints', 'sentiment_records'):
+            bench_db[name].drop()
+            docs = mem[name].docs
+            for i in range(0, len(docs), 5000):
+                bench_db[name].insert_many([dict(d) for d in docs[i:i + 5000]], ordered=False)
+        infer_schemes.db = bench_db
+    else:
+        infer_schemes.db = mem
+
+    schemes = _read_csv(os.path.join(data_dir, 'schemes.csv'))
+    complaints = _read_csv(os.path.join(data_dir, 'complaints.csv'))
+    sentiments = _read_csv(os.path.join(data_dir, 'sentiments.csv'))
+    # Vary the synthetic templates with scheme/region tokens so vectorizers see a realistic vocabulary
+    texts = []
+    for i in range(size):
+        c = complaints[i % len(complaints)]
+        s = sentiments[i % len(sentiments)]
+        texts.append(f"{c['description']} {s['text']} in {c['region']} ({c['severity']}, {c['status']})")
+    samples = [{
+        'title': sc['name'],
+        'description': texts[i % len(texts)],
+        'source_url': 'https://www.mygov.in/' if i % 3 else 'http://benefits-fast.online/',
+    } for i, sc in enumerate(schemes)]
+    return {'n_schemes': len(schemes), 'texts': texts, 'samples': samples}
+
+
+def load_budgets(path: str) -> Dict[str, Dict[str, float]]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def budget_for(bench: str, size: int, budgets: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    return {**budgets.get(bench, {}), **budgets.get(f'{bench}@{size}', {})}
+
+
+def check_budget(result: Dict[str, Any], budgets: Dict[str, Dict[str, float]]) -> List[str]:
+    """Budgets are keyed by '<bench>' or '<bench>@<size>' (size-specific wins).
+    Supported limits: p50_ms / p95_ms / p99_ms (max) and min_rows_per_sec."""
+    limits = budget_for(result['bench'], result['size'], budgets)
+    problems = []
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        if key in limits and result.get(key) is not None and result[key] > limits[key]:
+            problems.append(f"{result['bench']}@{result['size']}: {key}={result[key]} > budget {limits[key]}")
+    if 'min_rows_per_sec' in limits and result.get('rows_per_sec') is not None \
+            and result['rows_per_sec'] < limits['min_rows_per_sec']:
+        problems.append(f"{result['bench']}@{result['size']}: rows_per_sec={result['rows_per_sec']} "
+                        f"< budget {limits['min_rows_per_sec']}")
+    return problems
+
+
+def run(sizes: List[int], only: List[str] | None = None, mongo_uri: str | None = None,
+        budgets_path: str = BUDGETS_PATH) -> Dict[str, Any]:
+    budgets = load_budgets(budgets_path)
+    results, violations = [], []
+    with tempfile.TemporaryDirectory(prefix='civlens_bench_') as work_dir:
+        for size in sizes:
+            ctx = build_context(size, work_dir, mongo_uri)
+            for name, case in CASES.items():
+                if only and name not in only:
+                    continue
+                try:
+                    res = case(ctx)
+                except Exception as e:
+                    res = {'status': 'error', 'error': str(e)}
+                row = {'bench': name, 'size': size, **(res or {'status': 'unavailable'})}
+                row.setdefault('status', 'ok')
+                if row['status'] == 'ok':
+                    problems = check_budget(row, budgets)
+                    if problems:
+                        row['status'] = 'over_budget'
+                        violations.extend(problems)
+                elif row['status'] == 'error':
+                    violations.append(f"{name}@{size}: error: {row.get('error')}")
+                elif budget_for(name, size, budgets):
+                    violations.append(f"{name}@{size}: {row['status']} but has a budget")
+                results.append(row)
+                print(json.dumps(row), flush=True)
+    return {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sizes': sizes,
+        'results': results,
+        'violations': violations,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='ML inference latency/throughput benchmarks')
+    ap.add_argument('--sizes', type=str, default=','.join(str(s) for s in DEFAULT_SIZES),
+                    help='Comma-separated scheme counts (also the number of texts/samples)')
+    ap.add_argument('--only', type=str, default='', help='Comma-separated benchmark names to run')
+    ap.add_argument('--report', type=str, default='bench_ml.json', help='Where to write the JSON report')
+    ap.add_argument('--budgets', type=str, default=BUDGETS_PATH, help='Budget file; pass "" to disable')
+    ap.add_argument('--mongo-uri', type=str, default=None, help='Load data into civlens_bench on this mongod')
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(',') if x.strip()]
+    only = [x.strip() for x in args.only.split(',') if x.strip()] or None
+    report = run(sizes, only, args.mongo_uri, args.budgets)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.report}")
+    if report['violations']:
+        print('Benchmark regressions:\n  ' + '\n  '.join(report['violations']))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
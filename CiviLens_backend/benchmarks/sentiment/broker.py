@@ -0,0 +1,143 @@
+"""Per-call inference vs the micro-batching broker under concurrent callers.
+
+Each of `--callers` threads sends `--requests` small requests of 1..`--max-texts`
+distinct texts, like request threads labelling a few complaints each. In
+`per_call` every thread calls nlp_utils.analyze_sentiments itself. In `broker`
+the threads submit to sentiment.broker, which merges them into shared forward
+passes. Reports throughput, latency percentiles, forward passes and label
+agreement. Agreement can be slightly below 1 because padding differs between
+batch shapes; random-init similarities are near ties. The persistent cache is
+disabled.
+
+Run from CiviLens_backend/:
+    python -m benchmarks.sentiment.broker --random-init --callers 50
+    python -m benchmarks.sentiment.broker --callers 50 --max-wait-ms 2 --max-batch 128
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ['SENTIMENT_CACHE_DIR'] = 'off'
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+
+from benchmarks.sentiment.prototype_head import sample_texts  # noqa: E402
+
+
+def caller_requests(callers, requests, max_texts):
+    """Distinct texts per request so deduplication does not hide forward passes."""
+    base = sample_texts(5)
+    out = []
+    for c in range(callers):
+        reqs = []
+        for r in range(requests):
+            k = 1 + (c + r) % max_texts
+            reqs.append([f'{base[(c + r + j) % len(base)]} (caller {c}, request {r}, item {j})' for j in range(k)])
+        out.append(reqs)
+    return out
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run(per_caller, label_fn):
+    """Start all callers together; returns (labels per caller, latencies in ms, wall seconds)."""
+    labels = [None] * len(per_caller)
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(len(per_caller) + 1)
+
+    def caller(i):
+        start.wait()
+        mine, lat = [], []
+        for texts in per_caller[i]:
+            t0 = time.perf_counter()
+            mine.append(label_fn(texts))
+            lat.append((time.perf_counter() - t0) * 1000)
+        labels[i] = mine
+        with lock:
+            latencies.extend(lat)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(len(per_caller))]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return labels, latencies, time.perf_counter() - t0
+
+
+def agreement(a, b):
+    flat_a = [lab for reqs in a for labels in reqs for lab in labels]
+    flat_b = [lab for reqs in b for labels in reqs for lab in labels]
+    return round(sum(x == y for x, y in zip(flat_a, flat_b)) / len(flat_a), 4)
+
+
+def summarize(latencies, seconds, n_texts, n_requests):
+    return {'seconds': round(seconds, 3),
+            'texts_per_sec': round(n_texts / seconds, 1),
+            'requests_per_sec': round(n_requests / seconds, 1),
+            'latency_ms_p50': round(percentile(latencies, 50), 1),
+            'latency_ms_p95': round(percentile(latencies, 95), 1),
+            'latency_ms_p99': round(percentile(latencies, 99), 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--callers', type=int, default=50)
+    ap.add_argument('--requests', type=int, default=10, help='Requests per caller')
+    ap.add_argument('--max-texts', type=int, default=4, help='Texts per request cycle through 1..N')
+    ap.add_argument('--max-batch', type=int, default=256)
+    ap.add_argument('--max-wait-ms', type=float, default=5.0)
+    ap.add_argument('--random-init', action='store_true',
+                    help='Use a random-weight MiniLM-sized encoder (no model download needed)')
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='civlens_broker_') as work_dir:
+        if args.random_init:
+            from benchmarks.sentiment.onnx_backend import save_random_model
+            src = os.path.join(work_dir, 'encoder-src')
+            save_random_model('encoder', src)
+
+        from sentiment import nlp_utils
+        from sentiment.broker import InferenceBroker
+        if args.random_init:
+            nlp_utils.ST_MODEL_NAME = src
+            nlp_utils.ST_MODEL_ID = f'{src}+prototypes-v1'
+        if nlp_utils.analyze_sentiments(sample_texts(8)) is None:  # also warms up the model
+            print(json.dumps({'status': 'unavailable', 'reason': 'no sentiment model could be loaded; '
+                                                                   'try --random-init'}))
+            return
+
+        per_caller = caller_requests(args.callers, args.requests, args.max_texts)
+        n_requests = args.callers * args.requests
+        n_texts = sum(len(t) for reqs in per_caller for t in reqs)
+        report = {'callers': args.callers, 'requests': n_requests, 'texts': n_texts, 'cpu_count': os.cpu_count(),
+                  'random_init': args.random_init}
+
+        direct, lat, secs = run(per_caller, nlp_utils.analyze_sentiments)
+        report['per_call'] = {'forward_passes': n_requests, **summarize(lat, secs, n_texts, n_requests)}
+
+        broker = InferenceBroker(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        batched, lat, secs = run(per_caller, lambda texts: broker.submit(texts).result()[0])
+        broker.close()
+        report['broker'] = {'max_batch': args.max_batch, 'max_wait_ms': args.max_wait_ms,
+                            'forward_passes': broker.batches, **summarize(lat, secs, n_texts, n_requests),
+                            'label_agreement': agreement(batched, direct)}
+        report['broker']['throughput_speedup'] = round(
+            report['broker']['texts_per_sec'] / report['per_call']['texts_per_sec'], 2)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
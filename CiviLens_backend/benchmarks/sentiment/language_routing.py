@@ -0,0 +1,120 @@
+"""One multilingual model for every text vs script/language-routed models.
+
+`unrouted` labels every text with the multilingual classifier (XLM-R), as
+before routing existed. `routed` sends English texts to the English DistilBERT
+and only Indic-script / Hinglish texts to XLM-R, with each route batched
+separately. The prototype encoder is disabled, so English texts really take the
+DistilBERT path. The persistent cache is also off, so every mode pays for its
+forward passes.
+
+Run from CiviLens_backend/:
+    # offline: random weights sized like DistilBERT-base / a 12-layer XLM-R stand-in
+    python -m benchmarks.sentiment.language_routing --random-init --texts 2000
+    # real models (HF download)
+    python -m benchmarks.sentiment.language_routing --texts 2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ['SENTIMENT_CACHE_DIR'] = 'off'
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+
+ENGLISH = [
+    'The pension was credited on time, thank you',
+    'Portal keeps crashing and nobody answers the helpline',
+    'Application status updated to under review',
+    'Ration card not received after three months of waiting',
+]
+HINDI = [
+    'राशन कार्ड तीन महीने से नहीं मिला',
+    'पेंशन समय पर आ गई, धन्यवाद',
+    'सड़क की मरम्मत जल्दी हो गई',
+]
+HINGLISH = [
+    'Pension abhi tak nahi mila, bahut pareshani hai',
+    'Bijli kal se nahi hai, koi sunta nahi',
+]
+
+
+def mixed_texts(n, hindi_share, hinglish_share):
+    """n distinct texts; every 1/share-th slot is Hindi / Hinglish, the rest English."""
+    out = []
+    acc_hi = acc_hg = 0.0
+    for i in range(n):
+        acc_hi += hindi_share
+        acc_hg += hinglish_share
+        if acc_hi >= 1:
+            acc_hi -= 1
+            base = HINDI[i % len(HINDI)]
+        elif acc_hg >= 1:
+            acc_hg -= 1
+            base = HINGLISH[i % len(HINGLISH)]
+        else:
+            base = ENGLISH[i % len(ENGLISH)]
+        out.append(f'{base} #{i}')
+    return out
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--texts', type=int, default=2000)
+    ap.add_argument('--hindi-share', type=float, default=0.10)
+    ap.add_argument('--hinglish-share', type=float, default=0.05)
+    ap.add_argument('--random-init', action='store_true',
+                    help='Use random-weight DistilBERT / 12-layer stand-ins (no model download needed)')
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='civlens_routing_') as work_dir:
+        if args.random_init:
+            from benchmarks.sentiment.onnx_backend import save_random_model
+            en_src, ml_src = os.path.join(work_dir, 'english'), os.path.join(work_dir, 'multilingual')
+            save_random_model('classifier_en', en_src)
+            save_random_model('classifier', ml_src)
+
+        from sentiment import language, nlp_utils
+        if args.random_init:
+            nlp_utils.ENGLISH_MODEL_NAME = en_src
+            nlp_utils.MULTILINGUAL_MODEL_NAME = ml_src
+        nlp_utils.SentenceTransformer = None  # benchmark the classifier routes only
+        if nlp_utils.get_sentiment_pipeline() is None or nlp_utils.get_english_pipeline() is None:
+            print(json.dumps({'status': 'unavailable', 'reason': 'sentiment classifiers could not be loaded; '
+                                                                   'try --random-init'}))
+            return
+
+        texts = mixed_texts(args.texts, args.hindi_share, args.hinglish_share)
+        routes, t_detect = timed(lambda: language.split_by_route(texts))
+        report = {'texts': args.texts, 'random_init': args.random_init, 'cpu_count': os.cpu_count(),
+                  'routes': {r: len(idx) for r, idx in routes.items()},
+                  'detector_us_per_text': round(t_detect / len(texts) * 1e6, 2)}
+
+        os.environ['SENTIMENT_ROUTING'] = 'false'
+        nlp_utils.analyze_sentiments(texts[:16])  # warm up
+        (_, unrouted_ids), t_unrouted = timed(lambda: nlp_utils.analyze_sentiments_with_models(texts))
+        os.environ['SENTIMENT_ROUTING'] = 'true'
+        nlp_utils.analyze_sentiments(texts[:16])
+        (_, routed_ids), t_routed = timed(lambda: nlp_utils.analyze_sentiments_with_models(texts))
+
+        report['unrouted'] = {'models': sorted(set(unrouted_ids)), 'seconds': round(t_unrouted, 3),
+                              'texts_per_sec': round(len(texts) / t_unrouted, 1)}
+        report['routed'] = {'models': sorted(set(routed_ids)), 'seconds': round(t_routed, 3),
+                            'texts_per_sec': round(len(texts) / t_routed, 1),
+                            'speedup': round(t_unrouted / t_routed, 2)}
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
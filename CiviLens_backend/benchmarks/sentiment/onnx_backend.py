@@ -0,0 +1,197 @@
+"""PyTorch vs ONNX Runtime (fp32 / dynamic int8) for the sentiment models.
+
+Each backend runs in its own subprocess so peak RSS is attributable to it. Reports
+texts/second, RSS after load, peak RSS and label agreement with PyTorch.
+
+Run from CiviLens_backend/:
+    # real models (needs the HF download + manage.py export_sentiment_onnx --out DIR)
+    python -m benchmarks.sentiment.onnx_backend --onnx-dir models/onnx --texts 2000
+    # offline: random weights with the production architectures (MiniLM-L6 / BERT-base
+    # as a stand-in for xlm-roberta-base) -- speed and memory only, labels are meaningless
+    python -m benchmarks.sentiment.onnx_backend --random-init --texts 2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.sentiment.prototype_head import sample_texts  # noqa: E402
+
+BACKENDS = ('torch', 'onnx-fp32', 'onnx-int8')
+# Random-init stand-ins sized like the production models
+ARCHS = {
+    'encoder': dict(hidden_size=384, num_hidden_layers=6, num_attention_heads=12, intermediate_size=1536),
+    'classifier': dict(hidden_size=768, num_hidden_layers=12, num_attention_heads=12, intermediate_size=3072),
+    # DistilBERT-base (English route of sentiment.language); used by benchmarks.sentiment.language_routing
+    'classifier_en': dict(hidden_size=768, num_hidden_layers=6, num_attention_heads=12, intermediate_size=3072),
+}
+
+
+def rss_mb():
+    """Current RSS from /proc (Linux); falls back to peak RSS elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except Exception:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """VmHWM of this process; ru_maxrss would include the parent's peak (it survives fork+exec)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except Exception:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def save_random_model(kind, src):
+    """Save a random-weight HF model of the production size plus a word-level vocab to `src`."""
+    from transformers import BertConfig, BertModel, BertForSequenceClassification, BertTokenizer
+
+    words = sorted({w.strip(',.#').lower() for t in sample_texts(500) for w in t.split()})
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + words
+    vocab += [f'tok{i}' for i in range(30522 - len(vocab))]
+    os.makedirs(src, exist_ok=True)
+    with open(os.path.join(src, 'vocab.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(vocab))
+    tokenizer = BertTokenizer(os.path.join(src, 'vocab.txt'))
+    config = BertConfig(vocab_size=len(vocab), num_labels=3, **ARCHS[kind],
+                        id2label={0: 'negative', 1: 'neutral', 2: 'positive'},
+                        label2id={'negative': 0, 'neutral': 1, 'positive': 2})
+    model = (BertModel if kind == 'encoder' else BertForSequenceClassification)(config).eval()
+    model.save_pretrained(src)
+    tokenizer.save_pretrained(src)
+    return model, tokenizer
+
+
+def build_random_models(work_dir):
+    """Random-weight stand-ins for both models, each exported to ONNX (fp32 + int8)."""
+    from sentence_transformers import SentenceTransformer
+    from sentiment import onnx_backend
+
+    paths = {}
+    for kind in ('encoder', 'classifier'):
+        src = os.path.join(work_dir, f'{kind}-src')
+        model, tokenizer = save_random_model(kind, src)
+        out = os.path.join(work_dir, kind)
+        if kind == 'encoder':
+            onnx_backend.export_encoder(SentenceTransformer(src, device='cpu'), out, src)
+        else:
+            onnx_backend.export_classifier(model, tokenizer, out, src)
+        paths[kind] = {'torch': src, 'onnx': out}
+    return paths
+
+
+def worker(kind, backend, torch_src, onnx_dir, n, threads, batch_size):
+    """Load one backend, label n texts and print a JSON result line."""
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    from sentiment import nlp_utils, onnx_backend
+
+    base_rss = rss_mb()
+    t0 = time.perf_counter()
+    if backend == 'torch':
+        if kind == 'encoder':
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(torch_src, device='cpu')
+        else:
+            from transformers import pipeline
+            model = pipeline('sentiment-analysis', model=torch_src, device=-1)
+    else:
+        cls = onnx_backend.OnnxEncoder if kind == 'encoder' else onnx_backend.OnnxClassifier
+        model = cls(onnx_dir, threads=threads, quantized=(backend == 'onnx-int8'))
+    load_s = time.perf_counter() - t0
+    loaded_rss = rss_mb()
+
+    texts = sample_texts(n)
+    if kind == 'encoder':
+        protos = nlp_utils.get_prototype_embeddings(model)
+
+        def run(batch):
+            emb = model.encode(batch, batch_size=batch_size, convert_to_tensor=True, show_progress_bar=False)
+            return nlp_utils.prototype_labels(nlp_utils.util.cos_sim(emb, protos))
+    else:
+        def run(batch):
+            return [nlp_utils.map_label_to_triple(p['label'], p['score'])
+                    for p in model(batch, truncation=True, batch_size=batch_size)]
+
+    run(texts[:batch_size])
+    t0 = time.perf_counter()
+    labels = run(texts)
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        'model': kind, 'backend': backend, 'texts': n,
+        'texts_per_sec': round(n / elapsed, 1),
+        'load_s': round(load_s, 2),
+        'rss_mb_before_load': base_rss, 'rss_mb_loaded': loaded_rss, 'peak_rss_mb': peak_rss_mb(),
+        'labels': labels,
+    }))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--texts', type=int, default=2000)
+    ap.add_argument('--threads', type=int, default=0, help='Intra-op threads for both runtimes (0 = default)')
+    ap.add_argument('--batch-size', type=int, default=64)
+    ap.add_argument('--models', type=str, default='encoder,classifier')
+    ap.add_argument('--onnx-dir', type=str, default=os.path.join(BACKEND_DIR, 'models', 'onnx'),
+                    help='Output of manage.py export_sentiment_onnx')
+    ap.add_argument('--random-init', action='store_true', help='Benchmark random-weight stand-ins offline')
+    ap.add_argument('--worker', nargs=4, metavar=('KIND', 'BACKEND', 'TORCH_SRC', 'ONNX_DIR'), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        worker(*args.worker, n=args.texts, threads=args.threads, batch_size=args.batch_size)
+        return
+
+    from sentiment.nlp_utils import ST_MODEL_NAME
+    with tempfile.TemporaryDirectory(prefix='civlens_onnx_') as work_dir:
+        if args.random_init:
+            paths = build_random_models(work_dir)
+        else:
+            paths = {
+                'encoder': {'torch': ST_MODEL_NAME, 'onnx': os.path.join(args.onnx_dir, 'encoder')},
+                'classifier': {'torch': 'cardiffnlp/twitter-xlm-roberta-base-sentiment',
+                               'onnx': os.path.join(args.onnx_dir, 'classifier')},
+            }
+        report = {'texts': args.texts, 'threads': args.threads or 'default', 'random_init': args.random_init,
+                  'results': []}
+        for kind in [m.strip() for m in args.models.split(',') if m.strip()]:
+            reference = None
+            for backend in BACKENDS:
+                cmd = [sys.executable, '-m', 'benchmarks.sentiment.onnx_backend', '--texts', str(args.texts),
+                       '--threads', str(args.threads), '--batch-size', str(args.batch_size),
+                       '--worker', kind, backend, paths[kind]['torch'], paths[kind]['onnx']]
+                proc = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True)
+                lines = [ln for ln in proc.stdout.splitlines() if ln.startswith('{')]
+                if proc.returncode != 0 or not lines:
+                    res = {'model': kind, 'backend': backend, 'status': 'unavailable',
+                           'error': (proc.stderr.strip().splitlines() or [''])[-1]}
+                else:
+                    res = json.loads(lines[-1])
+                    labels = res.pop('labels')
+                    if backend == 'torch':
+                        reference = labels
+                    elif reference is not None:
+                        res['label_agreement_vs_torch'] = round(
+                            sum(a == b for a, b in zip(labels, reference)) / len(labels), 4)
+                report['results'].append(res)
+                print(json.dumps(res), flush=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
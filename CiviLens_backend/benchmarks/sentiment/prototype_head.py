@@ -0,0 +1,98 @@
+"""Prototype classification head: legacy per-row loop vs vectorized max/argmax.
+
+Checks that both heads assign identical labels and reports texts/second for the
+head alone and, when the MiniLM model can be loaded, for analyze_sentiments end to end.
+
+Run from CiviLens_backend/:
+    python -m benchmarks.sentiment.prototype_head --texts 10000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import torch
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from sentiment import nlp_utils  # noqa: E402
+
+
+def legacy_head(sim):
+    """The pre-vectorization loop from analyze_sentiments, kept for comparison."""
+    proto_texts = [(lab, p) for lab in nlp_utils.PROTO_LABELS for p in nlp_utils.PROTOTYPES[lab]]
+    out = []
+    for row in sim:
+        best_label = 'neutral'
+        best_score = -1.0
+        for idx, (lab, _p) in enumerate(proto_texts):
+            score = float(row[idx])
+            if score > best_score:
+                best_score = score
+                best_label = lab
+        out.append(best_label)
+    return out
+
+
+def sample_texts(n):
+    base = [
+        'The pension was credited on time, thank you',
+        'Portal keeps crashing and nobody answers the helpline',
+        'Application status updated to under review',
+        'Auto-generated complaint about service/scheme issue.',
+        'Ration card not received after three months of waiting',
+    ]
+    return [f"{base[i % len(base)]} #{i % 97}" for i in range(n)]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--texts', type=int, default=10000)
+    args = ap.parse_args(argv)
+    n = args.texts
+    report = {'texts': n}
+
+    # Head only: random unit vectors, plus exact ties to exercise tie-breaking
+    torch.manual_seed(0)
+    emb = torch.nn.functional.normalize(torch.randn(n, 384), dim=1)
+    protos = torch.nn.functional.normalize(torch.randn(6, 384), dim=1)
+    sim = emb @ protos.T
+    sim[:50] = 0.25
+    sim[50:100, 1] = sim[50:100, 4] = sim[50:100].max(dim=1).values + 1
+
+    t0 = time.perf_counter()
+    old = legacy_head(sim)
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = nlp_utils.prototype_labels(sim)
+    t_new = time.perf_counter() - t0
+    assert old == new, 'vectorized head disagrees with the legacy loop'
+    report['head'] = {
+        'labels_identical': True,
+        'legacy_texts_per_sec': round(n / t_old, 1),
+        'vectorized_texts_per_sec': round(n / t_new, 1),
+        'speedup': round(t_old / t_new, 1),
+    }
+
+    st = nlp_utils.get_st_model()
+    if st is None:
+        report['end_to_end'] = 'unavailable (sentence-transformers model could not be loaded)'
+    else:
+        texts = sample_texts(n)
+        proto_emb = nlp_utils.get_prototype_embeddings(st)
+        text_emb = st.encode(texts, batch_size=64, convert_to_tensor=True, show_progress_bar=False)
+        sim = nlp_utils.util.cos_sim(text_emb, proto_emb)
+        assert legacy_head(sim) == nlp_utils.prototype_labels(sim)
+        nlp_utils.analyze_sentiments(texts[:64])
+        t0 = time.perf_counter()
+        nlp_utils.analyze_sentiments(texts)
+        report['end_to_end'] = {'texts_per_sec': round(n / (time.perf_counter() - t0), 1)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Per-region model calls vs one cross-region batched pass for the regions heatmap.
+
+`legacy` is the old SentimentRegionsView loop: one analyze_sentiments call per
+state, each re-encoding the prototypes and encoding every row. `single_pass` is
+nlp_utils.analyze_grouped: one deduplicated, length-sorted pass with labels
+scattered back per region. `pool` is the same over a process pool. The
+persistent cache is disabled so every mode pays for its forward passes.
+
+Run from CiviLens_backend/:
+    python -m benchmarks.sentiment.regions_batching --rows 12000
+    python -m benchmarks.sentiment.regions_batching --rows 12000 --random-init --workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ['SENTIMENT_CACHE_DIR'] = 'off'
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+
+BASE_TEXTS = [
+    'The pension was credited on time, thank you',
+    'Portal keeps crashing and nobody answers the helpline',
+    'Application status updated to under review',
+    'Ration card not received after three months of waiting',
+    'Road repaired quickly, the ward office was helpful',
+]
+DUPLICATE_TEXT = 'Auto-generated complaint about service/scheme issue.'
+
+
+def region_rows(n, states):
+    """n rows over all states; ~20% are the repeated synthetic template, the rest vary."""
+    rows = {}
+    for i in range(n):
+        state = states[i % len(states)]
+        if i % 5 == 0:
+            text = DUPLICATE_TEXT
+        else:
+            text = f"{BASE_TEXTS[i % len(BASE_TEXTS)]} ({state}, ward {i % 300})"
+        rows.setdefault(state, []).append(text)
+    return rows
+
+
+def legacy_per_region(nlp_utils, rows):
+    """The pre-batching loop: prototypes re-encoded and no dedup on every per-state call."""
+    st = nlp_utils.get_st_model()
+    out = {}
+    for name, texts in rows.items():
+        proto_texts = [p for lab in nlp_utils.PROTO_LABELS for p in nlp_utils.PROTOTYPES[lab]]
+        proto_emb = st.encode(proto_texts, convert_to_tensor=True, show_progress_bar=False)
+        emb = st.encode(texts, batch_size=64, convert_to_tensor=True, show_progress_bar=False)
+        out[name] = nlp_utils.prototype_labels(nlp_utils.util.cos_sim(emb, proto_emb))
+    return out
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=12000)
+    ap.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 1))
+    ap.add_argument('--random-init', action='store_true',
+                    help='Use a random-weight MiniLM-sized encoder (no model download needed)')
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='civlens_regions_') as work_dir:
+        if args.random_init:
+            from benchmarks.sentiment.onnx_backend import save_random_model
+            src = os.path.join(work_dir, 'encoder-src')
+            save_random_model('encoder', src)
+            os.environ['SENTIMENT_ST_MODEL'] = src
+
+        from sentiment import nlp_utils
+        if args.random_init:
+            nlp_utils.ST_MODEL_NAME = src  # module may already be imported (via save_random_model)
+        from regions.views import STATES
+        if nlp_utils.get_st_model() is None:
+            print(json.dumps({'status': 'unavailable', 'reason': 'sentence-transformers model could not be loaded; '
+                                                                   'try --random-init'}))
+            return
+
+        rows = region_rows(args.rows, STATES)
+        n_unique = len({t for texts in rows.values() for t in texts})
+        report = {'rows': args.rows, 'regions': len(rows), 'unique_texts': n_unique, 'cpu_count': os.cpu_count(),
+                  'random_init': args.random_init}
+
+        nlp_utils.analyze_sentiments(BASE_TEXTS)  # warm up model + prototype cache
+        legacy, t_legacy = timed(lambda: legacy_per_region(nlp_utils, rows))
+        single, t_single = timed(lambda: nlp_utils.analyze_grouped(rows))
+        pooled, t_pool = timed(lambda: nlp_utils.analyze_grouped(rows, workers=args.workers))
+
+        report['legacy'] = {'model_calls': 2 * len(rows), 'seconds': round(t_legacy, 3),
+                            'rows_per_sec': round(args.rows / t_legacy, 1)}
+        report['single_pass'] = {'model_calls': 1, 'seconds': round(t_single, 3),
+                                 'rows_per_sec': round(args.rows / t_single, 1),
+                                 'speedup_vs_legacy': round(t_legacy / t_single, 2),
+                                 'labels_identical': single == legacy}
+        report['pool'] = {'workers': args.workers, 'seconds': round(t_pool, 3),
+                          'rows_per_sec': round(args.rows / t_pool, 1),
+                          'speedup_vs_legacy': round(t_legacy / t_pool, 2),
+                          'labels_identical': pooled == legacy}
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Regular mixed-type collection vs native time-series layout for sentiment_records.
+
+Loads the same synthetic records twice into a scratch database on a local
+mongod:
+- `legacy`: a regular collection with half ISO-string and half epoch-ms
+  created_at values, as seeds and the API wrote them before core.timeseries.
+- `timeseries`: the core.timeseries layout (BSON date time field, region
+  metaField, hours granularity).
+
+It reports storage (data, storage and index sizes from $collStats) and the
+median latency of day x label counts over 7-, 30- and 90-day windows. The
+legacy collection needs two typed range branches plus per-type day
+extraction. The time-series query is sentiment.windows.daily_label_counts.
+Both must return the same counts.
+
+Needs a MongoDB 7.0+ server; the scratch database is dropped afterwards unless --keep.
+Run from CiviLens_backend/:
+    python -m benchmarks.sentiment.timeseries_layout --mongo-uri mongodb://localhost:27017 --records 500000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+
+TEXTS = [
+    'The pension was credited on time, thank you',
+    'Portal keeps crashing and nobody answers the helpline',
+    'Application status updated to under review',
+    'Ration card not received after three months of waiting',
+    'Road repaired quickly, the ward office was helpful',
+]
+LABELS = ('positive', 'neutral', 'negative')
+
+
+def synthetic(n, regions, days, now, seed=0):
+    rnd = random.Random(seed)
+    for i in range(n):
+        yield {
+            'region': regions[i % len(regions)],
+            'label': rnd.choice(LABELS),
+            'text': f'{TEXTS[i % len(TEXTS)]} #{i % 1000}',
+            'created_at': now - timedelta(seconds=rnd.randint(0, days * 86400)),
+        }
+
+
+def legacy_daily_counts(col, since):
+    """Day x label counts over a regular collection holding ISO-string and epoch-ms created_at."""
+    since_ms = int(since.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    day = {'$cond': [
+        {'$eq': [{'$type': '$created_at'}, 'string']},
+        {'$substrCP': ['$created_at', 0, 10]},
+        {'$dateToString': {'format': '%Y-%m-%d', 'date': {'$toDate': '$created_at'}}},
+    ]}
+    out = {}
+    for row in col.aggregate([
+        {'$match': {'$or': [{'created_at': {'$gte': since.isoformat()}}, {'created_at': {'$gte': since_ms}}]}},
+        {'$group': {'_id': {'day': day, 'label': {'$toLower': '$label'}}, 'n': {'$sum': 1}}},
+    ]):
+        out.setdefault(row['_id']['day'], dict.fromkeys(LABELS, 0))[row['_id']['label']] += row['n']
+    return out
+
+
+def storage(col):
+    stats = next(col.aggregate([{'$collStats': {'storageStats': {}}}]))['storageStats']
+    mb = 1024 * 1024
+    return {'data_mb': round(stats.get('size', 0) / mb, 2),
+            'storage_mb': round(stats.get('storageSize', 0) / mb, 2),
+            'index_mb': round(stats.get('totalIndexSize', 0) / mb, 2)}
+
+
+def median_ms(fn, repeats):
+    times = []
+    result = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return result, round(statistics.median(times), 2)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--mongo-uri', type=str, default=os.environ['MONGO_URI'])
+    ap.add_argument('--db', type=str, default='civlens_timeseries_bench')
+    ap.add_argument('--records', type=int, default=500000)
+    ap.add_argument('--days', type=int, default=365, help='History spread of the synthetic records')
+    ap.add_argument('--repeats', type=int, default=5)
+    ap.add_argument('--keep', action='store_true', help='Keep the scratch database')
+    args = ap.parse_args(argv)
+
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    from core import timeseries
+    from regions.views import STATES
+    from sentiment.windows import daily_label_counts
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=3000)
+    try:
+        version = tuple(client.server_info()['versionArray'][:2])
+    except PyMongoError as e:
+        print(json.dumps({'status': 'unavailable', 'reason': f'no mongod at {args.mongo_uri} ({type(e).__name__})'}))
+        return
+    if version < timeseries.MIN_SERVER_VERSION:
+        print(json.dumps({'status': 'unavailable', 'reason': f'MongoDB {version} < 7.0'}))
+        return
+
+    client.drop_database(args.db)
+    bench = client[args.db]
+    options = timeseries.SPECS['sentiment_records'][0]
+    bench.create_collection('timeseries', timeseries=options)
+    legacy, ts = bench['legacy'], bench['timeseries']
+    now = datetime.utcnow().replace(microsecond=0)
+    try:
+        t0 = time.perf_counter()
+        batch_legacy, batch_ts = [], []
+        for i, doc in enumerate(synthetic(args.records, STATES, args.days, now)):
+            old = dict(doc)
+            old['created_at'] = (doc['created_at'].isoformat() if i % 2
+                                 else int(doc['created_at'].replace(tzinfo=timezone.utc).timestamp() * 1000))
+            batch_legacy.append(old)
+            batch_ts.append(doc)
+            if len(batch_ts) >= 10000:
+                legacy.insert_many(batch_legacy, ordered=False)
+                ts.insert_many(batch_ts, ordered=False)
+                batch_legacy, batch_ts = [], []
+        if batch_ts:
+            legacy.insert_many(batch_legacy, ordered=False)
+            ts.insert_many(batch_ts, ordered=False)
+        for col in (legacy, ts):
+            col.create_index([('created_at', -1)])
+        load_s = time.perf_counter() - t0
+
+        report = {'records': args.records, 'days': args.days, 'server': '.'.join(map(str, version)),
+                  'timeseries_options': options, 'load_s': round(load_s, 1),
+                  'storage': {'legacy': storage(legacy), 'timeseries': storage(ts)}, 'windows': {}}
+        s_old, s_new = report['storage']['legacy'], report['storage']['timeseries']
+        report['storage']['storage_ratio'] = round(s_old['storage_mb'] / max(s_new['storage_mb'], 1e-9), 2)
+
+        for days in (7, 30, 90):
+            since = datetime(now.year, now.month, now.day) - timedelta(days=days)
+            old_counts, old_ms = median_ms(lambda: legacy_daily_counts(legacy, since), args.repeats)
+            new_counts, new_ms = median_ms(lambda: daily_label_counts(ts, since), args.repeats)
+            report['windows'][f'{days}d'] = {
+                'legacy_ms': old_ms, 'timeseries_ms': new_ms,
+                'speedup': round(old_ms / max(new_ms, 1e-9), 2),
+                'rows': sum(sum(v.values()) for v in new_counts.values()),
+                'counts_identical': old_counts == new_counts,
+            }
+        print(json.dumps(report, indent=2))
+    finally:
+        if not args.keep:
+            client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
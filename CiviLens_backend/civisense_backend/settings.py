@@ -112,6 +112,31 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
 
+# Sentiment inference backend: 'torch' (default) or 'onnx' (int8 ONNX Runtime on CPU;
+# export first with `python manage.py export_sentiment_onnx`)
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'torch')
+SENTIMENT_ONNX_DIR = os.getenv('SENTIMENT_ONNX_DIR', str(BASE_DIR / 'models' / 'onnx'))
+SENTIMENT_ONNX_THREADS = int(os.getenv('SENTIMENT_ONNX_THREADS', 0))  # 0 = onnxruntime default
+SENTIMENT_ONNX_QUANTIZED = os.getenv('SENTIMENT_ONNX_QUANTIZED', 'true').lower() in ('1', 'true', 'yes')
+# Max raw rows a sentiment endpoint reads from a time window (newest first; ?limit= may lower it).
+# /api/sentiment/regions/?include_unlabelled=1 labels that many not-yet-labelled rows in the request
+# (one batched pass); SENTIMENT_WORKERS > 1 spreads large windows over a process pool
+SENTIMENT_WINDOW_CAP = int(os.getenv('SENTIMENT_WINDOW_CAP', 12000))
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', 0))
+# In-process micro-batching (sentiment/broker.py): request threads share forward passes of up to
+# SENTIMENT_BROKER_MAX_BATCH texts, waiting at most SENTIMENT_BROKER_MAX_WAIT_MS for a batch to fill
+SENTIMENT_BROKER = os.getenv('SENTIMENT_BROKER', 'true').lower() in ('1', 'true', 'yes')
+SENTIMENT_BROKER_MAX_BATCH = int(os.getenv('SENTIMENT_BROKER_MAX_BATCH', 256))
+SENTIMENT_BROKER_MAX_WAIT_MS = float(os.getenv('SENTIMENT_BROKER_MAX_WAIT_MS', 5))
+# Route English texts to the small English models and Indic-script / Hinglish texts to the
+# multilingual XLM-R model (sentiment/language.py); false labels everything with one model
+SENTIMENT_ROUTING = os.getenv('SENTIMENT_ROUTING', 'true').lower() in ('1', 'true', 'yes')
+# POST /api/sentiment/ingest/ (partner NDJSON uploads): per-upload limits; uploads with more new
+# records than SENTIMENT_INGEST_INLINE_LABEL_MAX are queued for `manage.py label_sentiment`
+SENTIMENT_INGEST_MAX_RECORDS = int(os.getenv('SENTIMENT_INGEST_MAX_RECORDS', 100000))
+SENTIMENT_INGEST_MAX_BYTES = int(os.getenv('SENTIMENT_INGEST_MAX_BYTES', 128 * 1024 * 1024))
+SENTIMENT_INGEST_INLINE_LABEL_MAX = int(os.getenv('SENTIMENT_INGEST_INLINE_LABEL_MAX', 5000))
+
 # Simple JWT settings (custom implementation uses these values)
 ACCESS_TOKEN_LIFETIME = int(os.getenv('ACCESS_TOKEN_LIFETIME_MINUTES', 60))
 REFRESH_TOKEN_LIFETIME_DAYS = int(os.getenv('REFRESH_TOKEN_LIFETIME_DAYS', 7))
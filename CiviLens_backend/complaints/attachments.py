@@ -0,0 +1,122 @@
+"""Content-addressed storage for complaint attachments.
+
+An upload is hashed (SHA-256) while it streams to a temporary file. It is then stored
+once at MEDIA_ROOT/attachments/ab/cd/<hash>, so the same photo uploaded by a hundred
+citizens takes disk space once, and no directory holds more than a few thousand entries.
+ATTACHMENTS keeps one document per hash (_id) with size, mime type, storage path and
+`refs`, the number of complaints pointing at it. `release` frees the file when the
+last reference goes. It moves the file aside before deleting it and puts it back if an
+upload of the same content took a new reference meanwhile; `store` always renames its own
+copy into place, so either way the file exists while a record points at it.
+
+Complaints store {'sha256', 'size', 'mime', 'name'} under `attachment`, so list and
+detail reads never touch the filesystem. The file is served by ComplaintAttachmentView
+with the stored mime type and immutable caching, since the content at a hash never
+changes. Only INLINE_MIMES are shown inline; anything else is sent as a download, so an
+uploaded HTML or SVG file cannot run scripts on the site's origin.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from pymongo import ReturnDocument
+
+ATTACHMENTS = 'attachments'
+ROOT_DIR = 'attachments'
+DEFAULT_MIME = 'application/octet-stream'
+INLINE_MIMES = frozenset({'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'application/pdf'})
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_sha256(value: str) -> bool:
+    return bool(_SHA256.match(value or ''))
+
+
+def relative_path(sha256: str) -> str:
+    return '/'.join((ROOT_DIR, sha256[:2], sha256[2:4], sha256))
+
+
+def absolute_path(sha256: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, *relative_path(sha256).split('/'))
+
+
+def guess_mime(name: str, declared: Optional[str] = None) -> str:
+    return mimetypes.guess_type(name or '')[0] or (declared or '').split(';')[0].strip() or DEFAULT_MIME
+
+
+def store(mongo_db, chunks, name: str, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+    """Stream `chunks` (bytes) into the store and take one reference on the result.
+    Returns the {'sha256', 'size', 'mime', 'name'} record a complaint keeps."""
+    tmp_dir = os.path.join(settings.MEDIA_ROOT, ROOT_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Same filesystem as the final path, so the move below is an atomic rename
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    referenced = False
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        mime = guess_mime(name, declared_mime)
+        mongo_db[ATTACHMENTS].update_one({'_id': sha256}, {
+            '$inc': {'refs': 1},
+            '$set': {'last_ref_at': int(time.time() * 1000)},
+            '$setOnInsert': {'size': size, 'mime': mime, 'path': relative_path(sha256),
+                             'created_at': int(time.time() * 1000)},
+        }, upsert=True)
+        referenced = True
+        final = absolute_path(sha256)
+        # Replace even an existing copy: a concurrent release may be deleting it
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(tmp_path, final)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if referenced:
+            # The file never made it into place (disk full, permissions): take the reference back
+            try:
+                release(mongo_db, sha256)
+            except Exception:
+                pass
+        raise
+    return {'sha256': sha256, 'size': size, 'mime': mime, 'name': os.path.basename(name or '') or sha256}
+
+
+def release(mongo_db, sha256: str) -> bool:
+    """Drop one reference; deletes the file and its record when none are left. True if deleted."""
+    doc = mongo_db[ATTACHMENTS].find_one_and_update(
+        {'_id': sha256}, {'$inc': {'refs': -1}}, projection={'refs': 1}, return_document=ReturnDocument.AFTER)
+    if doc is None or doc.get('refs', 0) > 0:
+        return False
+    if mongo_db[ATTACHMENTS].delete_one({'_id': sha256, 'refs': {'$lte': 0}}).deleted_count == 0:
+        return False  # re-referenced in between
+    final = absolute_path(sha256)
+    doomed = f'{final}.{os.getpid()}.{time.monotonic_ns()}.del'
+    try:
+        os.replace(final, doomed)
+    except FileNotFoundError:
+        return True
+    if mongo_db[ATTACHMENTS].find_one({'_id': sha256}, {'_id': 1}) is not None:
+        # Uploaded again since the delete; that upload may have found the file still here
+        os.replace(doomed, final)
+        return False
+    os.remove(doomed)
+    return True
+
+
+def is_inline(mime: Optional[str]) -> bool:
+    return (mime or '').split(';')[0].strip().lower() in INLINE_MIMES
+
+
+def url_path(sha256: str) -> str:
+    from django.urls import reverse
+    return reverse('complaint-attachment', args=[sha256])
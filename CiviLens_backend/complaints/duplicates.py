@@ -0,0 +1,256 @@
+"""Near-duplicate complaint detection with MinHash signatures and an in-process LSH index.
+
+A description is reduced to its set of character 5-grams (case, punctuation and spacing
+ignored) and summarised by NUM_PERM min-hashes. The share of equal min-hashes between two
+signatures estimates the Jaccard similarity of their 5-gram sets. The LSH index splits each
+signature into BANDS bands of ROWS hashes and buckets complaints by band. A lookup therefore
+only compares against complaints sharing at least one band: pairs at 0.5 similarity
+collide about 65% of the time, and pairs at 0.8 about 100% of the time. Candidates are then
+kept when their estimated similarity reaches THRESHOLD.
+
+Signatures are stored in MINHASH (one document per complaint, `sig` as raw uint32 bytes) so
+each web process loads its index without re-reading descriptions, and picks up signatures
+written by other processes every REFRESH_S seconds. Only complaints from the last
+WINDOW_DAYS are loaded or offered: mass issues produce their duplicates within days. Rows
+that have aged out are compacted away every PRUNE_S seconds, so the index stays the size
+of the window. Loading runs on a background thread started by the first lookup, so no
+request waits for it; until it finishes, lookups see what has been loaded so far.
+
+`manage.py build_complaint_minhash` computes signatures for existing complaints.
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+MINHASH = 'complaint_minhash'
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+THRESHOLD = 0.6
+MAX_CANDIDATES = 5
+REFRESH_S = 30
+PRUNE_S = 3600
+WINDOW_DAYS = 180
+
+# Universal hashing (a*x + b) mod P on 32-bit shingle hashes; a < 2**31 keeps a*x + b in uint64
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_NON_WORD = re.compile(r'[\W_]+')
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_indexes(mongo_db):
+    mongo_db[MINHASH].create_index('indexed_at')
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def window_start_ms() -> int:
+    return _now_ms() - WINDOW_DAYS * 86400000
+
+
+def shingles(text: str) -> set:
+    norm = _NON_WORD.sub(' ', unicodedata.normalize('NFKC', text or '').lower()).strip()
+    if not norm:
+        return set()
+    if len(norm) <= SHINGLE:
+        return {norm}
+    return {norm[i:i + SHINGLE] for i in range(len(norm) - SHINGLE + 1)}
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """NUM_PERM min-hashes (uint32) of the description, None when it has no words."""
+    grams = shingles(text)
+    if not grams:
+        return None
+    x = np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+    return ((np.outer(x, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def _band_keys(sig: np.ndarray) -> List[int]:
+    # Python's hash is salted per process, which is fine: the buckets never leave it
+    return [hash(band.tobytes()) for band in sig.reshape(BANDS, ROWS)]
+
+
+class MinHashIndex:
+    """Signatures and creation times in growable arrays plus a bucket dict per band mapping
+    to array rows."""
+
+    def __init__(self, capacity: int = 1024):
+        self._sigs = np.empty((capacity, NUM_PERM), dtype=np.uint32)
+        self._created = np.empty(capacity, dtype=np.int64)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _append(self, complaint_id: str, sig: np.ndarray, created_ms: int):
+        row = len(self._ids)
+        if row == len(self._sigs):
+            self._sigs = np.concatenate([self._sigs, np.empty_like(self._sigs)])
+            self._created = np.concatenate([self._created, np.empty_like(self._created)])
+        self._sigs[row] = sig
+        self._created[row] = created_ms
+        self._ids.append(complaint_id)
+        self._rows[complaint_id] = row
+        for band, key in zip(self._bands, _band_keys(sig)):
+            band.setdefault(key, []).append(row)
+
+    def add(self, complaint_id: str, sig: np.ndarray, created_ms: Optional[int] = None):
+        with self._lock:
+            if complaint_id not in self._rows:
+                self._append(complaint_id, sig, _now_ms() if created_ms is None else created_ms)
+
+    def prune(self, before_ms: int) -> int:
+        """Drop complaints created before `before_ms` and rebuild the buckets; returns how many."""
+        with self._lock:
+            n = len(self._ids)
+            keep = np.nonzero(self._created[:n] >= before_ms)[0]
+            if len(keep) == n:
+                return 0
+            sigs, created, ids = self._sigs[keep], self._created[keep], [self._ids[i] for i in keep]
+            self._sigs = np.empty((max(1024, 2 * len(keep)), NUM_PERM), dtype=np.uint32)
+            self._created = np.empty(len(self._sigs), dtype=np.int64)
+            self._ids, self._rows = [], {}
+            self._bands = [{} for _ in range(BANDS)]
+            for complaint_id, sig, created_ms in zip(ids, sigs, created):
+                self._append(complaint_id, sig, int(created_ms))
+            return n - len(keep)
+
+    def query(self, sig: np.ndarray, limit: int = MAX_CANDIDATES, threshold: float = THRESHOLD,
+              since_ms: Optional[int] = None) -> List[Tuple[str, float]]:
+        """[(complaint_id, estimated similarity)] best first, at most `limit`, ignoring complaints
+        created before `since_ms`."""
+        with self._lock:
+            rows = set()
+            for band, key in zip(self._bands, _band_keys(sig)):
+                rows.update(band.get(key, ()))
+            if not rows:
+                return []
+            rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            if since_ms is not None:
+                rows = rows[self._created[rows] >= since_ms]
+            scores = np.count_nonzero(self._sigs[rows] == sig, axis=1) / NUM_PERM
+            keep = np.nonzero(scores >= threshold)[0]
+            best = keep[np.argsort(-scores[keep], kind='stable')][:limit]
+            return [(self._ids[rows[i]], round(float(scores[i]), 3)) for i in best]
+
+
+_index = MinHashIndex()
+_refresh_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+_loaded_until = 0
+_last_refresh = float('-inf')
+_last_prune = float('-inf')
+
+
+def refresh(mongo_db):
+    """Add signatures stored since the last refresh and, every PRUNE_S, drop those that left
+    the window. Runs on the refresher thread; never raises."""
+    global _loaded_until, _last_refresh, _last_prune
+    try:
+        since = window_start_ms()
+        loaded_until = _loaded_until
+        query = {'indexed_at': {'$gte': loaded_until}, 'created_at': {'$gte': since}}
+        for doc in mongo_db[MINHASH].find(query, {'sig': 1, 'created_at': 1, 'indexed_at': 1}):
+            _index.add(str(doc['_id']), np.frombuffer(doc['sig'], dtype=np.uint32), doc.get('created_at') or 0)
+            loaded_until = max(loaded_until, doc.get('indexed_at') or 0)
+        # Advanced only after a complete pass, so a failed one is retried from the same point
+        _loaded_until = loaded_until
+        if time.monotonic() - _last_prune >= PRUNE_S:
+            _index.prune(since)
+            _last_prune = time.monotonic()
+    except Exception:
+        logger.warning('Refreshing the complaint MinHash index failed', exc_info=True)
+    finally:
+        _last_refresh = time.monotonic()
+
+
+def index_for(mongo_db) -> MinHashIndex:
+    """The process-wide index. Once it is REFRESH_S old a background thread tops it up; the
+    first call starts the initial load. Never waits for Mongo."""
+    global _refresher
+    if time.monotonic() - _last_refresh >= REFRESH_S:
+        with _refresh_lock:
+            if (_refresher is None or not _refresher.is_alive()) and time.monotonic() - _last_refresh >= REFRESH_S:
+                _refresher = threading.Thread(target=refresh, args=(mongo_db,), name='complaint-minhash', daemon=True)
+                _refresher.start()
+    return _index
+
+
+def find_similar(mongo_db, text: str) -> Tuple[Optional[np.ndarray], List[Tuple[str, float]]]:
+    """(signature, candidate duplicates) for a new description."""
+    sig = signature(text)
+    if sig is None:
+        return None, []
+    return sig, index_for(mongo_db).query(sig, since_ms=window_start_ms())
+
+
+def _record(sig: np.ndarray, created_ms: int, now: int) -> Dict[str, Any]:
+    return {'sig': sig.tobytes(), 'created_at': created_ms, 'indexed_at': now}
+
+
+def remember(mongo_db, complaint_id, sig: Optional[np.ndarray], created_at_ms: Optional[int] = None) -> bool:
+    """Store the signature of a new complaint and add it to this process's index. Never raises:
+    a missed signature only means the complaint is not offered as a duplicate."""
+    if sig is None:
+        return False
+    now = _now_ms()
+    created = created_at_ms or now
+    try:
+        mongo_db[MINHASH].insert_one({'_id': complaint_id, **_record(sig, created, now)})
+    except Exception:
+        return False
+    _index.add(str(complaint_id), sig, created)
+    return True
+
+
+def created_ms(doc: Dict[str, Any]) -> Optional[int]:
+    """Creation time in epoch ms from created_at (ms, ISO string or datetime) or the ObjectId."""
+    value = doc.get('created_at')
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if isinstance(value, datetime):
+            return int(value.timestamp() * 1000)
+    except ValueError:
+        pass
+    generation_time = getattr(doc.get('_id'), 'generation_time', None)
+    return int(generation_time.timestamp() * 1000) if generation_time else None
+
+
+def store_signatures(mongo_db, docs: List[Dict[str, Any]]) -> int:
+    """Upsert signatures for complaint documents (_id, description, created_at); returns how many."""
+    now = _now_ms()
+    ops = []
+    for doc in docs:
+        sig = signature(doc.get('description') or '')
+        if sig is not None:
+            record = _record(sig, created_ms(doc) or now, now)
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': record}, upsert=True))
+    if ops:
+        mongo_db[MINHASH].bulk_write(ops, ordered=False)
+    return len(ops)
@@ -0,0 +1,161 @@
+"""Keyset-paginated complaint feed.
+
+The public feed is ordered by upvotes (most first) and then _id, which is served by the
+{upvotes: -1, _id: -1} index. `?mine=1` lists the caller's complaints newest first through
+{user_id: 1, created_at: -1, _id: -1}. Each page returns an opaque cursor holding the sort
+key of its last row, and the next page continues strictly after it. So page N costs the
+same as page 1, and complaints upvoted or added while a client pages do not shift rows
+already returned.
+
+created_at is mixed (epoch ms from the API, ISO strings from seeds and CSV loads) and
+upvotes may be missing on old documents. Range operators only compare within one BSON
+type, so `after` also admits every type that sorts below the cursor value (descending:
+date > string > number > null / missing).
+
+Totals come from COUNTERS: one document for all complaints and one per user, incremented
+on create. `refresh_counts` rebuilds them after bulk loads.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+COUNTERS = 'complaint_counters'
+ALL_KEY = 'all'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Everything the feed rows need; never the legacy per-vote upvoters array
+LIST_FIELDS = {'title': 1, 'topic': 1, 'description': 1, 'category': 1, 'location': 1, 'region': 1,
+               'date': 1, 'created_at': 1, 'upvotes': 1, 'status': 1}
+
+PUBLIC_SORT = [('upvotes', -1), ('_id', -1)]
+MINE_SORT = [('created_at', -1), ('_id', -1)]
+
+# $type aliases that sort below a value of the key's type in a descending sort
+_LOWER_TYPES = {
+    'date': ['string', 'number'],
+    'string': ['number'],
+    'number': [],
+}
+
+
+class CursorError(ValueError):
+    pass
+
+
+def user_key(user_id: str) -> str:
+    return f'user:{user_id}'
+
+
+def ensure_indexes(mongo_db):
+    mongo_db['complaints'].create_index(PUBLIC_SORT)
+    mongo_db['complaints'].create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+
+
+def parse_limit(value, default: int = DEFAULT_LIMIT) -> int:
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return default
+    return default if n <= 0 else min(n, MAX_LIMIT)
+
+
+# -------------------- cursors --------------------
+def _type_of(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return 'date'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 'number'
+    raise CursorError(f'Unsupported sort value {type(value).__name__}')
+
+
+def encode_cursor(key, _id) -> str:
+    if isinstance(key, datetime):
+        key = {'$date': key.isoformat()}
+    raw = json.dumps([key, str(_id)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[Any, Any]:
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key, _id = json.loads(raw.decode('utf-8'))
+        if isinstance(key, dict):
+            key = datetime.fromisoformat(key['$date'])
+        _type_of(key)
+    except (ValueError, TypeError, KeyError, UnicodeDecodeError) as e:
+        raise CursorError('Invalid cursor') from e
+    try:
+        _id = ObjectId(_id)
+    except (InvalidId, TypeError):
+        pass
+    return key, _id
+
+
+def after(field: str, key, _id) -> Dict[str, Any]:
+    """Filter for rows strictly after (key, _id) in a (field desc, _id desc) ordering."""
+    kind = _type_of(key)
+    if kind is None:
+        return {field: None, '_id': {'$lt': _id}}
+    clauses: List[Dict[str, Any]] = [{field: {'$lt': key}}, {field: key, '_id': {'$lt': _id}}]
+    clauses += [{field: {'$type': t}} for t in _LOWER_TYPES[kind]]
+    clauses.append({field: None})
+    return {'$or': clauses}
+
+
+# -------------------- pages --------------------
+def page(col, query: Dict[str, Any], sort: List[Tuple[str, int]], limit: int,
+         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of `query` in `sort` order and the cursor of the next page (None at the end)."""
+    field = sort[0][0]
+    if cursor:
+        key, _id = decode_cursor(cursor)
+        query = {'$and': [query, after(field, key, _id)]} if query else after(field, key, _id)
+    docs = list(col.find(query, LIST_FIELDS).sort(sort).limit(limit + 1))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.get(field), last['_id'])
+
+
+# -------------------- counters --------------------
+def count_created(mongo_db, user_id: Optional[str]):
+    """Bump the counters that exist; missing ones are seeded from a count on first read."""
+    keys = [ALL_KEY] + ([user_key(user_id)] if user_id else [])
+    mongo_db[COUNTERS].bulk_write([UpdateOne({'_id': k}, {'$inc': {'n': 1}}) for k in keys],
+                                  ordered=False)
+
+
+def total(mongo_db, user_id: Optional[str] = None) -> int:
+    key = user_key(user_id) if user_id else ALL_KEY
+    doc = mongo_db[COUNTERS].find_one({'_id': key})
+    if doc is not None:
+        return int(doc.get('n', 0))
+    # Never counted (fresh deployment or bulk load without refresh_counts)
+    n = mongo_db['complaints'].count_documents({'user_id': user_id} if user_id else {})
+    mongo_db[COUNTERS].update_one({'_id': key}, {'$setOnInsert': {'n': n}}, upsert=True)
+    return n
+
+
+def refresh_counts(mongo_db) -> int:
+    """Recompute every counter from the complaints collection; returns the complaint total."""
+    counts = {}
+    n_all = 0
+    for row in mongo_db['complaints'].aggregate([{'$group': {'_id': '$user_id', 'n': {'$sum': 1}}}]):
+        n_all += row['n']
+        if row['_id']:
+            counts[user_key(str(row['_id']))] = row['n']
+    counts[ALL_KEY] = n_all
+    ops = [UpdateOne({'_id': k}, {'$set': {'n': n}}, upsert=True) for k, n in counts.items()]
+    mongo_db[COUNTERS].bulk_write(ops, ordered=False)
+    mongo_db[COUNTERS].delete_many({'_id': {'$nin': list(counts)}})
+    return n_all
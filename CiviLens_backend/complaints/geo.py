@@ -0,0 +1,185 @@
+"""Complaint locations as GeoJSON points.
+
+`normalize` turns what clients send as `geo` ({lat, lng}, {latitude, longitude}, a GeoJSON
+Point or a [lng, lat] pair) into {'type': 'Point', 'coordinates': [lng, lat]}, which the
+2dsphere index on complaints.geo can use. Complaints without a location have no `geo`
+field, so the index skips them.
+
+Bounding boxes become GeoJSON polygons for $geoWithin. Polygon edges are great circles,
+so the top and bottom edges are densified to follow their latitude, and wide boxes are
+split into pieces smaller than a hemisphere.
+
+`cluster_pipeline` groups the points inside a box into grid cells sized by map zoom
+(CELLS_PER_TILE cells across a 256px tile), so a map receives at most a few thousand
+buckets with counts and centroids however many complaints fall in view.
+
+`manage.py migrate_complaint_geo` rewrites legacy free-form `geo` values and builds the
+index.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+GEO_FIELD = 'geo'
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+DEFAULT_RADIUS_M = 5000
+MAX_RADIUS_M = 200000
+MAX_ZOOM = 20
+CELLS_PER_TILE = 4
+# Upper bound on cells across either side of the box, whatever the zoom
+MAX_CELLS_PER_AXIS = 64
+# Longitude step used to densify the horizontal edges of a box
+_EDGE_STEP_DEG = 1.0
+# Polygons must stay smaller than a hemisphere; wider boxes are split
+_MAX_POLYGON_WIDTH_DEG = 90
+_POLE_LAT = 89.999999
+
+POINT_FIELDS = {'title': 1, 'topic': 1, 'category': 1, 'status': 1, 'upvotes': 1, GEO_FIELD: 1}
+
+Box = Tuple[float, float, float, float]
+
+
+class GeoError(ValueError):
+    pass
+
+
+def ensure_indexes(mongo_db):
+    mongo_db['complaints'].create_index([(GEO_FIELD, '2dsphere')])
+
+
+def parse_limit(value) -> int:
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return DEFAULT_LIMIT if n <= 0 else min(n, MAX_LIMIT)
+
+
+def _coord(value) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def point(lng, lat) -> Optional[Dict[str, Any]]:
+    lng, lat = _coord(lng), _coord(lat)
+    if lng is None or lat is None or not (-180 <= lng <= 180) or not (-90 <= lat <= 90):
+        return None
+    return {'type': 'Point', 'coordinates': [lng, lat]}
+
+
+def normalize(raw) -> Optional[Dict[str, Any]]:
+    """GeoJSON Point for any accepted location shape, None if there is no usable location."""
+    if isinstance(raw, (list, tuple)) and len(raw) == 2:
+        return point(raw[0], raw[1])
+    if not isinstance(raw, dict):
+        return None
+    if raw.get('type') == 'Point' and isinstance(raw.get('coordinates'), (list, tuple)):
+        coords = raw['coordinates']
+        return point(coords[0], coords[1]) if len(coords) == 2 else None
+    lat = next((raw[k] for k in ('lat', 'latitude') if k in raw), None)
+    lng = next((raw[k] for k in ('lng', 'lon', 'long', 'longitude') if k in raw), None)
+    return point(lng, lat)
+
+
+def lat_lng(doc: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
+    coords = ((doc or {}).get(GEO_FIELD) or {}).get('coordinates') or [None, None]
+    return coords[1], coords[0]
+
+
+def parse_bbox(value: Optional[str]) -> Box:
+    """'minLng,minLat,maxLng,maxLat' as used by Leaflet's toBBoxString()."""
+    parts = [_coord(p) for p in (value or '').split(',')]
+    if len(parts) != 4 or any(p is None for p in parts):
+        raise GeoError('bbox must be minLng,minLat,maxLng,maxLat')
+    min_lng, min_lat, max_lng, max_lat = parts
+    # Maps report boxes past the antimeridian when panned; clamp to the world
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise GeoError('bbox must have minLng < maxLng and minLat < maxLat')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _box_ring(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[List[float]]:
+    steps = max(1, math.ceil((max_lng - min_lng) / _EDGE_STEP_DEG))
+    lngs = [min_lng + (max_lng - min_lng) * i / steps for i in range(steps + 1)]
+    # An edge along a pole would collapse into duplicate vertices
+    min_lat, max_lat = max(min_lat, -_POLE_LAT), min(max_lat, _POLE_LAT)
+    ring = [[x, min_lat] for x in lngs] + [[x, max_lat] for x in reversed(lngs)]
+    return ring + [ring[0]]
+
+
+def within_box(box: Box) -> Dict[str, Any]:
+    """Filter for complaints located inside the box, served by the 2dsphere index."""
+    min_lng, min_lat, max_lng, max_lat = box
+    if max_lng - min_lng >= 360 and min_lat <= -90 and max_lat >= 90:
+        return {GEO_FIELD: {'$exists': True}}
+    if max_lng - min_lng > _MAX_POLYGON_WIDTH_DEG:
+        mid = (min_lng + max_lng) / 2
+        return {'$or': [within_box((min_lng, min_lat, mid, max_lat)), within_box((mid, min_lat, max_lng, max_lat))]}
+    polygon = {'type': 'Polygon', 'coordinates': [_box_ring(min_lng, min_lat, max_lng, max_lat)]}
+    return {GEO_FIELD: {'$geoWithin': {'$geometry': polygon}}}
+
+
+def near(lng: float, lat: float, radius_m: float) -> Dict[str, Any]:
+    """Filter returning complaints within radius_m, nearest first."""
+    return {GEO_FIELD: {'$nearSphere': {
+        '$geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+        '$maxDistance': radius_m,
+    }}}
+
+
+def distance_m(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    """Haversine distance on the mean Earth radius."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+# -------------------- clustering --------------------
+def cell_size(zoom: int, box: Box) -> float:
+    """Grid cell side in degrees: CELLS_PER_TILE per web-map tile at this zoom, widened when
+    the box would otherwise span more than MAX_CELLS_PER_AXIS cells."""
+    zoom = max(0, min(MAX_ZOOM, zoom))
+    size = 360.0 / (2 ** zoom) / CELLS_PER_TILE
+    span = max(box[2] - box[0], box[3] - box[1])
+    return max(size, span / MAX_CELLS_PER_AXIS)
+
+
+def cluster_pipeline(match: Dict[str, Any], size: float) -> List[Dict[str, Any]]:
+    lng = {'$arrayElemAt': [f'${GEO_FIELD}.coordinates', 0]}
+    lat = {'$arrayElemAt': [f'${GEO_FIELD}.coordinates', 1]}
+    return [
+        {'$match': match},
+        {'$project': {'_id': 1, 'status': 1, 'lng': lng, 'lat': lat}},
+        {'$group': {
+            '_id': {'x': {'$floor': {'$divide': ['$lng', size]}}, 'y': {'$floor': {'$divide': ['$lat', size]}}},
+            'count': {'$sum': 1},
+            'open': {'$sum': {'$cond': [{'$eq': ['$status', 'closed']}, 0, 1]}},
+            'lng': {'$avg': '$lng'},
+            'lat': {'$avg': '$lat'},
+            'complaint_id': {'$first': '$_id'},
+        }},
+    ]
+
+
+def cluster_row(bucket: Dict[str, Any], size: float) -> Dict[str, Any]:
+    x, y = bucket['_id']['x'], bucket['_id']['y']
+    row = {
+        'lat': round(bucket['lat'], 6),
+        'lng': round(bucket['lng'], 6),
+        'count': bucket['count'],
+        'open_count': bucket['open'],
+        'bounds': [x * size, y * size, (x + 1) * size, (y + 1) * size],
+    }
+    if bucket['count'] == 1:
+        # A lone complaint can be linked directly instead of zoomed into
+        row['id'] = str(bucket['complaint_id'])
+    return row
@@ -1,5 +1,295 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest.mock
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+from bson import ObjectId
+from django.test import RequestFactory, TestCase, SimpleTestCase, override_settings
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from complaints import attachments, duplicates, feed, geo, views, votes
+from core.testing import MemoryDB, RecordingDB
+
 
 class BasicTest(TestCase):
     def test_placeholder(self):
         self.assertTrue(True)
+
+
+class FeedCursorTest(SimpleTestCase):
+    def test_cursor_round_trip_keeps_key_type(self):
+        oid = ObjectId()
+        for key in (12, 1712000000000, '2024-03-01T10:00:00', datetime(2024, 3, 1, 10, 0), None):
+            self.assertEqual(feed.decode_cursor(feed.encode_cursor(key, oid)), (key, oid))
+
+    def test_invalid_cursor(self):
+        for token in ('not-a-cursor', feed.encode_cursor('x', 'y')[:-3], ''):
+            with self.assertRaises(feed.CursorError):
+                feed.decode_cursor(token or '!!')
+
+    def test_after_admits_lower_sorting_types(self):
+        oid = ObjectId()
+        q = feed.after('created_at', '2024-03-01T10:00:00', oid)
+        self.assertIn({'created_at': {'$type': 'number'}}, q['$or'])
+        self.assertIn({'created_at': None}, q['$or'])
+        self.assertEqual(feed.after('upvotes', None, oid), {'upvotes': None, '_id': {'$lt': oid}})
+
+    def test_parse_limit(self):
+        self.assertEqual(feed.parse_limit(None), feed.DEFAULT_LIMIT)
+        self.assertEqual(feed.parse_limit('0'), feed.DEFAULT_LIMIT)
+        self.assertEqual(feed.parse_limit('10000'), feed.MAX_LIMIT)
+        self.assertEqual(feed.parse_limit('7'), 7)
+
+
+class WriteRoundTripTest(SimpleTestCase):
+    """Each write endpoint answers with the documented number of Mongo calls."""
+
+    def setUp(self):
+        self.db = RecordingDB()
+        for patcher in (unittest.mock.patch.object(views, 'db', self.db),
+                        unittest.mock.patch.object(votes, '_index_ready', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.oid = ObjectId()
+
+    def request(self, method, body=None, user=None):
+        req = getattr(RequestFactory(), method)('/', data=json.dumps(body or {}), content_type='application/json')
+        req.user_data = user
+        return req
+
+    def test_upvote_new_vote(self):
+        self.db['complaint_votes'].results['insert_one'] = SimpleNamespace(inserted_id=ObjectId())
+        self.db['complaints'].results['find_one_and_update'] = {'_id': self.oid, 'upvotes': 4}
+        resp = views.ComplaintUpvoteView.as_view()(self.request('post', user={'_id': 'u1'}), pk=str(self.oid))
+        self.assertEqual(json.loads(resp.content)['data']['upvotes'], 4)
+        self.assertEqual(self.db.calls, [('complaint_votes', 'insert_one'), ('complaints', 'find_one_and_update')])
+
+    def test_upvote_repeat_vote(self):
+        self.db['complaint_votes'].results['insert_one'] = DuplicateKeyError('dup')
+        self.db['complaints'].results['find_one'] = {'_id': self.oid, 'upvotes': 4}
+        resp = views.ComplaintUpvoteView.as_view()(self.request('post', user={'_id': 'u1'}), pk=str(self.oid))
+        self.assertEqual(json.loads(resp.content)['data'], {'upvotes': 4, 'already_upvoted': True})
+        self.assertEqual(self.db.calls, [('complaint_votes', 'insert_one'), ('complaints', 'find_one')])
+
+    def test_patch_status(self):
+        self.db['complaints'].results['find_one_and_update'] = {'_id': self.oid, 'status': 'closed'}
+        resp = views.ComplaintDetailView.as_view()(
+            self.request('patch', {'status': 'closed'}, user={'_id': 'a1', 'role': 'admin'}), pk=str(self.oid))
+        self.assertEqual(json.loads(resp.content)['data']['status'], 'closed')
+        self.assertEqual(self.db.calls, [('complaints', 'find_one_and_update')])
+
+    def test_patch_missing_complaint(self):
+        resp = views.ComplaintDetailView.as_view()(
+            self.request('patch', {'status': 'closed'}, user={'_id': 'a1', 'role': 'admin'}), pk=str(self.oid))
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(self.db.calls), 1)
+
+
+class UpvoteTest(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryDB()
+        patcher = unittest.mock.patch.object(votes, '_index_ready', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.oid = ObjectId()
+        self.db['complaints'].insert_one({'_id': self.oid, 'upvotes': 2, 'upvoters': ['legacy']})
+
+    def test_first_vote_creates_the_unique_index(self):
+        self.assertEqual(votes.upvote(self.db, self.oid, 'u1'), {'upvotes': 3, 'added': True})
+        self.assertEqual(votes.upvote(self.db, self.oid, 'u1'), {'upvotes': 3, 'added': False})
+        self.assertEqual(self.db[votes.VOTES].count_documents({}), 1)
+
+    def test_unbuildable_index_counts_no_vote(self):
+        self.db[votes.VOTES].insert_many([{'complaint_id': self.oid, 'user_id': 'u1'} for _ in range(2)])
+        with unittest.mock.patch.object(votes, 'ensure_indexes', side_effect=OperationFailure('dup', 11000)):
+            with self.assertRaises(OperationFailure):
+                votes.upvote(self.db, self.oid, 'u2')
+        self.assertEqual(self.db['complaints'].find_one({})['upvotes'], 2)
+
+    def test_legacy_upvoter_is_not_counted_twice(self):
+        self.assertEqual(votes.upvote(self.db, self.oid, 'legacy'), {'upvotes': 2, 'added': False})
+        self.assertTrue(votes.has_voted(self.db, self.oid, 'legacy'))
+
+    def test_unknown_complaint_keeps_no_vote(self):
+        self.assertIsNone(votes.upvote(self.db, ObjectId(), 'u1'))
+        self.assertEqual(self.db[votes.VOTES].count_documents({}), 0)
+
+
+class AttachmentStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_identical_uploads_are_stored_once(self):
+        db = RecordingDB()
+        photo = [b'\xff\xd8' + b'x' * 70000, b'y' * 5000]
+        first = attachments.store(db, iter(photo), 'pothole.jpg', 'application/octet-stream')
+        second = attachments.store(db, iter(photo), 'IMG_0001.JPG')
+        sha = hashlib.sha256(b''.join(photo)).hexdigest()
+        self.assertEqual((first['sha256'], second['sha256']), (sha, sha))
+        self.assertEqual((first['size'], first['mime'], first['name']), (75002, 'image/jpeg', 'pothole.jpg'))
+        self.assertEqual(attachments.relative_path(sha), f'attachments/{sha[:2]}/{sha[2:4]}/{sha}')
+        with open(attachments.absolute_path(sha), 'rb') as fh:
+            self.assertEqual(fh.read(), b''.join(photo))
+        self.assertEqual(os.listdir(os.path.join(self.media, 'attachments', 'tmp')), [])
+        # One reference upsert per upload on the hash
+        self.assertEqual(db.calls, [('attachments', 'update_one')] * 2)
+
+    def test_release_deletes_with_the_last_reference(self):
+        db = MemoryDB()
+        sha = attachments.store(db, iter([b'%PDF-1.4 ration card']), 'card.pdf')['sha256']
+        attachments.store(db, iter([b'%PDF-1.4 ration card']), 'card.pdf')
+        self.assertFalse(attachments.release(db, sha))
+        self.assertTrue(os.path.exists(attachments.absolute_path(sha)))
+        self.assertTrue(attachments.release(db, sha))
+        self.assertFalse(os.path.exists(attachments.absolute_path(sha)))
+        self.assertIsNone(db[attachments.ATTACHMENTS].find_one({'_id': sha}))
+        self.assertFalse(attachments.release(db, sha))
+
+    def test_upload_during_release_keeps_the_file(self):
+        db = MemoryDB()
+        content = [b'\x89PNG\r\n\x1a\n streetlight']
+        sha = attachments.store(db, iter(content), 'light.png')['sha256']
+        delete_one = db[attachments.ATTACHMENTS].delete_one
+
+        def delete_then_upload(*args, **kwargs):
+            result = delete_one(*args, **kwargs)
+            attachments.store(db, iter(content), 'light.png')
+            return result
+
+        with unittest.mock.patch.object(db[attachments.ATTACHMENTS], 'delete_one', side_effect=delete_then_upload):
+            self.assertFalse(attachments.release(db, sha))
+        self.assertEqual(db[attachments.ATTACHMENTS].find_one({'_id': sha})['refs'], 1)
+        with open(attachments.absolute_path(sha), 'rb') as fh:
+            self.assertEqual(fh.read(), content[0])
+        self.assertEqual(os.listdir(os.path.dirname(attachments.absolute_path(sha))), [sha])
+
+    def test_failed_move_takes_the_reference_back(self):
+        db = MemoryDB()
+        kept = attachments.store(db, iter([b'%PDF-1.4 ration card']), 'card.pdf')['sha256']
+        tmp_dir = os.path.join(self.media, 'attachments', 'tmp')
+        real_replace = os.replace
+
+        def disk_full(src, dst):
+            if os.path.dirname(src) == tmp_dir:
+                raise OSError(28, 'No space left on device')
+            return real_replace(src, dst)
+
+        with unittest.mock.patch.object(attachments.os, 'replace', side_effect=disk_full):
+            for content in (b'new photo', b'%PDF-1.4 ration card'):
+                with self.assertRaises(OSError):
+                    attachments.store(db, iter([content]), 'upload.bin')
+        self.assertEqual([(d['_id'], d['refs']) for d in db[attachments.ATTACHMENTS].find({})], [(kept, 1)])
+        self.assertTrue(os.path.exists(attachments.absolute_path(kept)))
+        self.assertEqual(os.listdir(tmp_dir), [])
+
+    def serve(self, db, content, name):
+        sha = attachments.store(db, iter([content]), name)['sha256']
+        with unittest.mock.patch.object(views, 'db', db):
+            return views.ComplaintAttachmentView.as_view()(RequestFactory().get('/'), sha256=sha)
+
+    def test_view_shows_images_inline(self):
+        resp = self.serve(MemoryDB(), b'\xff\xd8 pothole', 'pothole.jpg')
+        self.assertEqual((resp['Content-Type'], resp['X-Content-Type-Options']), ('image/jpeg', 'nosniff'))
+        self.assertTrue(resp['Content-Disposition'].startswith('inline'))
+        self.assertEqual(b''.join(resp.streaming_content), b'\xff\xd8 pothole')
+        resp.close()
+
+    def test_view_downloads_active_content(self):
+        for name in ('evidence.html', 'map.svg', 'notes'):
+            resp = self.serve(MemoryDB(), b'<script>alert(1)</script>', name)
+            self.assertEqual(resp['X-Content-Type-Options'], 'nosniff')
+            self.assertTrue(resp['Content-Disposition'].startswith('attachment'), name)
+            resp.close()
+
+
+class GeoTest(SimpleTestCase):
+    def test_normalize_accepts_client_shapes(self):
+        expected = {'type': 'Point', 'coordinates': [72.87, 19.07]}
+        for raw in ({'lat': 19.07, 'lng': 72.87}, {'latitude': '19.07', 'longitude': '72.87'},
+                    {'type': 'Point', 'coordinates': [72.87, 19.07]}, [72.87, 19.07]):
+            self.assertEqual(geo.normalize(raw), expected)
+        for raw in ({}, {'lat': 19.07}, {'lat': 95, 'lng': 72}, {'lat': True, 'lng': 1}, 'Mumbai', None):
+            self.assertIsNone(geo.normalize(raw))
+
+    def test_bbox_polygons_stay_below_a_hemisphere(self):
+        with self.assertRaises(geo.GeoError):
+            geo.parse_bbox('80,10,70,20')
+        self.assertEqual(geo.within_box(geo.parse_bbox('-200,-95,200,95')), {'geo': {'$exists': True}})
+        ring = geo.within_box((68.0, 8.0, 98.0, 36.0))['geo']['$geoWithin']['$geometry']['coordinates'][0]
+        self.assertEqual((ring[0], ring[-1]), ([68.0, 8.0], [68.0, 8.0]))
+        self.assertEqual(len(ring), 2 * 31 + 1)
+        wide = geo.within_box((0.0, 0.0, 200.0, 10.0))
+        self.assertEqual(len(wide['$or']), 2)
+
+    def test_cluster_cells_are_bounded_per_axis(self):
+        india = (68.0, 8.0, 98.0, 36.0)
+        self.assertEqual(geo.cell_size(3, india), 360 / 8 / geo.CELLS_PER_TILE)
+        self.assertEqual(geo.cell_size(20, india), 30 / geo.MAX_CELLS_PER_AXIS)
+        row = geo.cluster_row({'_id': {'x': 2, 'y': 3}, 'count': 1, 'open': 1, 'lng': 1.0, 'lat': 1.5,
+                               'complaint_id': 'c1'}, 0.5)
+        self.assertEqual((row['bounds'], row['id']), ([1.0, 1.5, 1.5, 2.0], 'c1'))
+
+
+class DuplicateIndexTest(SimpleTestCase):
+    OUTAGE = 'Power outage in Sector 14 since last night, no electricity and the transformer is sparking'
+
+    def test_near_identical_descriptions_are_candidates(self):
+        index = duplicates.MinHashIndex()
+        index.add('outage', duplicates.signature(self.OUTAGE))
+        index.add('garbage', duplicates.signature('Garbage not collected on MG Road for a week'))
+        reworded = duplicates.signature('power outage in sector 14 since last night - no electricity, transformer is sparking!!')
+        matches = index.query(reworded)
+        self.assertEqual([cid for cid, _ in matches], ['outage'])
+        self.assertGreaterEqual(matches[0][1], duplicates.THRESHOLD)
+        self.assertEqual(index.query(duplicates.signature('Street light broken near the school gate')), [])
+        self.assertIsNone(duplicates.signature(' ?! '))
+
+    def test_signatures_are_stable_across_calls(self):
+        sig = duplicates.signature(self.OUTAGE)
+        self.assertEqual(sig.dtype, np.uint32)
+        self.assertEqual(sig.shape, (duplicates.NUM_PERM,))
+        self.assertEqual(duplicates.similarity(sig, duplicates.signature(self.OUTAGE.upper())), 1.0)
+
+    def test_prune_drops_complaints_older_than_the_window(self):
+        index = duplicates.MinHashIndex(capacity=2)
+        for i in range(5):
+            index.add(f'old{i}', duplicates.signature(f'{self.OUTAGE} {i}'), 1000)
+        index.add('new', duplicates.signature(self.OUTAGE), 5000)
+        self.assertEqual([cid for cid, _ in index.query(duplicates.signature(self.OUTAGE), since_ms=2000)], ['new'])
+        self.assertEqual(index.prune(2000), 5)
+        self.assertEqual((len(index), index.prune(2000)), (1, 0))
+        self.assertEqual([cid for cid, _ in index.query(duplicates.signature(self.OUTAGE))], ['new'])
+
+    def test_index_loads_in_the_background(self):
+        db = MemoryDB()
+        now = duplicates._now_ms()
+        sig = duplicates.signature(self.OUTAGE)
+        db[duplicates.MINHASH].insert_one({'_id': 'recent', **duplicates._record(sig, now, now)})
+        db[duplicates.MINHASH].insert_one({'_id': 'stale', **duplicates._record(sig, now - 400 * 86400000, now)})
+        for name, value in (('_index', duplicates.MinHashIndex()), ('_refresher', None), ('_loaded_until', 0),
+                            ('_last_refresh', float('-inf')), ('_last_prune', float('-inf'))):
+            patcher = unittest.mock.patch.object(duplicates, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        duplicates._index.add('aged-out', sig, now - 200 * 86400000)
+        index = duplicates.index_for(db)
+        duplicates._refresher.join(5)
+        self.assertEqual([cid for cid, _ in index.query(sig)], ['recent'])
+        self.assertEqual(len(index), 1)
+        self.assertIs(duplicates.index_for(db), index)
+
+    def test_remember_never_raises(self):
+        db = RecordingDB()
+        db[duplicates.MINHASH].results['insert_one'] = DuplicateKeyError('dup')
+        self.assertFalse(duplicates.remember(db, ObjectId(), duplicates.signature(self.OUTAGE)))
+        self.assertFalse(duplicates.remember(db, ObjectId(), None))
+        self.assertEqual(db.calls, [(duplicates.MINHASH, 'insert_one')])
@@ -1,9 +1,15 @@
 from django.urls import path
-from .views import ComplaintListCreateView, ComplaintDetailView, ComplaintUpvoteView, ComplaintHeatmapView
+from .views import (
+    ComplaintListCreateView, ComplaintDetailView, ComplaintUpvoteView, ComplaintHeatmapView, ComplaintAttachmentView,
+    ComplaintGeoBoxView, ComplaintGeoNearView,
+)
 
 urlpatterns = [
     path('', ComplaintListCreateView.as_view(), name='complaint-list'),
     path('heatmap/', ComplaintHeatmapView.as_view(), name='complaint-heatmap'),
+    path('geo/bbox/', ComplaintGeoBoxView.as_view(), name='complaint-geo-bbox'),
+    path('geo/near/', ComplaintGeoNearView.as_view(), name='complaint-geo-near'),
+    path('attachments/<str:sha256>/', ComplaintAttachmentView.as_view(), name='complaint-attachment'),
     path('<str:pk>/', ComplaintDetailView.as_view(), name='complaint-detail'),
     path('<str:pk>/upvote/', ComplaintUpvoteView.as_view(), name='complaint-upvote'),
 ]
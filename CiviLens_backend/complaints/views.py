@@ -1,106 +1,29 @@
 import json
 import time
-import os
 from django.views import View
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from db_connection import db
-from django.conf import settings
+from pymongo import ReturnDocument
 from collections import defaultdict
 import re
-import traceback
-
-# Lightweight SMTP email sender using environment variables
-def _email_debug_enabled():
-    return (os.environ.get('EMAIL_DEBUG', 'false').lower() in ('1','true','yes','on'))
-
-def _send_assignment_email_safe(to_email: str, complaint_doc: dict):
-    try:
-        host = os.environ.get('EMAIL_HOST')
-        port = int(os.environ.get('EMAIL_PORT') or 587)
-        user = os.environ.get('EMAIL_HOST_USER')
-        password = os.environ.get('EMAIL_HOST_PASSWORD')
-        use_tls = (os.environ.get('EMAIL_USE_TLS', 'true').lower() in ('1','true','yes'))
-        from email.mime.text import MIMEText
-        import smtplib
-
-        if _email_debug_enabled():
-            print('[SMTP] preparing to send assignment email', flush=True)
-            print(f"[SMTP] host={host} port={port} use_tls={use_tls}", flush=True)
-            print(f"[SMTP] user={user}", flush=True)
-            # Do NOT print password
-
-        if not host or not user or not password:
-            if _email_debug_enabled():
-                print('[SMTP] missing configuration (host/user/password) — skipping send', flush=True)
-            return  # missing config; skip silently
-
-        title = complaint_doc.get('title') or complaint_doc.get('topic') or 'Complaint'
-        cid = str(complaint_doc.get('_id') or complaint_doc.get('id') or '')
-        region = complaint_doc.get('region') or complaint_doc.get('location') or complaint_doc.get('state') or '—'
-        status = (complaint_doc.get('status') or 'open').title()
-        summary = (complaint_doc.get('description') or '')[:400]
-        frontend_base = os.environ.get('FRONTEND_BASE_URL') or ''
-        link = f"{frontend_base.rstrip('/')}/admin/complaints" if frontend_base else ''
-
-        body = (
-            f"You have been assigned a complaint on CiviLens.\n\n"
-            f"Title: {title}\n"
-            f"ID: {cid}\n"
-            f"Region: {region}\n"
-            f"Status: {status}\n"
-            f"Summary: {summary}\n"
-            + (f"\nView: {link}\n" if link else "\n")
-            + "\nPlease log in to review and take action."
-        )
-        msg = MIMEText(body, 'plain', 'utf-8')
-        msg['Subject'] = f"CiviLens • New Complaint Assigned: {title}"
-        from_addr = os.environ.get('EMAIL_FROM') or os.environ.get('SMTP_SENDER') or user
-        msg['From'] = from_addr
-        msg['To'] = to_email
-
-        if _email_debug_enabled():
-            print(f"[SMTP] from={from_addr} to={to_email}", flush=True)
-
-        if use_tls:
-            if _email_debug_enabled():
-                print('[SMTP] connecting (TLS)...', flush=True)
-            with smtplib.SMTP(host, port, timeout=15) as s:
-                if _email_debug_enabled():
-                    print('[SMTP] connection opened, issuing STARTTLS', flush=True)
-                s.starttls()
-                if _email_debug_enabled():
-                    print('[SMTP] logging in...', flush=True)
-                s.login(user, password)
-                if _email_debug_enabled():
-                    print('[SMTP] login OK, sending email...', flush=True)
-                s.sendmail(from_addr, [to_email], msg.as_string())
-                if _email_debug_enabled():
-                    print('[SMTP] send OK (TLS).', flush=True)
-        else:
-            if _email_debug_enabled():
-                print('[SMTP] connecting (plain)...', flush=True)
-            with smtplib.SMTP(host, port, timeout=15) as s:
-                if _email_debug_enabled():
-                    print('[SMTP] connection opened (plain), logging in...', flush=True)
-                s.login(user, password)
-                if _email_debug_enabled():
-                    print('[SMTP] login OK, sending email...', flush=True)
-                s.sendmail(from_addr, [to_email], msg.as_string())
-                if _email_debug_enabled():
-                    print('[SMTP] send OK (plain).', flush=True)
-    except Exception:
-        if _email_debug_enabled():
-            print('[SMTP] ERROR while sending email:', flush=True)
-            traceback.print_exc()
-        # Fail-safe: never block the request due to email issues
-        pass
 from regions.views import _normalize_region, STATES
+from sentiment.labeling import enqueue as enqueue_sentiment
+from core import outbox
+from . import feed as complaint_feed
+from . import votes as complaint_votes
+from . import attachments as complaint_attachments
+from . import geo as complaint_geo
+from . import duplicates as complaint_duplicates
 
 @method_decorator(csrf_exempt, name='dispatch')
 
 class ComplaintListCreateView(View):
+    """GET: one page of the complaint feed, most upvoted first (?mine=1: own complaints, newest first).
+    Query params: limit (default 50, max 200), cursor (next_cursor of the previous page), total=1.
+    The page info is returned next to data: { next_cursor, limit[, total] }.
+    """
     def get(self, request):
         # Get user data from request (assuming it's set by middleware)
         user_data = getattr(request, 'user_data', None)
@@ -112,12 +35,21 @@ class ComplaintListCreateView(View):
         # By default, return all complaints. If the client explicitly asks for only
         # the current user's complaints using ?mine=1 (or true/yes), then filter.
         query = {}
+        sort = complaint_feed.PUBLIC_SORT
+        user_id = None
         mine = (request.GET.get('mine') or '').strip().lower()
         if mine in ('1', 'true', 'yes') and user_data:
-            query['user_id'] = str(user_data['_id'])
-        
-        # Fetch complaints
-        raw_results = list(complaints_collection.find(query))
+            user_id = str(user_data['_id'])
+            query['user_id'] = user_id
+            sort = complaint_feed.MINE_SORT
+        limit = complaint_feed.parse_limit(request.GET.get('limit'))
+
+        # Fetch one page (lean projection, index-ordered)
+        try:
+            raw_results, next_cursor = complaint_feed.page(
+                complaints_collection, query, sort, limit, (request.GET.get('cursor') or '').strip() or None)
+        except complaint_feed.CursorError as e:
+            return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
         
         # Helper to normalize date to readable string
         def normalize_date(doc):
@@ -130,6 +62,10 @@ class ComplaintListCreateView(View):
             except Exception:
                 return d
 
+        # One $in lookup for the whole page instead of a per-row check
+        viewer_id = str(user_data['_id']) if user_data else None
+        voted = complaint_votes.voted_ids(db, [doc['_id'] for doc in raw_results], viewer_id)
+
         # Map DB docs to frontend expected shape
         mapped = []
         for doc in raw_results:
@@ -142,12 +78,13 @@ class ComplaintListCreateView(View):
                 'date': normalize_date(doc),
                 'upvotes': doc.get('upvotes', 0),
                 'status': doc.get('status', 'pending'),
+                'already_upvoted': doc['_id'] in voted,
             })
-        
-        # Sort by upvotes descending by default
-        mapped.sort(key=lambda x: x.get('upvotes', 0), reverse=True)
 
-        return JsonResponse({'success': True, 'data': mapped})
+        page_info = {'next_cursor': next_cursor, 'limit': limit}
+        if (request.GET.get('total') or '').strip().lower() in ('1', 'true', 'yes'):
+            page_info['total'] = complaint_feed.total(db, user_id)
+        return JsonResponse({'success': True, 'data': mapped, 'page': page_info})
 
     def post(self, request):
         try:
@@ -192,9 +129,7 @@ class ComplaintListCreateView(View):
                 'urgency': urgency,
                 'status': 'open',
                 'created_at': int(time.time() * 1000),  # Store as timestamp
-                'geo': data.get('geo', {}),
-                'upvotes': 0,
-                'upvoters': [],  # list of user_id strings who upvoted
+                'upvotes': 0,  # votes themselves live in complaint_votes
             }
             # Map additional frontend fields
             if title:
@@ -203,33 +138,90 @@ class ComplaintListCreateView(View):
                 complaint_doc['category'] = category
             if location:
                 complaint_doc['location'] = location
-
-            # Handle document upload if provided
+            # Stored as a GeoJSON point (2dsphere-indexed) or not at all
+            raw_geo = data.get('geo')
+            if isinstance(raw_geo, str):
+                try:
+                    raw_geo = json.loads(raw_geo)  # multipart forms send it as JSON text
+                except ValueError:
+                    raw_geo = None
+            if not raw_geo and data.get('lat') is not None:
+                raw_geo = {'lat': data.get('lat'), 'lng': data.get('lng')}
+            if raw_geo:
+                point = complaint_geo.normalize(raw_geo)
+                if point is None:
+                    msg = 'geo must be {lat, lng} or a GeoJSON Point'
+                    return JsonResponse({'success': False, 'error': {'message': msg}}, status=400)
+                complaint_doc['geo'] = point
+
+            # Handle document upload if provided: hashed while it streams, stored once per content
             if uploaded_file:
-                rel_dir = 'complaints'
-                os.makedirs(os.path.join(settings.MEDIA_ROOT, rel_dir), exist_ok=True)
-                safe_name = f"{int(time.time()*1000)}_{uploaded_file.name}"
-                abs_path = os.path.join(settings.MEDIA_ROOT, rel_dir, safe_name)
-                with open(abs_path, 'wb') as dest:
-                    for chunk in uploaded_file.chunks():
-                        dest.write(chunk)
-                # Build public URL
-                url_path = f"{rel_dir}/{safe_name}"
-                relative_url = settings.MEDIA_URL.rstrip('/') + '/' + url_path.replace('\\', '/')
-                # Return absolute URL so SPA on different origin can open it directly
-                document_url = request.build_absolute_uri(relative_url)
-                complaint_doc['document_url'] = document_url
+                attachment = complaint_attachments.store(db, uploaded_file.chunks(), uploaded_file.name,
+                                                         uploaded_file.content_type)
+                complaint_doc['attachment'] = attachment
+                # Relative; ComplaintDetailView returns it absolute for the SPA on another origin
+                complaint_doc['document_url'] = complaint_attachments.url_path(attachment['sha256'])
             
             # Add user reference if available
             complaint_doc['user_id'] = str(user_data['_id'])
+
+            # Look for near-identical complaints before this one joins the index
+            try:
+                signature, similar = complaint_duplicates.find_similar(db, description)
+            except Exception:
+                signature, similar = None, []
             
             # Insert complaint
-            result = complaints_collection.insert_one(complaint_doc)
-            return JsonResponse({'success': True, 'data': {'id': str(result.inserted_id)}})
+            try:
+                result = complaints_collection.insert_one(complaint_doc)
+            except Exception:
+                if uploaded_file:
+                    complaint_attachments.release(db, complaint_doc['attachment']['sha256'])
+                raise
+            complaint_feed.count_created(db, complaint_doc['user_id'])
+            # Sentiment is labelled once in the background (manage.py label_sentiment)
+            enqueue_sentiment(db, 'complaints', result.inserted_id, description)
+            complaint_duplicates.remember(db, result.inserted_id, signature, complaint_doc['created_at'])
+            data = {'id': str(result.inserted_id)}
+            if similar:
+                # The client can offer to upvote one of these instead
+                data['possible_duplicates'] = _duplicate_rows(similar, complaint_doc['user_id'])
+            return JsonResponse({'success': True, 'data': data})
         except Exception as e:
             return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
 
 
+def _duplicate_rows(similar, user_id):
+    """Open candidates from complaint_duplicates.find_similar, in similarity order."""
+    from bson import ObjectId
+    scores = {}
+    for cid, score in similar:
+        scores[ObjectId(cid) if ObjectId.is_valid(cid) else cid] = score
+    try:
+        docs = {d['_id']: d for d in db['complaints'].find(
+            {'_id': {'$in': list(scores)}, 'status': {'$ne': 'closed'}},
+            {'title': 1, 'topic': 1, 'description': 1, 'region': 1, 'location': 1, 'upvotes': 1, 'status': 1})}
+        voted = complaint_votes.voted_ids(db, list(docs), user_id)
+    except Exception:
+        return []
+    rows = []
+    for oid, score in scores.items():
+        doc = docs.get(oid)
+        if doc is None:
+            continue
+        rows.append({
+            'id': str(oid),
+            'title': doc.get('title') or (doc.get('topic') or 'Complaint'),
+            'description': (doc.get('description') or '')[:200],
+            'location': doc.get('location') or doc.get('region') or 'Unknown',
+            'upvotes': doc.get('upvotes', 0),
+            'status': doc.get('status', 'pending'),
+            'similarity': score,
+            'already_upvoted': oid in voted,
+        })
+    return rows
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ComplaintHeatmapView(View):
     """Return complaint counts per region for heatmap preview.
@@ -283,15 +275,14 @@ class ComplaintDetailView(View):
             except Exception:
                 pass
             query = {'_id': oid} if oid else {'_id': pk}
-            complaint = complaints_collection.find_one(query)
+            complaint = complaints_collection.find_one(query, {'upvoters': 0})
             if not complaint:
                 return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
             
-            # Compute already_upvoted for current user
+            # Compute already_upvoted for current user (point lookup on complaint_votes)
             user_data = getattr(request, 'user_data', None)
             user_id = str(user_data['_id']) if user_data else None
-            upvoters = complaint.get('upvoters', [])
-            already_upvoted = bool(user_id and user_id in upvoters)
+            already_upvoted = complaint_votes.has_voted(db, complaint['_id'], user_id)
 
             # Helper to normalize date
             def normalize_date_detail(doc):
@@ -322,6 +313,8 @@ class ComplaintDetailView(View):
                 'status': complaint.get('status', 'pending'),
                 'already_upvoted': already_upvoted,
                 'document_url': doc_url,
+                'attachment': complaint.get('attachment'),
+                'geo': complaint.get('geo'),
             }
             return JsonResponse({'success': True, 'data': data})
         except Exception as e:
@@ -362,16 +355,18 @@ class ComplaintDetailView(View):
             except Exception:
                 id_query = {'_id': pk}
 
-            res = complaints.update_one(id_query, {'$set': updates})
-            if res.matched_count == 0:
+            # Update and read back in one round trip
+            doc = complaints.find_one_and_update(id_query, {'$set': updates}, projection={'upvoters': 0},
+                                                 return_document=ReturnDocument.AFTER)
+            if doc is None:
                 return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
-            doc = complaints.find_one(id_query)
 
-            # If assignee updated and looks like an email, attempt to send notification
+            # If assignee updated and looks like an email, queue a notification (run_mail_sender delivers it)
             if 'assignee' in updates:
                 assignee_val = str(updates.get('assignee') or '')
                 if assignee_val and re.search(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", assignee_val):
-                    _send_assignment_email_safe(assignee_val, doc or {})
+                    subject, body = outbox.assignment_message(doc)
+                    outbox.enqueue(db, assignee_val, subject, body, kind='complaint_assignment', ref=doc['_id'])
             data = {
                 'id': str(doc.get('_id')),
                 'status': doc.get('status', 'open'),
@@ -387,7 +382,6 @@ class ComplaintUpvoteView(View):
     def post(self, request, pk):
         try:
             from bson import ObjectId
-            complaints_collection = db['complaints']
 
             # Require auth
             user_data = getattr(request, 'user_data', None)
@@ -403,33 +397,106 @@ class ComplaintUpvoteView(View):
                 pass
             id_query = {'_id': oid} if oid else {'_id': pk}
 
-            # Use atomic update to add to upvoters if not present and increment upvotes
-            update_result = complaints_collection.update_one(
-                {
-                    **id_query,
-                    'upvoters': { '$ne': user_id },
-                },
-                {
-                    '$addToSet': { 'upvoters': user_id },
-                    '$inc': { 'upvotes': 1 },
-                }
-            )
-
-            if update_result.modified_count == 0:
-                # Either not found or already upvoted
-                existing = complaints_collection.find_one(id_query)
-                if not existing:
-                    return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
-                return JsonResponse({'success': True, 'data': {
-                    'upvotes': existing.get('upvotes', 0),
-                    'already_upvoted': True,
-                }})
-
-            # Fetch updated doc
-            updated = complaints_collection.find_one(id_query)
+            # The unique (complaint_id, user_id) vote decides; only a new vote bumps the counter
+            result = complaint_votes.upvote(db, id_query['_id'], user_id)
+            if result is None:
+                return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
             return JsonResponse({'success': True, 'data': {
-                'upvotes': updated.get('upvotes', 0),
+                'upvotes': result['upvotes'],
                 'already_upvoted': True,
             }})
         except Exception as e:
             return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ComplaintAttachmentView(View):
+    """Serve a stored attachment by its SHA-256. The content at a hash never changes, so it is
+    cacheable forever and the hash doubles as the ETag."""
+    def get(self, request, sha256):
+        if not complaint_attachments.is_sha256(sha256):
+            return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
+        etag = f'"{sha256}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        meta = db[complaint_attachments.ATTACHMENTS].find_one({'_id': sha256}, {'mime': 1})
+        if not meta:
+            return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
+        try:
+            handle = open(complaint_attachments.absolute_path(sha256), 'rb')
+        except FileNotFoundError:
+            return JsonResponse({'success': False, 'error': {'message': 'Not found'}}, status=404)
+        mime = meta.get('mime') or complaint_attachments.DEFAULT_MIME
+        response = FileResponse(handle, content_type=mime)
+        response['ETag'] = etag
+        response['X-Content-Type-Options'] = 'nosniff'
+        if not complaint_attachments.is_inline(mime):
+            response['Content-Disposition'] = f'attachment; filename="{sha256}"'
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+def _geo_rows(docs, origin=None):
+    rows = []
+    for doc in docs:
+        lat, lng = complaint_geo.lat_lng(doc)
+        row = {
+            'id': str(doc.get('_id')),
+            'title': doc.get('title') or (doc.get('topic') or 'Complaint'),
+            'category': doc.get('category') or doc.get('topic') or 'general',
+            'status': doc.get('status', 'pending'),
+            'upvotes': doc.get('upvotes', 0),
+            'lat': lat,
+            'lng': lng,
+        }
+        if origin is not None and lat is not None:
+            row['distance_m'] = round(complaint_geo.distance_m(origin[0], origin[1], lng, lat))
+        rows.append(row)
+    return rows
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ComplaintGeoBoxView(View):
+    """Complaints located inside a map viewport.
+    Query params: bbox=minLng,minLat,maxLng,maxLat (required), status, limit (default 200, max 1000).
+    For zoomed-out views use the admin clusters endpoint instead of raw points.
+    """
+    def get(self, request):
+        try:
+            box = complaint_geo.parse_bbox(request.GET.get('bbox'))
+        except complaint_geo.GeoError as e:
+            return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
+        query = complaint_geo.within_box(box)
+        status = (request.GET.get('status') or '').lower().strip()
+        if status in ('open', 'closed'):
+            query['status'] = status
+        limit = complaint_geo.parse_limit(request.GET.get('limit'))
+        docs = list(db['complaints'].find(query, complaint_geo.POINT_FIELDS).limit(limit))
+        return JsonResponse({'success': True, 'data': _geo_rows(docs), 'truncated': len(docs) >= limit})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ComplaintGeoNearView(View):
+    """Complaints nearest to a point, closest first.
+    Query params: lat, lng (required), radius_m (default 5000, max 200000), status, limit.
+    """
+    def get(self, request):
+        origin = complaint_geo.point(request.GET.get('lng'), request.GET.get('lat'))
+        if origin is None:
+            return JsonResponse({'success': False, 'error': {'message': 'lat and lng are required'}}, status=400)
+        lng, lat = origin['coordinates']
+        try:
+            radius = float(request.GET.get('radius_m') or complaint_geo.DEFAULT_RADIUS_M)
+        except ValueError:
+            radius = complaint_geo.DEFAULT_RADIUS_M
+        radius = max(1.0, min(radius, complaint_geo.MAX_RADIUS_M))
+        query = complaint_geo.near(lng, lat, radius)
+        status = (request.GET.get('status') or '').lower().strip()
+        if status in ('open', 'closed'):
+            query['status'] = status
+        limit = complaint_geo.parse_limit(request.GET.get('limit'))
+        docs = list(db['complaints'].find(query, complaint_geo.POINT_FIELDS).limit(limit))
+        return JsonResponse({'success': True, 'data': _geo_rows(docs, origin=(lng, lat)),
+                             'radius_m': radius})
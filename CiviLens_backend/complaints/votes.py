@@ -0,0 +1,86 @@
+"""Complaint upvotes, one document per (complaint, user) in VOTES.
+
+The unique (complaint_id, user_id) index makes a vote idempotent: a second insert by the
+same user fails with a duplicate key, and only a successful insert increments the
+complaint's `upvotes` counter. Complaints therefore stay a fixed size however popular they
+get. already_upvoted is a point lookup on that index, or one `$in` query for a whole feed
+page. upvote creates the index once per process before it counts the first vote, so
+votes cannot be double counted on a database that was never migrated.
+
+`manage.py migrate_complaint_votes` moves the legacy `upvoters` arrays into VOTES. Until
+it has run, upvote also skips users already listed in a complaint's `upvoters`.
+"""
+import time
+from typing import Any, Iterable, List, Optional, Set
+
+from pymongo import InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+VOTES = 'complaint_votes'
+DUPLICATE_KEY = 11000
+
+_index_ready = False
+
+
+def ensure_indexes(mongo_db):
+    mongo_db[VOTES].create_index([('complaint_id', 1), ('user_id', 1)], unique=True)
+
+
+def _ensure_index_once(mongo_db):
+    # Raises while the index cannot be built (e.g. duplicate votes), so no vote is counted
+    global _index_ready
+    if not _index_ready:
+        ensure_indexes(mongo_db)
+        _index_ready = True
+
+
+def upvote(mongo_db, complaint_id, user_id: str) -> Optional[dict]:
+    """Record the vote and return {'upvotes', 'added'}, or None if the complaint does not exist."""
+    _ensure_index_once(mongo_db)
+    try:
+        mongo_db[VOTES].insert_one({'complaint_id': complaint_id, 'user_id': user_id,
+                                    'created_at': int(time.time() * 1000)})
+    except DuplicateKeyError:
+        doc = mongo_db['complaints'].find_one({'_id': complaint_id}, {'upvotes': 1})
+        return {'upvotes': doc.get('upvotes', 0), 'added': False} if doc else None
+    doc = mongo_db['complaints'].find_one_and_update(
+        {'_id': complaint_id, 'upvoters': {'$ne': user_id}}, {'$inc': {'upvotes': 1}},
+        projection={'upvotes': 1}, return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        return {'upvotes': doc.get('upvotes', 0), 'added': True}
+    doc = mongo_db['complaints'].find_one({'_id': complaint_id}, {'upvotes': 1})
+    if doc is None:
+        # Unknown complaint: take the orphan vote back
+        mongo_db[VOTES].delete_one({'complaint_id': complaint_id, 'user_id': user_id})
+        return None
+    # Counted in the legacy upvoters array; the new vote document now records it
+    return {'upvotes': doc.get('upvotes', 0), 'added': False}
+
+
+def has_voted(mongo_db, complaint_id, user_id: Optional[str]) -> bool:
+    if not user_id:
+        return False
+    return mongo_db[VOTES].find_one({'complaint_id': complaint_id, 'user_id': user_id}, {'_id': 1}) is not None
+
+
+def voted_ids(mongo_db, complaint_ids: Iterable[Any], user_id: Optional[str]) -> Set[Any]:
+    """The subset of complaint_ids the user has upvoted, in one query."""
+    ids = list(complaint_ids)
+    if not user_id or not ids:
+        return set()
+    rows = mongo_db[VOTES].find({'user_id': user_id, 'complaint_id': {'$in': ids}}, {'complaint_id': 1, '_id': 0})
+    return {r['complaint_id'] for r in rows}
+
+
+def insert_votes(mongo_db, votes: List[dict]) -> int:
+    """Unordered insert that skips votes already present; returns how many were new."""
+    if not votes:
+        return 0
+    try:
+        return mongo_db[VOTES].bulk_write([InsertOne(v) for v in votes], ordered=False).inserted_count
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(err.get('code') != DUPLICATE_KEY for err in errors):
+            raise
+        return len(votes) - len(errors)
@@ -0,0 +1,267 @@
+"""Transactional email outbox.
+
+Request handlers never talk to SMTP. They `enqueue` a message in OUTBOX, which is one
+insert, and `manage.py run_mail_sender` delivers it. The worker keeps one authenticated
+SMTP connection open across batches and reconnects only when the server drops it.
+Delivery state lives on the outbox document:
+
+    pending -> sending -> sent
+                       -> pending (temporary failure, retried after next_attempt_at)
+                       -> failed  (permanent 5xx, or MAX_ATTEMPTS reached)
+
+Only failures of the message itself count towards MAX_ATTEMPTS. While the server cannot
+be reached or refuses the login, messages are put back with a backoff of their own
+(`session_failures`, capped at BACKOFF_MAX_S) and keep their attempts, so an outage delays
+mail but never fails it.
+
+A batch is claimed with a lease, so a worker that dies mid-batch only delays its
+messages: once lease_until passes they are claimed again. Timestamps are epoch ms like
+the rest of the API's writes.
+
+SMTP settings come from the environment: EMAIL_HOST, EMAIL_PORT (587), EMAIL_HOST_USER,
+EMAIL_HOST_PASSWORD, EMAIL_USE_TLS (true) and EMAIL_FROM / SMTP_SENDER.
+"""
+import os
+import random
+import smtplib
+import time
+import uuid
+from email.mime.text import MIMEText
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+OUTBOX = 'email_outbox'
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_S = 30
+BACKOFF_MAX_S = 3600
+LEASE_S = 300
+# Reuse an idle connection only after a NOOP confirms the server still has it open
+KEEPALIVE_CHECK_S = 30
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def ensure_indexes(mongo_db):
+    mongo_db[OUTBOX].create_index([('status', 1), ('next_attempt_at', 1)])
+
+
+def enqueue(mongo_db, to: str, subject: str, body: str, kind: str = '', ref: Any = None) -> bool:
+    """Queue one plain-text email. Never raises: a failed enqueue only loses the notification."""
+    if not (to or '').strip():
+        return False
+    now = _now_ms()
+    try:
+        mongo_db[OUTBOX].insert_one({
+            'to': to.strip(),
+            'subject': subject,
+            'body': body,
+            'kind': kind,
+            'ref': ref,
+            'status': PENDING,
+            'attempts': 0,
+            'created_at': now,
+            'next_attempt_at': now,
+        })
+        return True
+    except Exception:
+        return False
+
+
+def assignment_message(complaint_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """(subject, body) telling an assignee about a complaint."""
+    title = complaint_doc.get('title') or complaint_doc.get('topic') or 'Complaint'
+    cid = str(complaint_doc.get('_id') or complaint_doc.get('id') or '')
+    region = complaint_doc.get('region') or complaint_doc.get('location') or complaint_doc.get('state') or '—'
+    status = (complaint_doc.get('status') or 'open').title()
+    summary = (complaint_doc.get('description') or '')[:400]
+    frontend_base = os.environ.get('FRONTEND_BASE_URL') or ''
+    link = f"{frontend_base.rstrip('/')}/admin/complaints" if frontend_base else ''
+
+    body = (
+        f"You have been assigned a complaint on CiviLens.\n\n"
+        f"Title: {title}\n"
+        f"ID: {cid}\n"
+        f"Region: {region}\n"
+        f"Status: {status}\n"
+        f"Summary: {summary}\n"
+        + (f"\nView: {link}\n" if link else "\n")
+        + "\nPlease log in to review and take action."
+    )
+    return f"CiviLens • New Complaint Assigned: {title}", body
+
+
+# -------------------- delivery --------------------
+def smtp_config() -> Dict[str, Any]:
+    user = os.environ.get('EMAIL_HOST_USER') or ''
+    return {
+        'host': os.environ.get('EMAIL_HOST') or '',
+        'port': int(os.environ.get('EMAIL_PORT') or 587),
+        'user': user,
+        'password': os.environ.get('EMAIL_HOST_PASSWORD') or '',
+        'use_tls': os.environ.get('EMAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes'),
+        'from_addr': os.environ.get('EMAIL_FROM') or os.environ.get('SMTP_SENDER') or user,
+        'timeout': 15,
+    }
+
+
+class SmtpSender:
+    """One SMTP session reused across messages: connect, STARTTLS and login happen once, and
+    again only after the server drops the connection."""
+
+    def __init__(self, host: str, port: int, user: str = '', password: str = '', use_tls: bool = True,
+                 from_addr: str = '', timeout: float = 15):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.use_tls, self.from_addr, self.timeout = use_tls, from_addr or user, timeout
+        self.connections = 0
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional['SmtpSender']:
+        cfg = smtp_config()
+        if not cfg['host'] or not cfg['from_addr']:
+            return None
+        return cls(**cfg)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def _session(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > KEEPALIVE_CHECK_S:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._smtp is None:
+            self._connect()
+        return self._smtp
+
+    def send(self, to: str, subject: str, body: str):
+        msg = MIMEText(body, 'plain', 'utf-8')
+        msg['Subject'] = subject
+        msg['From'] = self.from_addr
+        msg['To'] = to
+        for attempt in (1, 2):
+            smtp = self._session()
+            try:
+                smtp.sendmail(self.from_addr, [to], msg.as_string())
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Dropped between messages: reconnect once, then let the caller back off
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self._smtp.close()
+            except OSError:
+                pass
+        self._smtp = None
+
+
+def is_permanent(exc: BaseException) -> bool:
+    """5xx replies about the message (unknown mailbox, rejected sender) will not succeed on retry.
+    Login failures are about the worker's configuration, not the message, so they are retried."""
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    code = getattr(exc, 'smtp_code', None)
+    return isinstance(code, int) and code >= 500
+
+
+def backoff_s(attempts: int) -> float:
+    """Exponential backoff with jitter after `attempts` failed tries."""
+    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def outcome(doc: Dict[str, Any], error: Optional[BaseException], now_ms: int,
+            max_attempts: int = MAX_ATTEMPTS, session_down: bool = False) -> Dict[str, Any]:
+    """The $set that records one delivery attempt of an outbox document. With `session_down`
+    the message never reached the server, so it is retried without using up an attempt."""
+    if error is None:
+        return {'status': SENT, 'sent_at': now_ms, 'last_error': None}
+    if session_down:
+        failures = int(doc.get('session_failures') or 0) + 1
+        return {'status': PENDING, 'session_failures': failures,
+                'last_error': f'{type(error).__name__}: {error}'[:500],
+                'next_attempt_at': now_ms + int(backoff_s(failures) * 1000)}
+    attempts = int(doc.get('attempts') or 0) + 1
+    update = {'attempts': attempts, 'last_error': f'{type(error).__name__}: {error}'[:500]}
+    if is_permanent(error) or attempts >= max_attempts:
+        update.update(status=FAILED, failed_at=now_ms)
+    else:
+        update.update(status=PENDING, next_attempt_at=now_ms + int(backoff_s(attempts) * 1000))
+    return update
+
+
+def claim(mongo_db, limit: int, lease_s: int = LEASE_S) -> List[Dict[str, Any]]:
+    """Lease up to `limit` due messages to this worker (expired leases of dead workers included)."""
+    now = _now_ms()
+    due = {'$or': [
+        {'status': PENDING, 'next_attempt_at': {'$lte': now}},
+        {'status': SENDING, 'lease_until': {'$lt': now}},
+    ]}
+    ids = [d['_id'] for d in mongo_db[OUTBOX].find(due, {'_id': 1}).sort('next_attempt_at', 1).limit(limit)]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    mongo_db[OUTBOX].update_many({'_id': {'$in': ids}, **due}, {'$set': {
+        'status': SENDING, 'claim': token, 'lease_until': now + lease_s * 1000,
+    }})
+    return list(mongo_db[OUTBOX].find({'claim': token, 'status': SENDING}))
+
+
+# Errors that concern the SMTP session rather than one message
+_SESSION_ERRORS = (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected, smtplib.SMTPAuthenticationError)
+
+
+def deliver(mongo_db, sender: SmtpSender, docs: List[Dict[str, Any]],
+            max_attempts: int = MAX_ATTEMPTS) -> Dict[str, int]:
+    """Send claimed messages over the sender's session and record each result in one bulk write.
+    If the server cannot be reached or refuses the login, that message and the rest of the batch
+    are put back with session backoff instead of being tried message by message."""
+    counts = {SENT: 0, PENDING: 0, FAILED: 0}
+    ops = []
+    unreachable = None
+    for doc in docs:
+        error = unreachable
+        if error is None:
+            try:
+                sender.send(doc['to'], doc.get('subject') or '', doc.get('body') or '')
+            except smtplib.SMTPException as e:
+                error = e
+                if isinstance(e, _SESSION_ERRORS):
+                    unreachable = e
+            except OSError as e:  # socket-level; SMTPException subclasses OSError, so it is handled above
+                error = unreachable = e
+        update = outcome(doc, error, _now_ms(), max_attempts, session_down=unreachable is not None)
+        counts[update['status']] += 1
+        ops.append(UpdateOne({'_id': doc['_id'], 'claim': doc.get('claim')},
+                             {'$set': update, '$unset': {'claim': '', 'lease_until': ''}}))
+    if ops:
+        mongo_db[OUTBOX].bulk_write(ops, ordered=False)
+    return counts
@@ -0,0 +1,448 @@
+"""Test helpers shared by the app test suites."""
+import base64
+import copy
+import socketserver
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+class RecordingDB:
+    """Stand-in for db_connection.db that records every collection method call. Each pymongo
+    collection call is one round trip, so `calls` is the request's round-trip log.
+
+    Canned results are set per collection and method; exceptions are raised:
+        fake['users'].results['insert_one'] = DuplicateKeyError('dup')
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = _RecordingCollection(name, self.calls)
+        return self._collections[name]
+
+
+class _RecordingCollection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.results = {}
+        self._calls = calls
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            self._calls.append((self.name, method))
+            result = self.results.get(method)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        return call
+
+
+class MemoryDB:
+    """In-process stand-in for db_connection.db with enough query semantics for stateful tests
+    (dedup on resend, watermarks). Filters support equality, dotted paths, $gt/$gte/$lt/$lte/
+    $ne/$in/$nin/$exists and $or/$and; updates support $set/$unset/$inc/$setOnInsert/$push.
+    Unique indexes (and _id) raise DuplicateKeyError / BulkWriteError with code 11000.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = _MemoryCollection(name)
+        return self._collections[name]
+
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _type_class(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'number'
+    for cls, name in ((str, 'string'), (datetime, 'date'), (ObjectId, 'objectid')):
+        if isinstance(value, cls):
+            return name
+    return type(value).__name__
+
+
+def _compare(value, op, arg):
+    # Range operators only match within one BSON type class, as in MongoDB
+    if value is _MISSING or value is None or _type_class(value) != _type_class(arg):
+        return False
+    return {'$gt': value > arg, '$gte': value >= arg, '$lt': value < arg, '$lte': value <= arg}[op]
+
+
+def _equals(value, arg):
+    if value is _MISSING:
+        return arg is None
+    if isinstance(value, list) and not isinstance(arg, list):
+        return arg in value
+    return value == arg
+
+
+def _matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == '$or':
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        if key == '$and':
+            if not all(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = _get_path(doc, key)
+        if isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond):
+            for op, arg in cond.items():
+                if op in ('$gt', '$gte', '$lt', '$lte'):
+                    ok = _compare(value, op, arg)
+                elif op == '$eq':
+                    ok = _equals(value, arg)
+                elif op == '$ne':
+                    ok = not _equals(value, arg)
+                elif op == '$in':
+                    ok = any(_equals(value, a) for a in arg)
+                elif op == '$nin':
+                    ok = not any(_equals(value, a) for a in arg)
+                elif op == '$exists':
+                    ok = (value is not _MISSING) == bool(arg)
+                else:
+                    raise ValueError(f'MemoryDB does not support {op}')
+                if not ok:
+                    return False
+        elif not _equals(value, cond):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != '_id'}
+    if include:
+        out = {}
+        for path in include:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(out, path, copy.deepcopy(value))
+    else:
+        out = copy.deepcopy(doc)
+        for path, v in projection.items():
+            if not v:
+                _unset_path(out, path)
+    if projection.get('_id', 1) and '_id' in doc:
+        out['_id'] = doc['_id']
+    else:
+        out.pop('_id', None)
+    return out
+
+
+def _sort_key(value):
+    # MongoDB order across types: missing/null < numbers < strings < objects < ObjectId < bool < dates
+    order = {'number': 1, 'string': 2, 'dict': 3, 'objectid': 5, 'bool': 6, 'date': 7}
+    if value is _MISSING or value is None:
+        return (0, 0)
+    return (order.get(_type_class(value), 4), value if not isinstance(value, dict) else str(value))
+
+
+class _MemoryCursor:
+    def __init__(self, docs, projection):
+        self._docs, self._projection = docs, projection
+        self._skip, self._limit = 0, 0
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        for field, d in reversed(keys):
+            self._docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=d < 0)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([_project(d, self._projection) for d in docs])
+
+
+class _MemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self._unique = []
+
+    # -------------------- indexes --------------------
+    def create_index(self, keys, unique=False, **kwargs):
+        fields = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return '_'.join(fields)
+
+    def drop(self):
+        self.docs, self._unique = [], []
+
+    def _check_unique(self, doc, ignore=None):
+        for fields in [['_id']] + self._unique:
+            key = [_get_path(doc, f) for f in fields]
+            if all(k is _MISSING for k in key) and fields != ['_id']:
+                continue
+            for other in self.docs:
+                if other is not ignore and [_get_path(other, f) for f in fields] == key:
+                    raise DuplicateKeyError(f'E11000 duplicate key {dict(zip(fields, key))}', 11000)
+
+    # -------------------- reads --------------------
+    def find(self, query=None, projection=None, **kwargs):
+        return _MemoryCursor([d for d in self.docs if _matches(d, query)], projection)
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        return next(iter(self.find(query, projection).limit(1)), None)
+
+    def count_documents(self, query, **kwargs):
+        return sum(1 for d in self.docs if _matches(d, query))
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    # -------------------- writes --------------------
+    def insert_one(self, doc):
+        doc.setdefault('_id', ObjectId())
+        self._check_unique(doc)
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    def insert_many(self, docs, ordered=True):
+        return self.bulk_write([InsertOne(d) for d in docs], ordered=ordered)
+
+    def _apply(self, doc, update, inserting):
+        for op, fields in update.items():
+            for path, arg in fields.items():
+                if op == '$set' or (op == '$setOnInsert' and inserting):
+                    _set_path(doc, path, copy.deepcopy(arg))
+                elif op == '$unset':
+                    _unset_path(doc, path)
+                elif op == '$inc':
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, (0 if current is _MISSING else current) + arg)
+                elif op == '$push':
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, ([] if current is _MISSING else current) + [arg])
+                elif op != '$setOnInsert':
+                    raise ValueError(f'MemoryDB does not support {op}')
+
+    def _update(self, query, update, upsert, many, replace=False):
+        matched = [d for d in self.docs if _matches(d, query)]
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            new = copy.deepcopy(doc)
+            if replace:
+                new = {'_id': doc['_id'], **copy.deepcopy(update)}
+            else:
+                self._apply(new, update, inserting=False)
+            self._check_unique(new, ignore=doc)
+            doc.clear()
+            doc.update(new)
+        upserted_id = None
+        if not matched and upsert:
+            new = {k: copy.deepcopy(v) for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+            if replace:
+                new.update(copy.deepcopy(update))
+            else:
+                self._apply(new, update, inserting=True)
+            upserted_id = self.insert_one(new).inserted_id
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=True)
+
+    def replace_one(self, query, doc, upsert=False):
+        return self._update(query, doc, upsert, many=False, replace=True)
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        before = self.find_one(query)
+        result = self._update(query, update, upsert, many=False)
+        if return_document == ReturnDocument.AFTER:
+            target = before['_id'] if before else result.upserted_id
+            return None if target is None else self.find_one({'_id': target}, projection)
+        return None if before is None else _project(before, projection)
+
+    def delete_one(self, query):
+        for i, d in enumerate(self.docs):
+            if _matches(d, query):
+                del self.docs[i]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    def bulk_write(self, ops, ordered=True):
+        errors, inserted = [], 0
+        for i, op in enumerate(ops):
+            try:
+                if isinstance(op, InsertOne):
+                    self.insert_one(op._doc)
+                    inserted += 1
+                elif isinstance(op, (UpdateOne, UpdateMany)):
+                    self._update(op._filter, op._doc, op._upsert, many=isinstance(op, UpdateMany))
+                elif isinstance(op, ReplaceOne):
+                    self.replace_one(op._filter, op._doc, op._upsert)
+                elif isinstance(op, (DeleteOne, DeleteMany)):
+                    (self.delete_many if isinstance(op, DeleteMany) else self.delete_one)(op._filter)
+                else:
+                    raise ValueError(f'MemoryDB does not support {type(op).__name__}')
+            except DuplicateKeyError as e:
+                errors.append({'index': i, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': inserted})
+        return SimpleNamespace(inserted_count=inserted)
+
+
+class LocalSMTPServer:
+    """Minimal SMTP stand-in on 127.0.0.1 for delivery tests (no TLS).
+
+    Speaks EHLO / AUTH PLAIN / MAIL / RCPT / DATA / RSET / NOOP / QUIT, records each
+    connection, login and message, and can be told to reject recipients (`reject`, 550) or
+    to drop the connection after a number of messages (`drop_after`).
+    """
+
+    def __init__(self, user='mailer', password='secret'):
+        self.user, self.password = user, password
+        self.messages = []
+        self.connections = 0
+        self.logins = 0
+        self.reject = set()
+        self.drop_after = None
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + '\r\n').encode('ascii'))
+
+            def handle(self):
+                stand_in.connections += 1
+                self.reply('220 localhost stand-in')
+                sent, rcpts, sender = 0, [], None
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw:
+                        return
+                    line = raw.decode('utf-8').rstrip('\r\n')
+                    verb = line.split(' ', 1)[0].upper()
+                    if verb in ('EHLO', 'HELO'):
+                        self.reply('250-localhost')
+                        self.reply('250 AUTH PLAIN')
+                    elif verb == 'AUTH':
+                        _, user, password = base64.b64decode(line.split()[-1]).decode('utf-8').split('\0')
+                        if (user, password) == (stand_in.user, stand_in.password):
+                            stand_in.logins += 1
+                            self.reply('235 Authentication successful')
+                        else:
+                            self.reply('535 Authentication failed')
+                    elif verb == 'MAIL':
+                        sender, rcpts = line.split(':', 1)[1].strip(' <>'), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        rcpt = line.split(':', 1)[1].strip(' <>')
+                        if rcpt in stand_in.reject:
+                            self.reply('550 No such user')
+                        else:
+                            rcpts.append(rcpt)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = []
+                        while True:
+                            chunk = self.rfile.readline().decode('utf-8')
+                            if chunk in ('.\r\n', '.\n', ''):
+                                break
+                            data.append(chunk)
+                        stand_in.messages.append({'from': sender, 'to': rcpts, 'data': ''.join(data)})
+                        sent += 1
+                        self.reply('250 OK queued')
+                        if stand_in.drop_after is not None and sent >= stand_in.drop_after:
+                            stand_in.drop_after = None
+                            return
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
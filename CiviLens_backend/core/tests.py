@@ -0,0 +1,82 @@
+import smtplib
+
+from django.test import SimpleTestCase
+
+from core import outbox
+from core.testing import LocalSMTPServer, MemoryDB, RecordingDB
+
+
+class OutboxDeliveryTest(SimpleTestCase):
+    def sender(self, server):
+        return outbox.SmtpSender('127.0.0.1', server.port, user='mailer', password='secret', use_tls=False,
+                                 from_addr='noreply@civilens.test', timeout=5)
+
+    def docs(self, n, to='officer@example.org'):
+        return [{'_id': i, 'to': to, 'subject': f'Assigned #{i}', 'body': 'Please review', 'attempts': 0,
+                 'claim': 'c1'} for i in range(n)]
+
+    def test_one_authenticated_connection_per_batch(self):
+        with LocalSMTPServer() as server:
+            sender = self.sender(server)
+            db = RecordingDB()
+            counts = outbox.deliver(db, sender, self.docs(20))
+            counts_again = outbox.deliver(db, sender, self.docs(5))
+            sender.close()
+        self.assertEqual(counts[outbox.SENT] + counts_again[outbox.SENT], 25)
+        self.assertEqual((server.connections, server.logins), (1, 1))
+        self.assertEqual(len(server.messages), 25)
+        self.assertIn('Subject: Assigned #0', server.messages[0]['data'])
+        # One bulk write records the whole batch
+        self.assertEqual(db.calls, [('email_outbox', 'bulk_write')] * 2)
+
+    def test_reconnects_after_server_drop(self):
+        with LocalSMTPServer() as server:
+            server.drop_after = 3
+            sender = self.sender(server)
+            counts = outbox.deliver(RecordingDB(), sender, self.docs(6))
+            sender.close()
+        self.assertEqual(counts[outbox.SENT], 6)
+        self.assertEqual(server.connections, 2)
+
+    def test_rejected_recipient_fails_permanently(self):
+        with LocalSMTPServer() as server:
+            server.reject.add('nobody@example.org')
+            sender = self.sender(server)
+            counts = outbox.deliver(RecordingDB(), sender,
+                                    self.docs(1, to='nobody@example.org') + self.docs(1))
+            sender.close()
+        self.assertEqual((counts[outbox.FAILED], counts[outbox.SENT]), (1, 1))
+
+    def test_unreachable_server_backs_off(self):
+        with LocalSMTPServer() as server:
+            port = server.port
+        sender = outbox.SmtpSender('127.0.0.1', port, use_tls=False, from_addr='noreply@civilens.test', timeout=2)
+        counts = outbox.deliver(RecordingDB(), sender, self.docs(3))
+        self.assertEqual(counts[outbox.PENDING], 3)
+
+    def test_outage_does_not_use_up_attempts(self):
+        with LocalSMTPServer() as server:
+            port = server.port
+        sender = outbox.SmtpSender('127.0.0.1', port, use_tls=False, from_addr='noreply@civilens.test', timeout=2)
+        db = MemoryDB()
+        db[outbox.OUTBOX].insert_many(self.docs(3))
+        # Longer than MAX_ATTEMPTS rounds of backoff against a server that is down
+        for _ in range(outbox.MAX_ATTEMPTS + 2):
+            outbox.deliver(db, sender, list(db[outbox.OUTBOX].find({})))
+        docs = list(db[outbox.OUTBOX].find({}))
+        self.assertEqual({(d['status'], d['attempts']) for d in docs}, {(outbox.PENDING, 0)})
+        self.assertEqual({d['session_failures'] for d in docs}, {outbox.MAX_ATTEMPTS + 2})
+        self.assertIn('next_attempt_at', docs[0])
+
+    def test_outcome_backoff_and_give_up(self):
+        update = outbox.outcome({'attempts': 0}, smtplib.SMTPServerDisconnected('gone'), 1000)
+        self.assertEqual(update['status'], outbox.PENDING)
+        self.assertGreaterEqual(update['next_attempt_at'], 1000 + outbox.BACKOFF_BASE_S * 800)
+        later = outbox.outcome({'attempts': 3}, smtplib.SMTPServerDisconnected('gone'), 1000)
+        self.assertGreater(later['next_attempt_at'], update['next_attempt_at'])
+        last = outbox.outcome({'attempts': outbox.MAX_ATTEMPTS - 1}, OSError('refused'), 1000)
+        self.assertEqual(last['status'], outbox.FAILED)
+        down = outbox.outcome(last, OSError('refused'), 1000, session_down=True)
+        self.assertEqual((down['status'], down['session_failures']), (outbox.PENDING, 1))
+        self.assertNotIn('attempts', down)
+        self.assertFalse(outbox.is_permanent(smtplib.SMTPAuthenticationError(535, b'bad login')))
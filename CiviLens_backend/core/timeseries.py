@@ -0,0 +1,118 @@
+"""Native MongoDB time-series layout for the append-only event collections.
+
+sentiment_records
+    timeField created_at (BSON date), metaField region, granularity hours.
+    The sentiment label is a measurement, not metadata: the label worker and
+    relabel runs write it after insert, and changing a metaField value
+    rewrites buckets.
+user_activities
+    timeField timestamp (BSON date), metaField meta = {user_id, activity_type},
+    granularity hours (per-user streams are sparse).
+
+A time-series collection needs a BSON date in the time field. Writers therefore
+store datetimes (see event_time), and readers accept them alongside the
+legacy ISO-string / epoch-ms values. `manage.py migrate_timeseries` moves
+existing data. Updates and deletes by _id on time-series collections (the
+labelling worker, relabel runs, seed wipes) need MongoDB 7.0 or newer.
+Time-series collections cannot have unique indexes, so ingest deduplicates
+through its own claim collection.
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MIN_SERVER_VERSION = (7, 0)
+
+
+def event_time(value, default: Optional[datetime] = None) -> Optional[datetime]:
+    """Naive-UTC datetime from a BSON date, epoch s / ms or an ISO string (offsets honoured)."""
+    if value is None or value == '' or isinstance(value, bool):
+        return default
+    try:
+        if isinstance(value, datetime):
+            dt = value
+        elif isinstance(value, (int, float)):
+            ts = float(value)
+            return datetime.utcfromtimestamp(ts / 1000.0 if ts > 1e11 else ts)
+        else:
+            dt = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+    except (ValueError, TypeError, OverflowError, OSError):
+        return default
+
+
+def _sentiment_record(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc['created_at'] = event_time(doc.get('created_at')) or doc['_id'].generation_time.replace(tzinfo=None)
+    return doc
+
+
+def _user_activity(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc['timestamp'] = event_time(doc.get('timestamp')) or doc['_id'].generation_time.replace(tzinfo=None)
+    if 'meta' not in doc:
+        doc['meta'] = {'user_id': doc.pop('user_id', None), 'activity_type': doc.pop('activity_type', None)}
+    return doc
+
+
+# collection -> (create_collection timeseries options, legacy document -> time-series document)
+SPECS: Dict[str, Tuple[Dict[str, str], Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    'sentiment_records': ({'timeField': 'created_at', 'metaField': 'region', 'granularity': 'hours'},
+                          _sentiment_record),
+    'user_activities': ({'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'hours'},
+                        _user_activity),
+}
+
+
+def is_timeseries(mongo_db, name: str) -> bool:
+    for info in mongo_db.list_collections(filter={'name': name}):
+        return info.get('type') == 'timeseries'
+    return False
+
+
+def server_version(mongo_db) -> Tuple[int, ...]:
+    return tuple(mongo_db.client.server_info().get('versionArray', [0])[:2])
+
+
+def ensure_indexes(mongo_db):
+    """Time-series collections have no _id index; labelling and relabel runs look documents up
+    and update them by _id."""
+    from pymongo.errors import OperationFailure
+    for name in SPECS:
+        if is_timeseries(mongo_db, name):
+            try:
+                mongo_db[name].create_index([('_id', 1)])
+            except OperationFailure:
+                pass  # server without secondary indexes on measurements; lookups fall back to scans
+
+
+def backup_name(name: str) -> str:
+    return f'{name}_pre_timeseries'
+
+
+def migrate(mongo_db, name: str, batch_size: int = 5000, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Move `name` into a new time-series collection of the same name and return the documents
+    copied. The original collection is kept as backup_name(name) until the caller drops it."""
+    options, convert = SPECS[name]
+    backup = backup_name(name)
+    existing = mongo_db.list_collection_names()
+    if backup in existing:
+        raise RuntimeError(f'{backup} already exists; drop or restore it before migrating again')
+    if name in existing:
+        mongo_db[name].rename(backup)
+    mongo_db.create_collection(name, timeseries=options)
+
+    target = mongo_db[name]
+    copied = 0
+    batch = []
+    for doc in mongo_db[backup].find({}).sort('_id', 1).batch_size(batch_size):
+        batch.append(convert(doc))
+        if len(batch) >= batch_size:
+            target.insert_many(batch, ordered=False)
+            copied += len(batch)
+            batch = []
+            if progress:
+                progress(copied)
+    if batch:
+        target.insert_many(batch, ordered=False)
+        copied += len(batch)
+    return copied
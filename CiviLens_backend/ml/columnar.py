@@ -0,0 +1,89 @@
+import os
+from typing import Dict, List, Any, Optional
+
+# Optional dependency: pyarrow powers the Parquet / Arrow IPC data path.
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+    import pyarrow.ipc as ipc  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+    ipc = None  # type: ignore
+
+FORMATS = ('csv', 'parquet', 'arrow')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Typed column layout for the synthetic datasets. Low-cardinality strings are
+# dictionary-encoded so region/status columns cost a few bytes per row.
+if pa is not None:
+    _DICT_STR = pa.dictionary(pa.int16(), pa.string())
+    SCHEMAS = {
+        'schemes': pa.schema([
+            ('scheme_id', pa.string()),
+            ('name', pa.string()),
+            ('region', _DICT_STR),
+            ('status', _DICT_STR),
+            ('created_at', pa.timestamp('us')),
+            ('updated_at', pa.timestamp('us')),
+            ('base_rate', pa.float64()),
+        ]),
+        'complaints': pa.schema([
+            ('scheme_id', pa.string()),
+            ('region', _DICT_STR),
+            ('state', _DICT_STR),
+            ('location', _DICT_STR),
+            ('severity', _DICT_STR),
+            ('status', _DICT_STR),
+            ('created_at', pa.timestamp('us')),
+            ('closed_at', pa.timestamp('us')),
+            ('description', _DICT_STR),
+        ]),
+        'sentiments': pa.schema([
+            ('region', _DICT_STR),
+            ('label', _DICT_STR),
+            ('text', _DICT_STR),
+            ('created_at', pa.timestamp('us')),
+        ]),
+    }
+else:
+    SCHEMAS = {}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError('pyarrow is required for the parquet/arrow formats (pip install pyarrow)')
+
+
+def dataset_path(data_dir: str, name: str, fmt: str = 'csv') -> str:
+    return os.path.join(data_dir, f"{name}{EXTENSIONS[fmt]}")
+
+
+def write_table(path: str, rows: List[Dict[str, Any]], name: str, fmt: str):
+    """Write a list of row dicts as a typed Parquet or Arrow IPC file."""
+    require_pyarrow()
+    table = pa.Table.from_pylist(rows, schema=SCHEMAS[name])
+    if fmt == 'parquet':
+        pq.write_table(table, path, compression='zstd', row_group_size=256 * 1024)
+    elif fmt == 'arrow':
+        # Uncompressed IPC file so readers can memory-map it without copying
+        with pa.OSFile(path, 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=256 * 1024)
+    else:
+        raise ValueError(f"Unsupported columnar format: {fmt}")
+
+
+def read_frame(data_dir: str, name: str, fmt: str, columns: Optional[List[str]] = None):
+    """Memory-mapped read of only the requested columns into a pandas DataFrame."""
+    require_pyarrow()
+    path = dataset_path(data_dir, name, fmt)
+    if fmt == 'parquet':
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    elif fmt == 'arrow':
+        table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if columns:
+            table = table.select(columns)
+    else:
+        raise ValueError(f"Unsupported columnar format: {fmt}")
+    return table.to_pandas(self_destruct=True, split_blocks=True)
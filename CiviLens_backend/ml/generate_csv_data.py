@@ -4,6 +4,12 @@ import random
 import string
 from datetime import datetime, timedelta
 
+# Support both package and script execution contexts
+try:
+    from ml.columnar import FORMATS, SCHEMAS, dataset_path, write_table
+except Exception:  # fallback when __package__ is None
+    from columnar import FORMATS, SCHEMAS, dataset_path, write_table
+
 # Output directory relative to this file
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
@@ -74,8 +80,25 @@ def write_csv(path, rows, fieldnames):
         w.writerows(rows)
 
 
-def generate(schemes_n: int = 5000):
-    ensure_dir(DATA_DIR)
+def write_dataset(data_dir, name, rows, fmt='csv'):
+    """Write rows as <name>.csv, or as a typed <name>.parquet / <name>.arrow file."""
+    path = dataset_path(data_dir, name, fmt)
+    if fmt == 'csv':
+        write_csv(path, rows, fieldnames=list(rows[0].keys()))
+        return path
+    # Columnar formats store real timestamps; '' (e.g. open complaints' closed_at) becomes null
+    ts_cols = [f.name for f in SCHEMAS[name] if str(f.type).startswith('timestamp')]
+    for r in rows:
+        for c in ts_cols:
+            v = r.get(c)
+            r[c] = datetime.fromisoformat(v) if v else None
+    write_table(path, rows, name, fmt)
+    return path
+
+
+def generate(schemes_n: int = 5000, fmt: str = 'csv', out_dir: str | None = None):
+    data_dir = out_dir or DATA_DIR
+    ensure_dir(data_dir)
 
     schemes = []
     for i in range(schemes_n):
@@ -157,11 +180,11 @@ def generate(schemes_n: int = 5000):
                     'created_at': (when + timedelta(days=random.randint(-2,2))).isoformat(),
                 })
 
-    write_csv(SCHEMES_CSV, schemes, fieldnames=list(schemes[0].keys()))
-    write_csv(COMPLAINTS_CSV, complaints, fieldnames=list(complaints[0].keys()))
-    write_csv(SENTIMENTS_CSV, sentiments, fieldnames=list(sentiments[0].keys()))
+    write_dataset(data_dir, 'schemes', schemes, fmt)
+    write_dataset(data_dir, 'complaints', complaints, fmt)
+    write_dataset(data_dir, 'sentiments', sentiments, fmt)
 
-    print(f"Wrote {len(schemes)} schemes, {len(complaints)} complaints, {len(sentiments)} sentiments to {DATA_DIR}")
+    print(f"Wrote {len(schemes)} schemes, {len(complaints)} complaints, {len(sentiments)} sentiments ({fmt}) to {data_dir}")
 
 
 if __name__ == '__main__':
@@ -169,10 +192,6 @@ if __name__ == '__main__':
     ap = argparse.ArgumentParser()
     ap.add_argument('--schemes', type=int, default=5000)
     ap.add_argument('--out', type=str, default=DATA_DIR)
+    ap.add_argument('--format', type=str, choices=FORMATS, default='csv', help='Output format: csv, parquet or arrow (IPC)')
     args = ap.parse_args()
-    if args.out and args.out != DATA_DIR:
-        DATA_DIR = args.out
-        SCHEMES_CSV = os.path.join(DATA_DIR, 'schemes.csv')
-        COMPLAINTS_CSV = os.path.join(DATA_DIR, 'complaints.csv')
-        SENTIMENTS_CSV = os.path.join(DATA_DIR, 'sentiments.csv')
-    generate(args.schemes)
+    generate(args.schemes, args.format, args.out)
@@ -1,7 +1,8 @@
 import os
 import json
+import time
 import pickle
-from typing import Dict, Any
+from typing import Dict, Any, List
 from scipy.sparse import hstack, csr_matrix
 import numpy as np
 from .feature_builder import extract_meta_features, prepare_text
@@ -11,8 +12,41 @@ VEC_PATH = os.path.join(ART_DIR, 'vectorizer.pkl')
 MODEL_PATH = os.path.join(ART_DIR, 'model.pkl')
 META_PATH = os.path.join(ART_DIR, 'feature_meta.json')
 
+# 'batch' uses the TF-IDF + LogisticRegression artifacts from train_baseline;
+# 'online' uses the newest checkpoint written by the train_scam_online command.
+SCAM_MODEL = os.getenv('SCAM_MODEL', 'batch').lower()
+ONLINE_DIR = os.path.join(ART_DIR, 'online')
+ONLINE_LATEST_PATH = os.path.join(ONLINE_DIR, 'LATEST')
+ONLINE_RELOAD_SECONDS = float(os.getenv('SCAM_MODEL_RELOAD_SECONDS', '30'))
+
+
+def _online_version():
+    try:
+        with open(ONLINE_LATEST_PATH, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _load_online_artifacts(version):
+    ck_dir = os.path.join(ONLINE_DIR, version)
+    with open(os.path.join(ck_dir, 'vectorizer.pkl'), 'rb') as f:
+        vec = pickle.load(f)
+    with open(os.path.join(ck_dir, 'model.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    with open(os.path.join(ck_dir, 'feature_meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return vec, model, meta
+
 
 def _load_artifacts():
+    if SCAM_MODEL == 'online':
+        version = _online_version()
+        if version:
+            try:
+                return _load_online_artifacts(version)
+            except Exception:
+                pass
     if not (os.path.exists(VEC_PATH) and os.path.exists(MODEL_PATH)):
         return None, None, None
     with open(VEC_PATH, 'rb') as f:
@@ -27,38 +61,61 @@ def _load_artifacts():
 
 
 VEC, MODEL, META = _load_artifacts()
+_checked_at = time.monotonic()
 
 
-def available() -> bool:
-    return VEC is not None and MODEL is not None
+def _maybe_reload():
+    """Pick up a newer online checkpoint without restarting the server."""
+    global VEC, MODEL, META, _checked_at
+    if SCAM_MODEL != 'online' or time.monotonic() - _checked_at < ONLINE_RELOAD_SECONDS:
+        return
+    _checked_at = time.monotonic()
+    version = _online_version()
+    if version and version != (META or {}).get('version'):
+        try:
+            VEC, MODEL, META = _load_online_artifacts(version)
+        except Exception:
+            pass
 
 
-def predict_verification(sample: Dict[str, Any]) -> Dict[str, Any]:
-    """Return {'prob': float, 'risk_score': int, 'label': str, 'top_terms': list}.
-    Falls back to neutral if artifacts missing.
-    """
-    if not available():
-        return {"prob": 0.0, "risk_score": 0, "label": "legit", "top_terms": []}
+def available() -> bool:
+    _maybe_reload()
+    return VEC is not None and MODEL is not None
 
-    text = prepare_text(sample)
-    X_text = VEC.transform([text])
 
-    # Build meta features in the same order as training
+def _featurize(texts: List[str], samples: List[Dict[str, Any]]):
+    """Return (X_text, X) with meta features appended in the same order as training."""
+    X_text = VEC.transform(texts)
     X = X_text
     meta_keys = (META or {}).get('meta_keys')
     if meta_keys:
-        feats = extract_meta_features(text, sample.get('source_url') or '')
-        meta_vec = np.array([[float(feats.get(k, 0.0)) for k in meta_keys]], dtype=np.float32)
-        X_meta = csr_matrix(meta_vec)
-        X = hstack([X_text, X_meta])
+        meta_vec = np.empty((len(texts), len(meta_keys)), dtype=np.float32)
+        for i, (text, sample) in enumerate(zip(texts, samples)):
+            feats = extract_meta_features(text, sample.get('source_url') or '')
+            meta_vec[i] = [float(feats.get(k, 0.0)) for k in meta_keys]
+        X = hstack([X_text, csr_matrix(meta_vec)])
+    return X_text, X
 
+
+def _scam_probs(X):
     # Probability of class 1 = scam/suspicious
     if hasattr(MODEL, 'predict_proba'):
-        prob = float(MODEL.predict_proba(X)[0, 1])
-    else:
-        # Decision function -> sigmoid approximation
-        d = float(MODEL.decision_function(X)[0])
-        prob = float(1.0 / (1.0 + np.exp(-d)))
+        return MODEL.predict_proba(X)[:, 1]
+    # Decision function -> sigmoid approximation
+    d = MODEL.decision_function(X)
+    return 1.0 / (1.0 + np.exp(-d))
+
+
+def predict_verification(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """Return {'prob': float, 'risk_score': int, 'label': str, 'top_terms': list, 'model_version': str}.
+    Falls back to neutral if artifacts missing.
+    """
+    if not available():
+        return {"prob": 0.0, "risk_score": 0, "label": "legit", "top_terms": [], "model_version": None}
+
+    text = prepare_text(sample)
+    X_text, X = _featurize([text], [sample])
+    prob = float(_scam_probs(X)[0])
 
     risk = int(round(prob * 100))
     label = 'suspicious' if risk >= 50 else 'legit'
@@ -69,15 +126,40 @@ def predict_verification(sample: Dict[str, Any]) -> Dict[str, Any]:
         coef = MODEL.coef_[0]
         if hasattr(VEC, 'get_feature_names_out'):
             names = VEC.get_feature_names_out()
+            # Get active terms
+            idx = X_text.nonzero()[1]
+            term_weights = [(names[i], float(coef[i])) for i in idx]
         else:
-            names = VEC.get_feature_names()
-        # Get active terms
-        idx = X_text.nonzero()[1]
-        term_weights = [(names[i], float(coef[i])) for i in idx]
+            # Hashing vectorizer has no vocabulary: hash the text's own n-grams back to columns
+            from sklearn.feature_extraction import FeatureHasher
+            terms = sorted(set(VEC.build_analyzer()(text)))
+            hasher = FeatureHasher(n_features=VEC.n_features, input_type='string', alternate_sign=False)
+            cols = hasher.transform([[t] for t in terms]).indices if terms else []
+            term_weights = [(t, float(coef[i])) for t, i in zip(terms, cols)]
         # Top positive contributors toward suspicious
         term_weights.sort(key=lambda x: x[1], reverse=True)
         top_terms = term_weights[:5]
     except Exception:
         top_terms = []
 
-    return {"prob": prob, "risk_score": risk, "label": label, "top_terms": top_terms}
+    model_version = (META or {}).get('model_version') or 'ml-tfidf-v1'
+    return {"prob": prob, "risk_score": risk, "label": label, "top_terms": top_terms, "model_version": model_version}
+
+
+def predict_verification_batch(samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score many samples with one vectorizer/model call each.
+    Same fields as predict_verification except top_terms, which is left empty.
+    """
+    if not samples:
+        return []
+    if not available():
+        return [{"prob": 0.0, "risk_score": 0, "label": "legit", "top_terms": [], "model_version": None} for _ in samples]
+    texts = [prepare_text(s) for s in samples]
+    _X_text, X = _featurize(texts, samples)
+    model_version = (META or {}).get('model_version') or 'ml-tfidf-v1'
+    out = []
+    for p in _scam_probs(X):
+        risk = int(round(float(p) * 100))
+        out.append({"prob": float(p), "risk_score": risk, "label": 'suspicious' if risk >= 50 else 'legit',
+                    "top_terms": [], "model_version": model_version})
+    return out
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest.mock
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from benchmarks.ml import run as bench
+from core.testing import MemoryDB
+from ml import train_online
+
+
+class OnlineTrainingTest(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.online_dir = os.path.join(root, 'online')
+        for name, value in (('ONLINE_DIR', self.online_dir), ('LATEST_PATH', os.path.join(self.online_dir, 'LATEST')),
+                            ('KEEP_CHECKPOINTS', 2)):
+            patcher = unittest.mock.patch.object(train_online, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = MemoryDB()
+        # One admin bulk action stamps every override with the same time
+        stamp = datetime(2024, 5, 1, 12, 0)
+        for i in range(5):
+            self.db['schemes'].insert_one({
+                'title': f'Scheme {i}', 'description': 'Pay a fee to claim your subsidy' if i % 2 else 'PM-KISAN',
+                'verification': {'manual_label': 'scam' if i % 2 else 'legit', 'overridden_at': stamp},
+            })
+
+    def test_resume_from_watermark_keeps_timestamp_ties(self):
+        learned = []
+        for _ in range(4):
+            learned.append(train_online.run_once(self.db, batch_size=2, max_batches=1)['learned'])
+        self.assertEqual(learned, [2, 2, 1, 0])
+        state = self.db['ml_training_state'].find_one({'_id': train_online.STATE_ID})
+        self.assertEqual(state['schemes_after_id'], self.db['schemes'].docs[-1]['_id'])
+
+    def test_checkpoints_rotate_and_latest_points_at_newest(self):
+        for _ in range(3):
+            train_online.run_once(self.db, batch_size=2, max_batches=1)
+        self.assertEqual(sorted(d for d in os.listdir(self.online_dir) if d.startswith('v')), ['v00002', 'v00003'])
+        self.assertEqual(train_online.latest_version(), 'v00003')
+        _vec, clf, meta = train_online.load_checkpoint()
+        self.assertEqual((meta['version'], meta['samples']), ('v00003', 5))
+        self.assertEqual(list(clf.classes_), [0, 1])
+
+
+class BenchmarkGateTest(SimpleTestCase):
+    def main(self, cases, budgets=None):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        budgets_path = os.path.join(root, 'budgets.json')
+        with open(budgets_path, 'w', encoding='utf-8') as f:
+            json.dump(budgets or {}, f)
+        with unittest.mock.patch.object(bench, 'CASES', cases), \
+                unittest.mock.patch.object(bench, 'build_context', return_value={}), \
+                unittest.mock.patch('builtins.print'):
+            code = bench.main(['--sizes', '10', '--report', os.path.join(root, 'report.json'),
+                               '--budgets', budgets_path])
+        with open(os.path.join(root, 'report.json'), encoding='utf-8') as f:
+            return code, json.load(f)
+
+    def test_raising_case_fails_the_run(self):
+        def broken(ctx):
+            raise ValueError('model file missing')
+        code, report = self.main({'predict_verification_single': broken})
+        self.assertEqual(code, 1)
+        self.assertEqual(report['results'][0]['status'], 'error')
+        self.assertIn('model file missing', report['violations'][0])
+
+    def test_unavailable_case_fails_only_when_budgeted(self):
+        cases = {'analyze_sentiments': lambda ctx: None}
+        self.assertEqual(self.main(cases)[0], 0)
+        self.assertEqual(self.main(cases, {'analyze_sentiments': {'min_rows_per_sec': 50}})[0], 1)
+        self.assertEqual(self.main({'analyze_sentiments': lambda ctx: {'rows_per_sec': 80.0}},
+                                   {'analyze_sentiments': {'min_rows_per_sec': 50}})[0], 0)
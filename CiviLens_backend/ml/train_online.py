@@ -0,0 +1,183 @@
+import os
+import json
+import pickle
+import shutil
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Optional
+
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from scipy.sparse import hstack, csr_matrix
+import numpy as np
+
+from .feature_builder import extract_meta_features, prepare_text
+
+# Versioned checkpoints live under artifacts/online/v00001, v00002, ...
+# LATEST holds the name of the newest complete checkpoint.
+ART_DIR = os.path.join(os.path.dirname(__file__), 'artifacts')
+ONLINE_DIR = os.path.join(ART_DIR, 'online')
+LATEST_PATH = os.path.join(ONLINE_DIR, 'LATEST')
+STATE_ID = 'scam_online'
+KEEP_CHECKPOINTS = 10
+
+META_KEYS = ["has_gov_domain", "low_trust_tld", "has_urgency_terms", "has_unreal_terms", "has_contact_flags"]
+
+
+def make_vectorizer() -> HashingVectorizer:
+    # Stateless: no vocabulary to refit, so new terms need no retraining pass
+    return HashingVectorizer(ngram_range=(1, 2), n_features=2 ** 20, alternate_sign=False, norm='l2')
+
+
+def make_classifier() -> SGDClassifier:
+    # log_loss keeps predict_proba available for predict_verification
+    return SGDClassifier(loss='log_loss', alpha=1e-5, penalty='l2', random_state=42)
+
+
+def featurize(vec: HashingVectorizer, samples: List[Dict[str, Any]]):
+    texts = [prepare_text(s) for s in samples]
+    X_text = vec.transform(texts)
+    meta = [extract_meta_features(texts[i], samples[i].get('source_url') or '') for i in range(len(samples))]
+    X_meta = csr_matrix(np.array([[m[k] for k in META_KEYS] for m in meta], dtype=np.float32))
+    return hstack([X_text, X_meta]).tocsr()
+
+
+def latest_version() -> Optional[str]:
+    try:
+        with open(LATEST_PATH, 'r', encoding='utf-8') as f:
+            v = f.read().strip()
+        return v or None
+    except FileNotFoundError:
+        return None
+
+
+def load_checkpoint(version: Optional[str] = None) -> Tuple[HashingVectorizer, SGDClassifier, Dict[str, Any]]:
+    """Load a checkpoint (latest by default). Returns fresh, unfitted objects if none exists."""
+    version = version or latest_version()
+    if not version:
+        return make_vectorizer(), make_classifier(), {'version': None, 'samples': 0}
+    ck_dir = os.path.join(ONLINE_DIR, version)
+    with open(os.path.join(ck_dir, 'vectorizer.pkl'), 'rb') as f:
+        vec = pickle.load(f)
+    with open(os.path.join(ck_dir, 'model.pkl'), 'rb') as f:
+        clf = pickle.load(f)
+    with open(os.path.join(ck_dir, 'feature_meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return vec, clf, meta
+
+
+def save_checkpoint(vec, clf, meta: Dict[str, Any]) -> str:
+    """Write a new numbered checkpoint, then flip LATEST to it and prune old ones."""
+    os.makedirs(ONLINE_DIR, exist_ok=True)
+    existing = [int(d[1:]) for d in os.listdir(ONLINE_DIR) if d.startswith('v') and d[1:].isdigit()]
+    version = f"v{max(existing, default=0) + 1:05d}"
+    ck_dir = os.path.join(ONLINE_DIR, version)
+    os.makedirs(ck_dir, exist_ok=True)
+    with open(os.path.join(ck_dir, 'vectorizer.pkl'), 'wb') as f:
+        pickle.dump(vec, f)
+    with open(os.path.join(ck_dir, 'model.pkl'), 'wb') as f:
+        pickle.dump(clf, f)
+    meta = {**meta, 'version': version, 'meta_keys': META_KEYS, 'model_version': f"ml-sgd-online-{version}",
+            'trained_at': datetime.utcnow().isoformat()}
+    with open(os.path.join(ck_dir, 'feature_meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    # Atomic pointer update so readers never see a half-written checkpoint
+    tmp = LATEST_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp, LATEST_PATH)
+
+    versions = sorted(d for d in os.listdir(ONLINE_DIR) if d.startswith('v') and d[1:].isdigit())
+    for old in versions[:-KEEP_CHECKPOINTS]:
+        shutil.rmtree(os.path.join(ONLINE_DIR, old), ignore_errors=True)
+    return version
+
+
+def _to_item(title, description, source_url, label) -> Dict[str, Any]:
+    return {
+        'title': title or '',
+        'description': description or '',
+        'source_url': source_url or '',
+        'label': 1 if label in ('scam', 'suspicious') else 0,
+    }
+
+
+def collect_new_samples(mongo_db, state: Dict[str, Any], limit: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Fetch up to `limit` labels newer than the watermarks in `state`.
+
+    - training_samples are append-only, so `_id` order is the watermark.
+    - schemes manual labels are re-stamped on every override, so
+      (`verification.overridden_at`, `_id`) is the watermark (relabels are re-learned).
+      The `_id` tie-break keeps labels sharing the last timestamp of a batch from being skipped.
+    """
+    items: List[Dict[str, Any]] = []
+    new_state = dict(state)
+
+    q: Dict[str, Any] = {'label': {'$in': ['legit', 'scam']}}
+    if state.get('samples_after'):
+        q['_id'] = {'$gt': state['samples_after']}
+    for s in mongo_db['training_samples'].find(q).sort('_id', 1).limit(limit):
+        items.append(_to_item(
+            s.get('title'),
+            s.get('text') or s.get('description'),
+            s.get('meta', {}).get('source_url') or s.get('source_url'),
+            s.get('label'),
+        ))
+        new_state['samples_after'] = s['_id']
+
+    remaining = limit - len(items)
+    if remaining > 0:
+        q2: Dict[str, Any] = {'verification.manual_label': {'$in': ['legit', 'suspicious', 'scam']}}
+        after, after_id = state.get('schemes_after'), state.get('schemes_after_id')
+        if after and after_id is not None:
+            q2['$or'] = [{'verification.overridden_at': {'$gt': after}},
+                         {'verification.overridden_at': after, '_id': {'$gt': after_id}}]
+        elif after:
+            # State written before the _id tie-break
+            q2['verification.overridden_at'] = {'$gt': after}
+        cur = mongo_db['schemes'].find(q2, {
+            'title': 1, 'description': 1, 'summary': 1, 'source_url': 1, 'verification': 1,
+        }).sort([('verification.overridden_at', 1), ('_id', 1)]).limit(remaining)
+        for s in cur:
+            v = s.get('verification') or {}
+            items.append(_to_item(s.get('title'), s.get('description') or s.get('summary'),
+                                  s.get('source_url'), v.get('manual_label')))
+            if v.get('overridden_at'):
+                new_state['schemes_after'] = v['overridden_at']
+                new_state['schemes_after_id'] = s['_id']
+    return items, new_state
+
+
+def partial_fit_batch(vec, clf, samples: List[Dict[str, Any]]):
+    X = featurize(vec, samples)
+    y = np.array([s['label'] for s in samples], dtype=np.int32)
+    clf.partial_fit(X, y, classes=np.array([0, 1], dtype=np.int32))
+    return clf
+
+
+def run_once(mongo_db, batch_size: int = 256, max_batches: int = 100) -> Dict[str, Any]:
+    """Consume pending labels in mini-batches and checkpoint if anything was learned."""
+    state_col = mongo_db['ml_training_state']
+    state = state_col.find_one({'_id': STATE_ID}) or {'_id': STATE_ID}
+    vec, clf, meta = load_checkpoint()
+    learned = 0
+    for _ in range(max_batches):
+        batch, state = collect_new_samples(mongo_db, state, batch_size)
+        if not batch:
+            break
+        partial_fit_batch(vec, clf, batch)
+        learned += len(batch)
+        if len(batch) < batch_size:
+            break
+    if not learned:
+        return {'learned': 0, 'version': meta.get('version')}
+    version = save_checkpoint(vec, clf, {'samples': int(meta.get('samples', 0)) + learned})
+    # Only advance watermarks once the checkpoint that includes them is durable
+    state_col.replace_one({'_id': STATE_ID}, {**state, 'version': version}, upsert=True)
+    return {'learned': learned, 'version': version}
+
+
+def reset(mongo_db):
+    """Forget the watermarks so the next run relearns every label from scratch."""
+    mongo_db['ml_training_state'].delete_one({'_id': STATE_ID})
+    if os.path.exists(LATEST_PATH):
+        os.remove(LATEST_PATH)
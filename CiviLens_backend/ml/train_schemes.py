@@ -2,6 +2,8 @@ import os
 import json
 import csv
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import joblib
 import numpy as np
@@ -27,8 +29,10 @@ from db_connection import db
 # Support both package and script execution contexts
 try:
     from ml.infer_schemes import _build_features_per_scheme
+    from ml.columnar import FORMATS, read_frame
 except Exception:  # fallback when __package__ is None
     from infer_schemes import _build_features_per_scheme
+    from columnar import FORMATS, read_frame
 
 MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', 'models')
 RISK_MODEL_PATH = os.path.join(MODELS_DIR, 'scheme_risk_xgb.pkl')
@@ -258,56 +262,262 @@ def _build_training_labels_from_csv(data_dir, now=None):
     return np.array(y_risk, dtype=int), np.array(y_succ, dtype=int)
 
 
-def _train_classifier(X, y):
-    # TimeSeriesSplit as a proxy; features are scheme-level static snapshots
-    splitter = TimeSeriesSplit(n_splits=5)
-    best_auc = -1
-    best_model = None
+# -------------------- Columnar (Parquet / Arrow) pipeline --------------------
+def _str_col(series, default=''):
+    """Object-dtype view of a (possibly dictionary-encoded) string column with nulls/'' -> default."""
+    out = series.astype(object).where(series.notna(), default)
+    if default:
+        out = out.where(out != '', default)
+    return out
 
-    # Candidate model A: XGBoost
-    if XGBClassifier is not None:
-        model = XGBClassifier(
-            n_estimators=300,
+
+def _days_since(now, ts):
+    return (now - ts).dt.days
+
+
+def _build_features_and_labels_from_columnar(data_dir, fmt, now=None):
+    """Vectorized equivalent of the CSV feature + label builders.
+
+    Reads only the needed typed columns (memory-mapped) and aggregates with
+    pandas group-bys instead of materializing one dict per row.
+    Returns: X, meta, y_risk, y_success
+    """
+    import pandas as pd
+    if now is None:
+        now = datetime.utcnow()
+    now = pd.Timestamp(now)
+
+    schemes = read_frame(data_dir, 'schemes', fmt, ['scheme_id', 'name', 'region', 'created_at', 'updated_at'])
+    complaints = read_frame(data_dir, 'complaints', fmt, ['scheme_id', 'status', 'created_at', 'closed_at'])
+    sentiments = read_frame(data_dir, 'sentiments', fmt, ['region', 'label', 'created_at'])
+
+    # Per-complaint derived columns
+    c = pd.DataFrame({'sid': _str_col(complaints['scheme_id'])})
+    c = c[c['sid'] != '']
+    cidx = c.index
+    is_closed = _str_col(complaints['status']).str.lower().loc[cidx] == 'closed'
+    d = _days_since(now, complaints['created_at']).loc[cidx]
+    close_days = (complaints['closed_at'] - complaints['created_at']).dt.days.loc[cidx]
+    in_30 = d <= 30
+    in_60 = d <= 60
+    succ = (d >= 0) & in_60
+    c = c.assign(
+        closed=is_closed,
+        close_days=close_days,
+        last30=in_30,
+        last30_closed=in_30 & is_closed,
+        last60=in_60,
+        next30=(d >= 0) & in_30,
+        base60=(d > 30) & (d <= 90),
+        succ_total=succ,
+        succ_closed=succ & is_closed,
+        succ_close_days=close_days.where(succ & is_closed),
+    )
+    agg = c.groupby('sid', sort=False).agg(
+        total=('sid', 'size'),
+        closed=('closed', 'sum'),
+        avg_close_time=('close_days', 'mean'),
+        last30=('last30', 'sum'),
+        last30_closed=('last30_closed', 'sum'),
+        last60=('last60', 'sum'),
+        next30=('next30', 'sum'),
+        base60=('base60', 'sum'),
+        succ_total=('succ_total', 'sum'),
+        succ_closed=('succ_closed', 'sum'),
+        succ_avg_close=('succ_close_days', 'mean'),
+    )
+    sids = _str_col(schemes['scheme_id'])
+    agg = agg.reindex(sids)
+    counts = agg.drop(columns=['avg_close_time', 'succ_avg_close']).fillna(0).to_numpy(dtype=float)
+    total, closed, last30, last30_closed, last60, next30, base60, succ_total, succ_closed = counts.T
+    avg_close_time = agg['avg_close_time'].fillna(60.0).to_numpy(dtype=float)
+    succ_avg_close = agg['succ_avg_close'].fillna(99.0).to_numpy(dtype=float)
+
+    # Region sentiment
+    lab = _str_col(sentiments['label']).str.lower()
+    s30 = _days_since(now, sentiments['created_at']) <= 30
+    s = pd.DataFrame({
+        'region': _str_col(sentiments['region'], 'Unknown'),
+        'pos': lab == 'positive',
+        'neg': lab == 'negative',
+        'tot': True,
+        'pos_30': s30 & (lab == 'positive'),
+        'neg_30': s30 & (lab == 'negative'),
+        'tot_30': s30,
+    })
+    regions = _str_col(schemes['region'], 'Unknown')
+    sreg = s.groupby('region', sort=False).sum().reindex(regions).fillna(0)
+    pos = sreg['pos'].to_numpy(dtype=float)
+    neg = sreg['neg'].to_numpy(dtype=float)
+    tot = sreg['tot'].to_numpy(dtype=float)
+    r30 = sreg['tot_30'].to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        closure_rate = np.where(total > 0, closed / total, 0.0)
+        recent_closure_rate = np.where(last30 > 0, last30_closed / last30, 0.0)
+        reg_pos_ratio = np.where(tot > 0, pos / tot, 0.5)
+        reg_pos_ratio_30 = np.where(r30 > 0, sreg['pos_30'].to_numpy(dtype=float) / r30, reg_pos_ratio)
+        reg_neg_ratio_30 = np.where(r30 > 0, sreg['neg_30'].to_numpy(dtype=float) / r30,
+                                    np.where(tot > 0, neg / tot, 0.2))
+        succ_rate = np.where(succ_total > 0, succ_closed / succ_total, 0.0)
+    velocity = last30 - np.maximum(0, last60 - last30)
+
+    age_days = _days_since(now, schemes['created_at']).fillna(0).to_numpy(dtype=float)
+    inact_days = _days_since(now, schemes['updated_at'].fillna(schemes['created_at']))
+    inact_days = inact_days.fillna(pd.Series(age_days, index=inact_days.index)).to_numpy(dtype=float)
+    geo_div = np.ones(len(schemes), dtype=float)
+
+    X = np.column_stack([
+        age_days, inact_days, total, closed, closure_rate, avg_close_time,
+        last30, last60, velocity, recent_closure_rate,
+        reg_pos_ratio, reg_pos_ratio_30, reg_neg_ratio_30, geo_div,
+    ]).astype(float)
+    names = _str_col(schemes['name'], 'Scheme')
+    meta = [{'scheme_id': sid, 'name': nm, 'region': reg} for sid, nm, reg in zip(sids, names, regions)]
+
+    y_risk = (next30 >= np.maximum(5, 2 * np.maximum(1, base60 // 3))).astype(int)
+    y_succ = ((succ_rate >= 0.7) & (succ_avg_close <= 21.0)).astype(int)
+    return X, meta, y_risk, y_succ
+
+
+N_SPLITS = 5
+EARLY_STOPPING_ROUNDS = 30
+VALID_FRACTION = 0.1
+REPORT_PATH = os.path.join(MODELS_DIR, 'training_report.json')
+
+
+def _make_model(name, threads, n_estimators=300, early_stopping=True):
+    if name == 'xgb':
+        return XGBClassifier(
+            n_estimators=n_estimators,
             max_depth=5,
             learning_rate=0.05,
             subsample=0.8,
             colsample_bytree=0.8,
             objective='binary:logistic',
             eval_metric='logloss',
-            n_jobs=4,
-            tree_method='hist'
+            n_jobs=threads,
+            tree_method='hist',
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS if early_stopping else None,
         )
-        try:
-            aucs = []
-            for train_idx, test_idx in splitter.split(X):
+    # GradientBoosting with calibration; sklearn's own early stopping on a held-out fraction
+    base = GradientBoostingClassifier(
+        n_estimators=n_estimators, max_depth=3,
+        n_iter_no_change=EARLY_STOPPING_ROUNDS if early_stopping else None,
+        validation_fraction=VALID_FRACTION,
+    )
+    return CalibratedClassifierCV(base, method='isotonic', cv=3)
+
+
+def _fit_fold(task):
+    """Worker: fit one (target, model, fold) and score it on the fold's test split.
+
+    The tail of the training split (time-ordered) is held out as the early-stopping
+    validation set for XGBoost, so the test split is never seen during fitting.
+    """
+    from threadpoolctl import threadpool_limits
+    target, name, fold, X, y, train_idx, test_idx, threads = task
+    t0 = time.perf_counter()
+    row = {'target': target, 'model': name, 'fold': fold,
+           'train_size': int(len(train_idx)), 'test_size': int(len(test_idx))}
+    try:
+        with threadpool_limits(limits=threads):
+            model = _make_model(name, threads)
+            if name == 'xgb':
+                n_val = max(1, int(len(train_idx) * VALID_FRACTION))
+                fit_idx, val_idx = train_idx[:-n_val], train_idx[-n_val:]
+                model.fit(X[fit_idx], y[fit_idx], eval_set=[(X[val_idx], y[val_idx])], verbose=False)
+                row['best_iteration'] = int(model.best_iteration)
+            else:
                 model.fit(X[train_idx], y[train_idx])
-                proba = model.predict_proba(X[test_idx])[:,1]
-                aucs.append(roc_auc_score(y[test_idx], proba))
-            mean_auc = float(np.mean(aucs)) if aucs else 0.0
-            best_auc = mean_auc
-            best_model = model
-        except Exception:
-            pass
-
-    # Candidate model B: GradientBoosting with calibration
-    if best_model is None:
-        base = GradientBoostingClassifier(n_estimators=300, max_depth=3)
-        model = CalibratedClassifierCV(base, method='isotonic', cv=3)
-        aucs = []
-        for train_idx, test_idx in splitter.split(X):
-            model.fit(X[train_idx], y[train_idx])
-            proba = model.predict_proba(X[test_idx])[:,1]
-            aucs.append(roc_auc_score(y[test_idx], proba))
-        mean_auc = float(np.mean(aucs)) if aucs else 0.0
-        if mean_auc > best_auc:
-            best_auc = mean_auc
-            best_model = model
-
-    return best_model, best_auc
-
-
-def train_and_save(data_dir: str | None = None):
-    if data_dir:
+            proba = model.predict_proba(X[test_idx])[:, 1]
+            row['auc'] = float(roc_auc_score(y[test_idx], proba))
+    except Exception as e:
+        row['error'] = str(e)
+    row['seconds'] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def _refit_full(task):
+    """Worker: refit the selected model on all rows, sized by the folds' early-stopping rounds."""
+    from threadpoolctl import threadpool_limits
+    target, name, X, y, n_estimators, threads = task
+    t0 = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        model = _make_model(name, threads, n_estimators=n_estimators, early_stopping=(name != 'xgb'))
+        model.fit(X, y)
+    return target, model, round(time.perf_counter() - t0, 3)
+
+
+def _train_targets(X, targets, jobs=1):
+    """Cross-validate and fit one classifier per target on a shared process pool.
+
+    All (target, fold) fits of a candidate run concurrently within a `jobs` CPU
+    budget; each worker gets jobs // concurrent_tasks threads. Candidates are
+    tried in order (XGBoost, then calibrated GradientBoosting) and the first one
+    whose folds all succeed is kept for a target.
+    Returns: ({target: (model, mean_auc)}, report)
+    """
+    jobs = max(1, int(jobs or 1))
+    splits = list(TimeSeriesSplit(n_splits=N_SPLITS).split(X))
+    candidates = (['xgb'] if XGBClassifier is not None else []) + ['gb']
+    results = {}
+    report = {'jobs': jobs, 'folds': [], 'refits': []}
+    t_start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        selected = {}
+        for name in candidates:
+            pending = [t for t in targets if t not in selected]
+            if not pending:
+                break
+            n_tasks = len(pending) * len(splits)
+            threads = max(1, jobs // min(jobs, n_tasks))
+            tasks = [(t, name, i, X, targets[t], tr, te, threads)
+                     for t in pending for i, (tr, te) in enumerate(splits)]
+            rows = list(pool.map(_fit_fold, tasks))
+            report['folds'].extend(rows)
+            for t in pending:
+                t_rows = [r for r in rows if r['target'] == t]
+                if any('error' in r for r in t_rows):
+                    continue
+                iters = [r['best_iteration'] + 1 for r in t_rows if 'best_iteration' in r]
+                n_est = int(np.median(iters)) if iters else 300
+                selected[t] = (name, float(np.mean([r['auc'] for r in t_rows])), n_est)
+
+        threads = max(1, jobs // max(1, len(selected)))
+        refit_tasks = [(t, name, X, targets[t], n_est, threads) for t, (name, _auc, n_est) in selected.items()]
+        for t, model, secs in pool.map(_refit_full, refit_tasks):
+            name, auc, n_est = selected[t]
+            results[t] = (model, auc)
+            report['refits'].append({'target': t, 'model': name, 'n_estimators': n_est, 'seconds': secs})
+
+    for t in targets:
+        results.setdefault(t, (None, -1))
+    report['total_seconds'] = round(time.perf_counter() - t_start, 3)
+    return results, report
+
+
+def _train_classifier(X, y, jobs=1):
+    results, _report = _train_targets(X, {'y': y}, jobs=jobs)
+    return results['y']
+
+
+def _json_safe(value):
+    """Non-finite floats (AUC of a single-class fold is NaN) become None, so reports are strict JSON."""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+def train_and_save(data_dir: str | None = None, fmt: str = 'csv', jobs: int | None = None):
+    if data_dir and fmt in ('parquet', 'arrow'):
+        X, meta, y_risk, y_succ = _build_features_and_labels_from_columnar(data_dir, fmt)
+    elif data_dir:
         X, meta = _build_features_per_scheme_from_csv(data_dir)
         y_risk, y_succ = _build_training_labels_from_csv(data_dir)
     else:
@@ -322,8 +532,11 @@ def train_and_save(data_dir: str | None = None):
         y_risk = y_risk[:n]
         y_succ = y_succ[:n]
 
-    risk_model, risk_auc = _train_classifier(X, y_risk)
-    succ_model, succ_auc = _train_classifier(X, y_succ)
+    results, report = _train_targets(X, {'risk': y_risk, 'success': y_succ}, jobs=jobs or os.cpu_count())
+    risk_model, risk_auc = results['risk']
+    succ_model, succ_auc = results['success']
+    if risk_model is None or succ_model is None:
+        raise RuntimeError('Training failed for every candidate model; see ' + REPORT_PATH)
 
     joblib.dump(risk_model, RISK_MODEL_PATH)
     joblib.dump(succ_model, SUCCESS_MODEL_PATH)
@@ -337,19 +550,24 @@ def train_and_save(data_dir: str | None = None):
         'metrics': {'risk_auc': risk_auc, 'success_auc': succ_auc}
     }
     with open(SCHEMA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(schema, f, indent=2)
+        json.dump(_json_safe(schema), f, indent=2, allow_nan=False)
+    with open(REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(_json_safe(report), f, indent=2, allow_nan=False)
 
     return {'risk_auc': risk_auc, 'success_auc': succ_auc, 'paths': {
         'risk_model': RISK_MODEL_PATH,
         'success_model': SUCCESS_MODEL_PATH,
         'schema': SCHEMA_PATH,
-    }}
+        'report': REPORT_PATH,
+    }, 'seconds': report['total_seconds']}
 
 
 if __name__ == '__main__':
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument('--data-dir', type=str, default=None, help='Directory containing schemes.csv, complaints.csv, sentiments.csv')
+    ap.add_argument('--format', type=str, choices=FORMATS, default='csv', help='Format of the files in --data-dir (csv, parquet or arrow)')
+    ap.add_argument('--jobs', type=int, default=os.cpu_count(), help='CPU budget shared by fold/target workers and XGBoost threads')
     args = ap.parse_args()
-    out = train_and_save(args.data_dir)
+    out = train_and_save(args.data_dir, args.format, args.jobs)
     print(out)
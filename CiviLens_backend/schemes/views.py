@@ -294,7 +294,7 @@ class SchemeVerifyView(View):
                 })
                 model_prob = float(ml_res.get('prob', 0.0))
                 top_terms = ml_res.get('top_terms') or []
-                model_version = 'ml-tfidf-v1'
+                model_version = ml_res.get('model_version') or 'ml-tfidf-v1'
                 # Blend: 60% ML + 40% rules
                 ml_score = int(round(model_prob * 100))
                 score = int(round(0.6 * ml_score + 0.4 * score))
@@ -401,7 +401,7 @@ class SchemeVerifyMessageView(View):
                 })
                 model_prob = float(ml_res.get('prob', 0.0))
                 top_terms = ml_res.get('top_terms') or []
-                model_version = 'ml-tfidf-v1'
+                model_version = ml_res.get('model_version') or 'ml-tfidf-v1'
                 ml_score = int(round(model_prob * 100))
                 score = int(round(0.6 * ml_score + 0.4 * score))
                 if top_terms:
@@ -0,0 +1,132 @@
+"""In-process micro-batching for sentiment inference.
+
+Request threads that need labels at the same time would each run their own
+small forward pass on the same CPU. With the broker they submit texts and get a
+Future back. One dispatcher thread collects pending requests until it has
+`max_batch` texts or the oldest request has waited `max_wait_ms`, runs one
+nlp_utils.analyze_sentiments_with_models call and resolves every Future with
+its slice of the labels. A request larger than `max_batch` runs as its own batch.
+
+The broker is per process and is started lazily, so forked web workers each
+get their own dispatcher thread.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from . import nlp_utils
+
+_STOP = object()
+
+
+class InferenceBroker:
+    def __init__(self, infer=None, max_batch: int = 256, max_wait_ms: float = 5.0):
+        self.infer = infer or nlp_utils.analyze_sentiments_with_models
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.batches = 0  # forward passes run (for benchmarks / debugging)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._carry = None  # request that did not fit the previous batch; heads the next one
+        self._thread = threading.Thread(target=self._run, name='sentiment-broker', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Future resolving to (labels, model_ids); (None, None) when no model is available."""
+        fut: Future = Future()
+        if not texts:
+            fut.set_result(([], []))
+            return fut
+        self._queue.put((list(texts), fut))
+        return fut
+
+    def close(self, timeout: Optional[float] = None):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self, first):
+        """`first` plus whatever else arrives before the batch is full or the wait expires."""
+        batch, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        stop = False
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            if size + len(item[0]) > self.max_batch:
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, stop
+
+    def _run(self):
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            pending = [(texts, fut) for texts, fut in batch if fut.set_running_or_notify_cancel()]
+            if pending:
+                self._dispatch(pending)
+            if stop:
+                return
+
+    def _dispatch(self, pending):
+        flat = [t for texts, _fut in pending for t in texts]
+        try:
+            labels, model_ids = self.infer(flat)
+        except Exception as e:
+            for _texts, fut in pending:
+                fut.set_exception(e)
+            return
+        self.batches += 1
+        start = 0
+        for texts, fut in pending:
+            end = start + len(texts)
+            fut.set_result((labels[start:end], model_ids[start:end]) if labels is not None else (None, None))
+            start = end
+
+
+_broker: Optional[InferenceBroker] = None
+_broker_pid: Optional[int] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> InferenceBroker:
+    global _broker, _broker_pid
+    with _broker_lock:
+        if _broker is None or _broker_pid != os.getpid():
+            _broker = InferenceBroker(
+                max_batch=int(nlp_utils._setting('SENTIMENT_BROKER_MAX_BATCH', 256)),
+                max_wait_ms=float(nlp_utils._setting('SENTIMENT_BROKER_MAX_WAIT_MS', 5)),
+            )
+            _broker_pid = os.getpid()
+        return _broker
+
+
+def broker_enabled() -> bool:
+    return str(nlp_utils._setting('SENTIMENT_BROKER', True)).lower() in ('1', 'true', 'yes')
+
+
+def analyze_sentiments_with_models(texts: List[str], timeout: Optional[float] = None
+                                   ) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """nlp_utils.analyze_sentiments_with_models through the shared broker (direct call when
+    SENTIMENT_BROKER is off)."""
+    if not broker_enabled():
+        return nlp_utils.analyze_sentiments_with_models(texts)
+    return get_broker().submit(texts).result(timeout)
+
+
+def analyze_sentiments(texts: List[str], timeout: Optional[float] = None) -> Optional[List[str]]:
+    return analyze_sentiments_with_models(texts, timeout)[0]
@@ -0,0 +1,169 @@
+"""Persistent text -> (label, embedding) cache for sentiment inference.
+
+Entries are keyed by a hash of the normalized text plus the model id, so a model
+or prototype change never serves stale labels. Each model id gets its own
+directory holding
+
+- index.tsv       append-only "<key>\\t<label>" lines; line number = row
+- embeddings.f16  row-major float16 matrix, read through np.memmap
+
+Writers append under an exclusive file lock; readers pick up rows appended by
+other processes (web workers, label_sentiment) on their next lookup.
+
+Every process keeps the index of a model in memory, so a directory holds at most
+MAX_ROWS entries (SENTIMENT_CACHE_MAX_ROWS). Once full it still serves hits but no
+longer grows; delete the directory to start it afresh.
+"""
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# SENTIMENT_CACHE_DIR=off disables the persistent cache (in-batch dedup still applies)
+CACHE_DIR = os.environ.get('SENTIMENT_CACHE_DIR', os.path.join(_BACKEND_DIR, 'models', 'sentiment_cache'))
+
+MAX_ROWS = int(os.environ.get('SENTIMENT_CACHE_MAX_ROWS') or 200000)
+
+_WS = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFKC + collapsed whitespace. Case is kept: the multilingual fallback is cased."""
+    return _WS.sub(' ', unicodedata.normalize('NFKC', text or '')).strip()
+
+
+def text_key(model_id: str, text: str) -> str:
+    return hashlib.blake2b(f"{model_id}\0{normalize_text(text)}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def dedupe(texts: List[str]) -> Tuple[List[str], List[int]]:
+    """Unique texts (first occurrence kept verbatim) and, per input, its index into them."""
+    first: Dict[str, int] = {}
+    unique: List[str] = []
+    inverse: List[int] = []
+    for t in texts:
+        norm = normalize_text(t)
+        idx = first.get(norm)
+        if idx is None:
+            idx = first[norm] = len(unique)
+            unique.append(t)
+        inverse.append(idx)
+    return unique, inverse
+
+
+class EmbeddingCache:
+    """Cache for one model id. `dim=0` stores labels only (pipeline backends)."""
+
+    def __init__(self, root: str, model_id: str, dim: int = 0, max_rows: Optional[int] = None):
+        self.dir = os.path.join(root, re.sub(r'[^A-Za-z0-9._+-]+', '_', model_id))
+        self.model_id = model_id
+        self.dim = int(dim)
+        self.max_rows = MAX_ROWS if max_rows is None else max(0, int(max_rows))
+        self.index_path = os.path.join(self.dir, 'index.tsv')
+        self.emb_path = os.path.join(self.dir, 'embeddings.f16')
+        self._rows: Dict[str, Tuple[int, str]] = {}
+        self._index_offset = 0
+        self._emb: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+
+    # -------------------- reading --------------------
+    def _refresh(self):
+        """Read index lines appended since the last refresh (by any process)."""
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if size == self._index_offset:
+            return
+        if len(self._rows) >= self.max_rows:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            chunk = f.read()
+        # Ignore a trailing partial line from a concurrent writer
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].decode('utf-8').splitlines():
+            key, _, label = line.partition('\t')
+            if key and key not in self._rows:
+                self._rows[key] = (len(self._rows), label)
+        self._index_offset += end
+        self._emb = None
+
+    def _embeddings(self) -> Optional[np.memmap]:
+        if not self.dim or not self._rows:
+            return None
+        if self._emb is None or self._emb.shape[0] < len(self._rows):
+            self._emb = np.memmap(self.emb_path, dtype=np.float16, mode='r', shape=(len(self._rows), self.dim))
+        return self._emb
+
+    def lookup(self, keys: List[str]) -> Dict[str, Tuple[str, Optional[np.ndarray]]]:
+        """Return {key: (label, embedding or None)} for the keys present in the cache."""
+        with self._lock:
+            self._refresh()
+            hits = {k: self._rows[k] for k in keys if k in self._rows}
+            emb = self._embeddings() if hits else None
+            return {k: (label, np.asarray(emb[row], dtype=np.float32) if emb is not None else None)
+                    for k, (row, label) in hits.items()}
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    # -------------------- writing --------------------
+    def add(self, keys: List[str], labels: List[str], embeddings: Optional[np.ndarray] = None):
+        """Append new entries. Embedding rows are written before their index lines so a
+        reader never sees an index row without its vector."""
+        if self.dim and (embeddings is None or embeddings.shape != (len(keys), self.dim)):
+            raise ValueError(f"expected embeddings of shape ({len(keys)}, {self.dim})")
+        with self._lock, open(self.index_path, 'ab') as idx_f:
+            if fcntl is not None:
+                fcntl.flock(idx_f, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                new = [i for i, k in enumerate(keys) if k not in self._rows]
+                seen = set()
+                new = [i for i in new if not (keys[i] in seen or seen.add(keys[i]))]
+                new = new[:max(0, self.max_rows - len(self._rows))]
+                if not new:
+                    return
+                if self.dim:
+                    # Truncate any vectors left behind by a writer that died before its index write
+                    with open(self.emb_path, 'ab') as emb_f:
+                        emb_f.truncate(len(self._rows) * self.dim * 2)
+                        emb_f.write(np.ascontiguousarray(embeddings[new], dtype=np.float16).tobytes())
+                        emb_f.flush()
+                        os.fsync(emb_f.fileno())
+                idx_f.write(''.join(f"{keys[i]}\t{labels[i]}\n" for i in new).encode('utf-8'))
+                idx_f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(idx_f, fcntl.LOCK_UN)
+
+
+_caches: Dict[Tuple[str, int], EmbeddingCache] = {}
+
+
+def get_cache(model_id: str, dim: int = 0) -> Optional[EmbeddingCache]:
+    """Process-wide cache for `model_id`, or None when disabled or the directory is unusable."""
+    if not CACHE_DIR or CACHE_DIR.lower() in ('off', '0', 'false', 'none'):
+        return None
+    key = (model_id, int(dim))
+    cache = _caches.get(key)
+    if cache is None:
+        try:
+            cache = _caches[key] = EmbeddingCache(CACHE_DIR, model_id, dim)
+        except OSError:
+            return None
+    return cache
@@ -0,0 +1,389 @@
+"""Bulk ingestion of citizen feedback from IVR / SMS partners into sentiment_records.
+
+A partner POSTs newline-delimited JSON (optionally gzip-compressed) to
+/api/sentiment/ingest/ with its key in the X-API-Key header. One record per line:
+
+    {"message_id": "ivr-000123", "text": "...", "region": "Odisha",
+     "created_at": "2024-05-01T10:00:00+05:30", "channel": "ivr", "category": "Pension"}
+
+Records are validated and normalized: the region becomes the canonical state
+name and created_at becomes a BSON date, the time field of the core.timeseries
+layout. Invalid lines are reported and skipped. Records are deduplicated by
+(partner, message_id), both within the upload and against earlier uploads
+(through CLAIMS), so a partner can resend a batch safely. New records are labelled in one batched
+pass per chunk and inserted with unordered bulk writes; the rollups get their
+deltas. Uploads too large to label within the request are queued for the
+label_sentiment worker.
+
+A claim names the record it was taken for (record_id). Claims are released when their
+record is not written, and a stale claim whose record never appeared is taken over by the
+resend, so a failed upload never turns its records into permanent "duplicates".
+`manage.py migrate_timeseries` seeds claims for records ingested before CLAIMS existed.
+"""
+import gzip
+import hashlib
+import json
+import secrets
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from . import labeling, rollups
+
+PARTNERS = 'ingest_partners'
+RECORDS = 'sentiment_records'
+# One document per ingested (partner, message_id). sentiment_records is a time-series collection
+# (core.timeseries), which cannot carry the unique index this needs
+CLAIMS = 'sentiment_ingest_claims'
+CHUNK = 1000
+MAX_TEXT_CHARS = 5000
+READ_CHUNK = 64 * 1024
+# A record is a few KB at most (text is cut to MAX_TEXT_CHARS)
+MAX_LINE_BYTES = 1 << 20
+MAX_ERRORS_REPORTED = 100
+MAX_CLOCK_SKEW_MS = 10 * 60 * 1000
+DUPLICATE_KEY = 11000
+# A claim whose record is still missing after this long belongs to an upload that died
+CLAIM_STALE_MS = 15 * 60 * 1000
+
+
+class IngestError(Exception):
+    """Upload-level failure; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256((key or '').encode('utf-8')).hexdigest()
+
+
+def create_partner(mongo_db, partner_id: str, name: str = '') -> str:
+    """Register (or re-key) a partner and return its new API key; only the hash is stored."""
+    key = secrets.token_urlsafe(32)
+    mongo_db[PARTNERS].update_one({'_id': partner_id}, {'$set': {
+        'name': name or partner_id,
+        'key_sha256': hash_key(key),
+        'active': True,
+        'updated_at': int(time.time() * 1000),
+    }}, upsert=True)
+    return key
+
+
+def authenticate(mongo_db, key: str) -> Optional[Dict[str, Any]]:
+    if not key:
+        return None
+    return mongo_db[PARTNERS].find_one({'key_sha256': hash_key(key), 'active': True}, {'name': 1})
+
+
+def ensure_indexes(mongo_db):
+    # Dedup needs no index of its own: CLAIMS keys on _id
+    mongo_db[PARTNERS].create_index([('key_sha256', 1)], unique=True)
+
+
+def iter_lines(stream, gzipped: bool, max_bytes: int) -> Iterator[Tuple[int, bytes]]:
+    """(line number, raw line) from a request body, decompressing on the fly. The body is read
+    in READ_CHUNK pieces and the byte cap applies to the decompressed size, so a small gzip
+    bomb stops after about max_bytes; a line longer than MAX_LINE_BYTES is rejected as soon
+    as it crosses that size."""
+    src = gzip.GzipFile(fileobj=stream, mode='rb') if gzipped else stream
+    total = 0
+    lineno = 0
+    tail = b''
+    try:
+        while True:
+            chunk = src.read(READ_CHUNK)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise IngestError(f'Upload exceeds {max_bytes} bytes (decompressed)', status=413)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            if len(tail) > MAX_LINE_BYTES:
+                raise IngestError(f'Line {lineno + len(lines) + 1} exceeds {MAX_LINE_BYTES} bytes', status=413)
+            for raw in lines:
+                lineno += 1
+                raw = raw.strip()
+                if raw:
+                    yield lineno, raw
+    except (OSError, EOFError, zlib.error) as e:
+        raise IngestError(f'Could not decompress body: {e}')
+    tail = tail.strip()
+    if tail:
+        yield lineno + 1, tail
+
+
+def normalize_timestamp(value, now_ms: int) -> int:
+    """ISO 8601 (offset-aware or UTC), epoch seconds or epoch ms -> epoch ms."""
+    if value is None or value == '':
+        return now_ms
+    if isinstance(value, bool):
+        raise ValueError('created_at must be a timestamp')
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value.strip())
+    if isinstance(value, (int, float)):
+        ms = int(value if value > 1e11 else value * 1000)
+    elif isinstance(value, str):
+        dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        ms = int(dt.timestamp() * 1000)
+    else:
+        raise ValueError('created_at must be an ISO 8601 string or epoch seconds/ms')
+    if ms > now_ms + MAX_CLOCK_SKEW_MS:
+        raise ValueError('created_at is in the future')
+    if ms < 0:
+        raise ValueError('created_at is before 1970')
+    return ms
+
+
+class RegionNormalizer:
+    """Canonical state name for partner region strings, memoized per upload (numeric ids hit Mongo)."""
+
+    def __init__(self):
+        from regions.views import _normalize_region, STATES
+        self._normalize = _normalize_region
+        self._states = set(STATES)
+        self._by_lower = {s.lower(): s for s in STATES}
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def __call__(self, value) -> Optional[str]:
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        key = value.strip()
+        if key not in self._cache:
+            name = self._normalize(key)
+            if name not in self._states:
+                name = self._by_lower.get((name or key).lower())
+            self._cache[key] = name
+        return self._cache[key]
+
+
+def validate(obj: Any, partner_id: str, normalize_region: RegionNormalizer, now_ms: int) -> Dict[str, Any]:
+    """One NDJSON record -> sentiment_records document; raises ValueError with the reason."""
+    if not isinstance(obj, dict):
+        raise ValueError('record must be a JSON object')
+    message_id = obj.get('message_id')
+    if isinstance(message_id, int) and not isinstance(message_id, bool):
+        message_id = str(message_id)
+    if not isinstance(message_id, str) or not message_id.strip() or len(message_id) > 128:
+        raise ValueError('message_id is required (string, at most 128 characters)')
+    text = obj.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError('text is required')
+    region = normalize_region(obj.get('region'))
+    if region is None:
+        raise ValueError(f"unknown region: {obj.get('region')!r}")
+    doc = {
+        'partner': partner_id,
+        'partner_message_id': message_id.strip(),
+        'text': ' '.join(text.split())[:MAX_TEXT_CHARS],
+        'region': region,
+        'created_at': datetime.utcfromtimestamp(normalize_timestamp(obj.get('created_at'), now_ms) / 1000),
+        'ingested_at': now_ms,
+    }
+    for field in ('channel', 'language'):
+        v = obj.get(field)
+        if isinstance(v, str) and v.strip():
+            doc[field] = v.strip().lower()[:32]
+    category = obj.get('category')
+    if isinstance(category, str) and category.strip():
+        doc['category'] = category.strip()[:64]
+    return doc
+
+
+def parse(lines: Iterable[Tuple[int, bytes]], partner_id: str, max_records: int
+          ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Valid, upload-deduplicated documents plus the counts and first errors."""
+    now_ms = int(time.time() * 1000)
+    normalize_region = RegionNormalizer()
+    docs: List[Dict[str, Any]] = []
+    seen = set()
+    stats: Dict[str, Any] = {'received': 0, 'rejected': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+    for lineno, raw in lines:
+        stats['received'] += 1
+        if stats['received'] > max_records:
+            raise IngestError(f'Upload exceeds {max_records} records; split it into smaller batches', status=413)
+        try:
+            doc = validate(json.loads(raw), partner_id, normalize_region, now_ms)
+        except (ValueError, TypeError, OverflowError) as e:  # ValueError includes json.JSONDecodeError
+            stats['rejected'] += 1
+            if len(stats['errors']) < MAX_ERRORS_REPORTED:
+                stats['errors'].append({'line': lineno, 'message': str(e)})
+            continue
+        if doc['partner_message_id'] in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(doc['partner_message_id'])
+        docs.append(doc)
+    return docs, stats
+
+
+def _claim_key(partner_id: str, message_id: str) -> Dict[str, str]:
+    return {'partner': partner_id, 'message_id': message_id}
+
+
+def _claim(mongo_db, partner_id: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Claim (partner, message_id) for each doc through the claims' unique _id; returns the docs
+    whose ids were not ingested before (or concurrently by another upload).
+
+    Each doc gets its record _id here and the claim carries it as record_id. A claim older than
+    CLAIM_STALE_MS whose record was never written (the upload died between claim and insert) is
+    taken over instead of counting the resent record as a duplicate."""
+    now = int(time.time() * 1000)
+    for d in docs:
+        d['_id'] = ObjectId()
+    claims = [{'_id': _claim_key(partner_id, d['partner_message_id']), 'record_id': d['_id'], 'at': now}
+              for d in docs]
+    taken = set()
+    try:
+        mongo_db[CLAIMS].insert_many(claims, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get('writeErrors', []):
+            if err.get('code') != DUPLICATE_KEY:
+                raise
+            taken.add(err['index'])
+    if taken:
+        taken -= _take_over_orphans(mongo_db, partner_id, docs, taken, now)
+    return [d for i, d in enumerate(docs) if i not in taken]
+
+
+def _take_over_orphans(mongo_db, partner_id: str, docs: List[Dict[str, Any]], taken: set, now: int) -> set:
+    """Indexes in `taken` whose stale claim points at a record that does not exist, now claimed for docs."""
+    stale = {c['_id']['message_id']: c for c in mongo_db[CLAIMS].find({
+        '_id': {'$in': [_claim_key(partner_id, docs[i]['partner_message_id']) for i in taken]},
+        'at': {'$lt': now - CLAIM_STALE_MS},
+        'record_id': {'$exists': True},
+    })}
+    if not stale:
+        return set()
+    written = {r['_id'] for r in mongo_db[RECORDS].find(
+        {'_id': {'$in': [c['record_id'] for c in stale.values()]}}, {'_id': 1})}
+    recovered = set()
+    for i in taken:
+        claim = stale.get(docs[i]['partner_message_id'])
+        if claim is None or claim['record_id'] in written:
+            continue
+        # Conditional on the old record_id, so only one resend takes the claim over
+        if mongo_db[CLAIMS].update_one({'_id': claim['_id'], 'record_id': claim['record_id']},
+                                       {'$set': {'record_id': docs[i]['_id'], 'at': now}}).modified_count:
+            recovered.add(i)
+    return recovered
+
+
+def _release(mongo_db, partner_id: str, docs: List[Dict[str, Any]]):
+    """Drop this upload's claims for docs whose records were not written, so a resend stores them."""
+    if docs:
+        mongo_db[CLAIMS].delete_many({'$or': [
+            {'_id': _claim_key(partner_id, d['partner_message_id']), 'record_id': d['_id']} for d in docs]})
+
+
+def _release_unwritten(mongo_db, partner_id: str, docs: List[Dict[str, Any]]):
+    """After an unexpected failure: release the claims of docs with no record. Best effort; claims
+    left behind are taken over by a resend once stale (see _claim)."""
+    try:
+        written = {r['_id'] for r in mongo_db[RECORDS].find({'_id': {'$in': [d['_id'] for d in docs]}}, {'_id': 1})}
+        _release(mongo_db, partner_id, [d for d in docs if d['_id'] not in written])
+    except Exception:
+        pass
+
+
+def _insert_chunk(mongo_db, partner_id: str, docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Unordered insert; returns (inserted docs, write errors). Claims of failed docs are released
+    so the partner can resend them."""
+    failed = set()
+    try:
+        mongo_db[RECORDS].bulk_write([InsertOne(d) for d in docs], ordered=False)
+    except BulkWriteError as e:
+        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+    if failed:
+        _release(mongo_db, partner_id, [docs[i] for i in failed])
+    return [d for i, d in enumerate(docs) if i not in failed], len(failed)
+
+
+def backfill_claims(mongo_db, batch_size: int = 5000) -> int:
+    """Claim every (partner, partner_message_id) already in RECORDS, e.g. records ingested while
+    the unique index on RECORDS still did the deduplication. Idempotent; returns new claims."""
+    now = int(time.time() * 1000)
+    added = 0
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        nonlocal added
+        try:
+            mongo_db[CLAIMS].insert_many(batch, ordered=False)
+            added += len(batch)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(err.get('code') != DUPLICATE_KEY for err in errors):
+                raise
+            added += len(batch) - len(errors)
+        batch.clear()
+
+    cursor = mongo_db[RECORDS].find({'partner_message_id': {'$exists': True}},
+                                    {'partner': 1, 'partner_message_id': 1})
+    for r in cursor.batch_size(batch_size):
+        batch.append({'_id': _claim_key(r.get('partner'), r['partner_message_id']), 'record_id': r['_id'], 'at': now})
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return added
+
+
+def ingest(mongo_db, partner_id: str, lines: Iterable[Tuple[int, bytes]], max_records: int = 100000,
+           inline_label_max: int = 5000) -> Dict[str, Any]:
+    """Validate, deduplicate, label and insert one upload; returns the summary sent to the partner."""
+    from .nlp_utils import analyze_sentiments_with_models
+
+    docs, stats = parse(lines, partner_id, max_records)
+    label_inline = len(docs) <= inline_label_max
+    inserted = labelled = queued = 0
+    for start in range(0, len(docs), CHUNK):
+        chunk = docs[start:start + CHUNK]
+        fresh = _claim(mongo_db, partner_id, chunk)
+        stats['duplicates'] += len(chunk) - len(fresh)
+        if not fresh:
+            continue
+
+        labels = model_ids = None
+        try:
+            if label_inline:
+                labels, model_ids = analyze_sentiments_with_models([d['text'] for d in fresh])
+            if labels is not None:
+                labelled_at = int(time.time() * 1000)
+                for d, lab, model_id in zip(fresh, labels, model_ids):
+                    d.update(sentiment=lab, sentiment_model=model_id, labelled_at=labelled_at)
+            written, failed = _insert_chunk(mongo_db, partner_id, fresh)
+        except Exception:
+            # Model load failure, lost connection...: never leave claims without records
+            _release_unwritten(mongo_db, partner_id, fresh)
+            raise
+        stats['failed'] += failed
+        inserted += len(written)
+        if labels is not None:
+            rollups.record_labels(mongo_db, [rollups.label_change(d, d['text'], None, d['sentiment'])
+                                             for d in written])
+            labelled += len(written)
+        else:
+            queued += labeling.enqueue_many(mongo_db, RECORDS, ((d['_id'], d['text']) for d in written))
+
+    return {
+        'received': stats['received'],
+        'inserted': inserted,
+        'duplicates': stats['duplicates'],
+        'rejected': stats['rejected'],
+        'failed': stats['failed'],  # write errors; safe to resend
+        'labelled': labelled,
+        'queued_for_labelling': queued,
+        'errors': stats['errors'],
+    }
@@ -0,0 +1,119 @@
+"""Write-time sentiment labelling.
+
+Writers call `enqueue` after inserting a complaint or sentiment record; the
+`label_sentiment` management command drains the queue in batches, runs the model
+once per text and stores `sentiment`, `sentiment_model` and `labelled_at` on the
+source document. Dashboards read those stored fields and never run the model.
+"""
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from .nlp_utils import analyze_sentiments_with_models
+from . import rollups
+
+QUEUE = 'sentiment_label_queue'
+# Source collection -> field holding the text to label
+SOURCES = {
+    'complaints': 'description',
+    'sentiment_records': 'text',
+}
+LABELS = ('positive', 'neutral', 'negative')
+
+
+def stored_sentiment(doc: Dict[str, Any]) -> Optional[str]:
+    """Label stored on a document: write-time `sentiment`, else the seeded/imported `label`."""
+    s = (doc.get('sentiment') or doc.get('label') or '')
+    s = s.lower() if isinstance(s, str) else ''
+    return s if s in LABELS else None
+
+
+def enqueue(mongo_db, source: str, doc_id, text: Optional[str]) -> bool:
+    """Queue one document for labelling. Never raises: a failed enqueue only delays the label."""
+    if source not in SOURCES or not (text or '').strip():
+        return False
+    try:
+        mongo_db[QUEUE].insert_one({
+            'source': source,
+            'doc_id': doc_id,
+            'text': text,
+            'enqueued_at': int(time.time() * 1000),
+        })
+        return True
+    except Exception:
+        return False
+
+
+def enqueue_unlabelled(mongo_db, source: str, limit: int = 0) -> int:
+    """Queue documents of `source` that carry neither `sentiment` nor `label` (backfill)."""
+    field = SOURCES[source]
+    q = {'sentiment': {'$exists': False}, 'label': {'$exists': False}, field: {'$nin': [None, '']}}
+    queued = {d['doc_id'] for d in mongo_db[QUEUE].find({'source': source}, {'doc_id': 1})}
+    cur = mongo_db[source].find(q, {field: 1})
+    if limit:
+        cur = cur.limit(limit)
+    return enqueue_many(mongo_db, source, ((d['_id'], d.get(field)) for d in cur if d['_id'] not in queued))
+
+
+def enqueue_many(mongo_db, source: str, pairs: Iterable[Tuple[Any, Optional[str]]]) -> int:
+    """Queue (doc_id, text) pairs of `source` in chunked unordered inserts; returns the number queued."""
+    now = int(time.time() * 1000)
+    items = [{'source': source, 'doc_id': doc_id, 'text': text, 'enqueued_at': now}
+             for doc_id, text in pairs if (text or '').strip()]
+    for i in range(0, len(items), 1000):
+        mongo_db[QUEUE].insert_many(items[i:i + 1000], ordered=False)
+    return len(items)
+
+
+def label_batch(mongo_db, items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Label queue items once and write the results back to their source documents."""
+    labels, model_ids = analyze_sentiments_with_models([it.get('text') or '' for it in items])
+    if labels is None:
+        # No model available here; leave the items queued for a worker that has one
+        return {'labelled': 0}
+
+    labelled_at = int(time.time() * 1000)
+    by_source = defaultdict(list)
+    for it, lab, model_id in zip(items, labels, model_ids):
+        by_source[it['source']].append((it, lab, model_id))
+    changes = []
+    for source, pairs in by_source.items():
+        # Previous labels let the rollups apply deltas instead of double counting relabels
+        prev = {d['_id']: d for d in mongo_db[source].find(
+            {'_id': {'$in': [it['doc_id'] for it, _lab, _model in pairs]}},
+            rollups.ROLLUP_FIELDS,
+        )}
+        ops = []
+        for it, lab, model_id in pairs:
+            doc = prev.get(it['doc_id'])
+            if doc is None:
+                continue  # deleted since it was queued
+            ops.append(UpdateOne({'_id': it['doc_id']}, {'$set': {
+                'sentiment': lab,
+                'sentiment_model': model_id,
+                'labelled_at': labelled_at,
+            }}))
+            changes.append(rollups.label_change(doc, it.get('text'), stored_sentiment(doc), lab))
+        if ops:
+            mongo_db[source].bulk_write(ops, ordered=False)
+    rollups.record_labels(mongo_db, changes)
+    mongo_db[QUEUE].delete_many({'_id': {'$in': [it['_id'] for it in items]}})
+    return {'labelled': len(items)}
+
+
+def drain(mongo_db, batch_size: int = 256, max_batches: int = 100) -> Dict[str, int]:
+    """Label queued texts oldest first until the queue is empty or `max_batches` is reached."""
+    labelled = 0
+    for _ in range(max_batches):
+        items = list(mongo_db[QUEUE].find({}).sort('_id', 1).limit(batch_size))
+        if not items:
+            break
+        res = label_batch(mongo_db, items)
+        if not res['labelled']:
+            break
+        labelled += res['labelled']
+        if len(items) < batch_size:
+            break
+    return {'labelled': labelled, 'pending': mongo_db[QUEUE].count_documents({})}
@@ -0,0 +1,80 @@
+"""Cheap script / language routing for sentiment inference.
+
+detect_route() looks only at Unicode code points and a small romanized-Hindi
+lexicon, so it costs microseconds per text. English goes to the small English
+model. Indic scripts, Hinglish and other non-Latin text go to the
+multilingual model.
+"""
+import re
+from typing import Dict, List
+
+ROUTE_ENGLISH = 'en'
+ROUTE_MULTILINGUAL = 'multilingual'
+
+# Unicode blocks of the scripts used for Indian languages (plus Arabic script for Urdu/Kashmiri)
+INDIC_BLOCKS = (
+    (0x0900, 0x097F),  # Devanagari: Hindi, Marathi, Nepali, ...
+    (0x0980, 0x09FF),  # Bengali / Assamese
+    (0x0A00, 0x0A7F),  # Gurmukhi
+    (0x0A80, 0x0AFF),  # Gujarati
+    (0x0B00, 0x0B7F),  # Odia
+    (0x0B80, 0x0BFF),  # Tamil
+    (0x0C00, 0x0C7F),  # Telugu
+    (0x0C80, 0x0CFF),  # Kannada
+    (0x0D00, 0x0D7F),  # Malayalam
+    (0x0600, 0x06FF),  # Arabic (Urdu)
+    (0xA8E0, 0xA8FF),  # Devanagari Extended
+)
+
+# Frequent romanized Hindi/Urdu words that are not English words
+HINGLISH_WORDS = frozenset("""
+hai hain tha thi nahi nahin nhi kya kyu kyun kab kaise kaun kahan kuch bahut bohot
+mera meri mere mujhe hum humko hamara hamari aap aapka apna apni unka uska iska yeh ye
+woh wo vo bhi aur lekin kar karo karna kiya gaya gayi raha rahi rahe hota hoti
+abhi tak sab koi kisi wala wali wale diya liya mila mili milta milega chahiye sakta sakte
+paisa paise sarkar yojana dikkat pareshani shikayat bijli pani sadak jaldi accha acha
+achha bura theek thik ji bhai kal aaj saal mahina
+""".split())
+
+_WORD = re.compile(r"[a-z]+")
+_INDIC = re.compile('[' + ''.join(f'\\u{lo:04x}-\\u{hi:04x}' for lo, hi in INDIC_BLOCKS) + ']')
+
+
+def indic_fraction(text: str) -> float:
+    """Share of alphabetic characters in an Indic (or Arabic) script block."""
+    letters = sum(1 for ch in text if ch.isalpha())
+    if not letters:
+        return 0.0
+    indic = sum(1 for ch in _INDIC.findall(text) if ch.isalpha())
+    return indic / letters
+
+
+def is_hinglish(text: str, min_hits: int = 2, min_ratio: float = 0.15) -> bool:
+    words = _WORD.findall(text.lower())
+    if not words:
+        return False
+    hits = sum(1 for w in words if w in HINGLISH_WORDS)
+    return hits >= min_hits and hits / len(words) >= min_ratio
+
+
+def detect_route(text: str) -> str:
+    text = text or ''
+    if text.isascii():
+        return ROUTE_MULTILINGUAL if is_hinglish(text) else ROUTE_ENGLISH
+    if indic_fraction(text) >= 0.2:
+        return ROUTE_MULTILINGUAL
+    # Any other non-ASCII letters (e.g. CJK, Cyrillic) also need the multilingual model
+    letters = [ch for ch in text if ch.isalpha()]
+    if letters and sum(1 for ch in letters if ord(ch) > 0x24F) / len(letters) >= 0.2:
+        return ROUTE_MULTILINGUAL
+    if is_hinglish(text):
+        return ROUTE_MULTILINGUAL
+    return ROUTE_ENGLISH
+
+
+def split_by_route(texts: List[str]) -> Dict[str, List[int]]:
+    """Route -> indices into `texts`, preserving order within each route."""
+    routes: Dict[str, List[int]] = {}
+    for i, t in enumerate(texts):
+        routes.setdefault(detect_route(t), []).append(i)
+    return routes
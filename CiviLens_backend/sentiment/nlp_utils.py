@@ -1,4 +1,10 @@
-from typing import List, Tuple, Optional
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple, Optional
+
+from .embedding_cache import dedupe, get_cache, text_key
+from .language import ROUTE_ENGLISH, ROUTE_MULTILINGUAL, split_by_route
+from . import onnx_backend
 
 # Optional deps: sentence-transformers (preferred), transformers (fallback).
 try:
@@ -13,18 +19,53 @@ except Exception:  # pragma: no cover
     util = None  # type: ignore
 
 
+ST_MODEL_NAME = os.environ.get('SENTIMENT_ST_MODEL', "sentence-transformers/all-MiniLM-L6-v2")
+# Identifier stored with write-time labels; bump the suffix when the prototype head changes
+ST_MODEL_ID = f"{ST_MODEL_NAME}+prototypes-v1"
+MULTILINGUAL_MODEL_NAME = os.environ.get('SENTIMENT_MULTILINGUAL_MODEL', "cardiffnlp/twitter-xlm-roberta-base-sentiment")
+ENGLISH_MODEL_NAME = os.environ.get('SENTIMENT_ENGLISH_MODEL', "distilbert-base-uncased-finetuned-sst-2-english")
+
 _st_model = None  # cached sentence-transformers model
+_sentiment_pipeline = None  # cached transformers pipeline
+_english_pipeline = None  # cached English-only transformers pipeline
+
+
+def _setting(name: str, default):
+    """Django setting when settings are configured (web/commands), else the env var (scripts)."""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except Exception:
+        pass
+    return os.environ.get(name, default)
+
+
+def _load_onnx(kind: str):
+    """Exported ONNX encoder/classifier when SENTIMENT_BACKEND=onnx, else None (use PyTorch)."""
+    if str(_setting('SENTIMENT_BACKEND', 'torch')).lower() != 'onnx' or not onnx_backend.available():
+        return None
+    model_dir = os.path.join(str(_setting('SENTIMENT_ONNX_DIR', os.path.join('models', 'onnx'))), kind)
+    quantized = str(_setting('SENTIMENT_ONNX_QUANTIZED', True)).lower() in ('1', 'true', 'yes')
+    cls = onnx_backend.OnnxEncoder if kind == 'encoder' else onnx_backend.OnnxClassifier
+    try:
+        return cls(model_dir, threads=int(_setting('SENTIMENT_ONNX_THREADS', 0) or 0), quantized=quantized)
+    except Exception:
+        return None
 
 
 def get_st_model():
     """Load sentence-transformers model 'sentence-transformers/all-MiniLM-L6-v2' if available."""
     global _st_model
+    if _st_model is not None:
+        return _st_model
+    _st_model = _load_onnx('encoder')
     if _st_model is not None:
         return _st_model
     if SentenceTransformer is None:
         return None
     try:
-        _st_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        _st_model = SentenceTransformer(ST_MODEL_NAME)
         return _st_model
     except Exception:
         return None
@@ -35,15 +76,21 @@ def get_sentiment_pipeline():
     Try to create a multilingual sentiment pipeline. Returns None if transformers
     is not installed or model cannot be loaded.
     Models tried (in order):
-    - cardiffnlp/twitter-xlm-roberta-base-sentiment
+    - MULTILINGUAL_MODEL_NAME (cardiffnlp/twitter-xlm-roberta-base-sentiment)
     - distilbert-base-multilingual-cased
     - distilbert-base-uncased-finetuned-sst-2-english (English only)
     """
+    global _sentiment_pipeline
+    if _sentiment_pipeline is not None:
+        return _sentiment_pipeline
+    _sentiment_pipeline = _load_onnx('classifier')
+    if _sentiment_pipeline is not None:
+        return _sentiment_pipeline
     if pipeline is None:
         return None
     model_candidates = [
         # widely used multilingual sentiment
-        ("sentiment-analysis", "cardiffnlp/twitter-xlm-roberta-base-sentiment"),
+        ("sentiment-analysis", MULTILINGUAL_MODEL_NAME),
         # generic multilingual cased (may fall back to POSITIVE/NEGATIVE labels)
         ("sentiment-analysis", "distilbert-base-multilingual-cased"),
         # English fallback
@@ -51,12 +98,32 @@ def get_sentiment_pipeline():
     ]
     for task, model in model_candidates:
         try:
-            return pipeline(task, model=model)
+            _sentiment_pipeline = pipeline(task, model=model)
+            return _sentiment_pipeline
         except Exception:
             continue
     # Final fallback: let transformers select default for task
     try:
-        return pipeline("sentiment-analysis")
+        _sentiment_pipeline = pipeline("sentiment-analysis")
+        return _sentiment_pipeline
+    except Exception:
+        return None
+
+
+def get_english_pipeline():
+    """English-only DistilBERT (SST-2) pipeline for texts routed as English. Several times
+    cheaper than XLM-R per text; returns None if it cannot be loaded."""
+    global _english_pipeline
+    if _english_pipeline is not None:
+        return _english_pipeline
+    _english_pipeline = _load_onnx('classifier_en')
+    if _english_pipeline is not None:
+        return _english_pipeline
+    if pipeline is None:
+        return None
+    try:
+        _english_pipeline = pipeline("sentiment-analysis", model=ENGLISH_MODEL_NAME)
+        return _english_pipeline
     except Exception:
         return None
 
@@ -96,77 +163,244 @@ def map_label_to_triple(label: str, score: float | None = None) -> str:
     return "neutral"
 
 
+# Prototypical sentences for each class, grouped by label in PROTO_LABELS order
+PROTO_LABELS = ['positive', 'neutral', 'negative']
+PROTOTYPES = {
+    'positive': [
+        "I am satisfied and happy with this.",
+        "This experience was good and helpful.",
+    ],
+    'neutral': [
+        "This is an objective statement without strong emotion.",
+        "The message is informational and balanced.",
+    ],
+    'negative': [
+        "I am dissatisfied and unhappy with this.",
+        "This experience was bad and problematic.",
+    ],
+}
+PROTOS_PER_LABEL = 2
+
+_proto_cache = {}  # id(model) -> (model, prototype embeddings [num_labels * PROTOS_PER_LABEL, dim])
+
+
+def get_prototype_embeddings(st):
+    """Prototype embeddings for a loaded sentence-transformers model, encoded once per model."""
+    cached = _proto_cache.get(id(st))
+    if cached is not None and cached[0] is st:
+        return cached[1]
+    proto_texts = [p for lab in PROTO_LABELS for p in PROTOTYPES[lab]]
+    emb = st.encode(proto_texts, convert_to_tensor=True, show_progress_bar=False)
+    _proto_cache[id(st)] = (st, emb)
+    return emb
+
+
+def prototype_labels(sim) -> List[str]:
+    """Label each row of a [batch, num_protos] similarity matrix.
+
+    Max over each label's prototypes, then argmax over labels. torch.argmax returns
+    the first maximum, matching the previous row-by-row loop's strict '>' tie-break.
+    """
+    if sim.shape[0] == 0:
+        return []
+    per_label = sim.view(sim.shape[0], len(PROTO_LABELS), PROTOS_PER_LABEL).max(dim=2).values
+    return [PROTO_LABELS[i] for i in per_label.argmax(dim=1).tolist()]
+
+
 def analyze_sentiments(texts: List[str]) -> Optional[List[str]]:
     """
-    Run sentence-transformers prototype similarity if available.
-    Otherwise run transformers sentiment pipeline.
-    Returns list of 'positive'/'neutral'/'negative' or None if not available.
+    Label texts with the cheapest adequate model for their script/language
+    (see _ROUTE_BACKENDS). Returns list of 'positive'/'neutral'/'negative' or
+    None if not available.
     """
-    # Preferred: sentence-transformers zero-shot via prototype similarity
+    return analyze_sentiments_with_models(texts)[0]
+
+
+def _st_backend():
+    """sentence-transformers zero-shot via prototype similarity -> (model_id, dim, infer) or None."""
     st = get_st_model()
-    if st is not None and util is not None:
-        try:
-            # Prototypical sentences for each class
-            protos = {
-                'positive': [
-                    "I am satisfied and happy with this.",
-                    "This experience was good and helpful.",
-                ],
-                'neutral': [
-                    "This is an objective statement without strong emotion.",
-                    "The message is informational and balanced.",
-                ],
-                'negative': [
-                    "I am dissatisfied and unhappy with this.",
-                    "This experience was bad and problematic.",
-                ],
-            }
-            # Pre-embed prototypes
-            proto_texts: List[Tuple[str, str]] = []  # (label, text)
-            for lab, lst in protos.items():
-                for p in lst:
-                    proto_texts.append((lab, p))
-            proto_emb = st.encode([p for (_lab, p) in proto_texts], convert_to_tensor=True, show_progress_bar=False)
-            out: List[str] = []
-            chunk = 64
-            for i in range(0, len(texts), chunk):
-                batch = texts[i:i+chunk]
-                emb = st.encode(batch, convert_to_tensor=True, show_progress_bar=False)
-                # cosine similarities to each prototype
-                sim = util.cos_sim(emb, proto_emb)  # [batch, num_protos]
-                for row in sim:
-                    # aggregate by label (max over prototypes of that label)
-                    best_label = 'neutral'
-                    best_score = -1.0
-                    idx = 0
-                    for lab, _p in proto_texts:
-                        score = float(row[idx])
-                        if score > best_score:
-                            best_score = score
-                            best_label = lab
-                        idx += 1
-                    out.append(best_label)
-            return out
-        except Exception:
-            pass
+    if st is None or util is None:
+        return None
+    proto_emb = get_prototype_embeddings(st)
+
+    def infer_st(batch):
+        emb = st.encode(batch, batch_size=64, convert_to_tensor=True, show_progress_bar=False)
+        # cosine similarities to each prototype
+        return prototype_labels(util.cos_sim(emb, proto_emb)), emb.cpu().numpy()  # [batch, num_protos]
+
+    # ONNX encoders carry a '+onnx-int8' suffix so their labels and cache rows stay separate
+    model_id = ST_MODEL_ID + getattr(st, 'suffix', '')
+    return model_id, int(st.get_sentence_embedding_dimension() or 0), infer_st
+
 
-    # Fallback: transformers pipeline
-    sp = get_sentiment_pipeline()
+def _pipeline_backend(sp):
     if sp is None:
         return None
-    try:
+    model_id = getattr(getattr(sp, 'model', None), 'name_or_path', None) or 'transformers-pipeline'
+
+    def infer_pipeline(batch):
         out2: List[str] = []
         chunk = 64
-        for i in range(0, len(texts), chunk):
-            batch = texts[i:i+chunk]
-            preds = sp(batch, truncation=True)
+        for i in range(0, len(batch), chunk):
+            preds = sp(batch[i:i+chunk], truncation=True)
             for p in preds:
                 label = str(p.get("label"))
                 score = float(p.get("score", 1.0)) if isinstance(p, dict) else None
                 out2.append(map_label_to_triple(label, score))
-        return out2
+        return out2, None
+
+    return model_id, 0, infer_pipeline
+
+
+def _english_backend():
+    return _pipeline_backend(get_english_pipeline())
+
+
+def _multilingual_backend():
+    return _pipeline_backend(get_sentiment_pipeline())
+
+
+# Backends tried in order per route. English texts never need XLM-R unless nothing
+# cheaper loads; Indic-script and Hinglish texts skip the English-only models.
+_ROUTE_BACKENDS = {
+    ROUTE_ENGLISH: (_st_backend, _english_backend, _multilingual_backend),
+    ROUTE_MULTILINGUAL: (_multilingual_backend, _st_backend),
+}
+# SENTIMENT_ROUTING=false: one model for every text (the pre-routing behaviour)
+_UNROUTED_BACKENDS = (_st_backend, _multilingual_backend)
+
+
+def _routing_enabled() -> bool:
+    return str(_setting('SENTIMENT_ROUTING', True)).lower() in ('1', 'true', 'yes')
+
+
+def _label_with_first_backend(texts: List[str], backends) -> Tuple[Optional[List[str]], Optional[str]]:
+    for make in backends:
+        try:
+            backend = make()
+            if backend is None:
+                continue
+            model_id, dim, infer = backend
+            return _label_with_cache(texts, model_id, dim, infer), model_id
+        except Exception:
+            continue
+    return None, None
+
+
+def current_model_ids() -> List[str]:
+    """Ids of the models analyze_sentiments_with_models labels with right now, one per language
+    route (sorted, deduplicated). Loads the models, like a first labelling call would."""
+    chains = list(_ROUTE_BACKENDS.values()) if _routing_enabled() else [_UNROUTED_BACKENDS]
+    ids = set()
+    for backends in chains:
+        for make in backends:
+            try:
+                backend = make()
+            except Exception:
+                continue
+            if backend is not None:
+                ids.add(backend[0])
+                break
+    return sorted(ids)
+
+
+def analyze_sentiments_with_models(texts: List[str]) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """Same as analyze_sentiments, but also returns, per text, the id of the model that
+    produced its label (stored as `sentiment_model` by write-time labelling).
+
+    Texts are split by sentiment.language.detect_route, each route is labelled in its
+    own batch and the labels are merged back in input order. Repeated texts are
+    labelled once per call, and labels (plus embeddings for the sentence-transformers
+    path) persist in sentiment.embedding_cache across calls.
+    """
+    if not texts:
+        return [], []
+    if not _routing_enabled():
+        labels, model_id = _label_with_first_backend(texts, _UNROUTED_BACKENDS)
+        return (labels, [model_id] * len(texts)) if labels is not None else (None, None)
+
+    labels: List[Optional[str]] = [None] * len(texts)
+    model_ids: List[Optional[str]] = [None] * len(texts)
+    for route, idx in split_by_route(texts).items():
+        route_labels, model_id = _label_with_first_backend([texts[i] for i in idx], _ROUTE_BACKENDS[route])
+        if route_labels is None:
+            return None, None
+        for i, lab in zip(idx, route_labels):
+            labels[i] = lab
+            model_ids[i] = model_id
+    return labels, model_ids
+
+
+def _label_with_cache(texts: List[str], model_id: str, dim: int, infer) -> List[str]:
+    """Dedupe `texts`, serve cached labels and run `infer` (-> labels, embeddings|None) on misses only."""
+    if not texts:
+        return []
+    unique, inverse = dedupe(texts)
+    keys = [text_key(model_id, t) for t in unique]
+    cache = get_cache(model_id, dim)
+    try:
+        hits = cache.lookup(keys) if cache is not None else {}
     except Exception:
+        hits = {}
+    labels: List[Optional[str]] = [hits[k][0] if k in hits else None for k in keys]
+    # Length-sorted misses keep padding low inside each model batch
+    miss = sorted((i for i, lab in enumerate(labels) if lab is None), key=lambda i: len(unique[i]))
+    if miss:
+        miss_labels, miss_emb = infer([unique[i] for i in miss])
+        for i, lab in zip(miss, miss_labels):
+            labels[i] = lab
+        if cache is not None:
+            try:
+                cache.add([keys[i] for i in miss], miss_labels, miss_emb if dim else None)
+            except Exception:
+                pass  # a read-only or full disk only costs future cache hits
+    return [labels[i] for i in inverse]
+
+
+def analyze_grouped(groups: Dict[Any, List[str]], workers: int = 0) -> Optional[Dict[Any, List[str]]]:
+    """Label the texts of many groups (e.g. regions) in one deduplicated, batched pass
+    and scatter the labels back per group. Returns None if no model is available.
+
+    The in-process path goes through sentiment.broker, so concurrent requests share
+    forward passes."""
+    flat: List[str] = []
+    bounds = []
+    for key, texts in groups.items():
+        start = len(flat)
+        flat.extend(texts)
+        bounds.append((key, start, len(flat)))
+    if workers > 1:
+        labels = analyze_sentiments_parallel(flat, workers)
+    else:
+        from . import broker
+        labels = broker.analyze_sentiments(flat)
+    if labels is None:
+        return None
+    return {key: labels[start:end] for key, start, end in bounds}
+
+
+def _pool_init():
+    # One intra-op thread per process; the pool supplies the parallelism
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except Exception:
+        pass
+
+
+def analyze_sentiments_parallel(texts: List[str], workers: int, chunk_size: int = 2048) -> Optional[List[str]]:
+    """analyze_sentiments over a process pool for very large windows. Each worker loads its
+    own model (or inherits it on fork); small inputs stay in-process."""
+    unique, inverse = dedupe(texts)
+    if workers <= 1 or len(unique) < 2 * chunk_size:
+        return analyze_sentiments(texts)
+    chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init) as ex:
+        parts = list(ex.map(analyze_sentiments, chunks))
+    if any(p is None for p in parts):
         return None
+    flat = [lab for part in parts for lab in part]
+    return [flat[i] for i in inverse]
 
 
 def top_tfidf_keywords(texts: List[str], top_k: int = 20) -> List[Tuple[str, float]]:
@@ -0,0 +1,206 @@
+"""ONNX Runtime CPU backend for the sentiment models.
+
+`export_encoder` / `export_classifier` trace the PyTorch models to ONNX and apply
+dynamic int8 weight quantization. `OnnxEncoder` and `OnnxClassifier` load an
+export and mimic the small slices of the SentenceTransformer / transformers
+pipeline APIs that sentiment.nlp_utils uses, so the rest of the code is unchanged.
+
+Export once with `python manage.py export_sentiment_onnx`, then set
+SENTIMENT_BACKEND=onnx (see settings.py).
+"""
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Optional deps: onnxruntime for inference, onnx + torch for export.
+try:
+    import onnxruntime as ort  # type: ignore
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+
+try:
+    from transformers import AutoTokenizer  # type: ignore
+except Exception:  # pragma: no cover
+    AutoTokenizer = None  # type: ignore
+
+MODEL_FILE = 'model.onnx'
+QUANTIZED_FILE = 'model.int8.onnx'
+META_FILE = 'backend.json'
+OPSET = 17
+
+
+def available() -> bool:
+    return ort is not None and AutoTokenizer is not None
+
+
+# -------------------- export --------------------
+def _export(module, tokenizer, out_dir: str, output_names: List[str], quantize: bool) -> List[str]:
+    import torch
+
+    os.makedirs(out_dir, exist_ok=True)
+    module.eval()
+    sample = tokenizer(['export sample text', 'a second, longer sample sentence for tracing'],
+                       padding=True, truncation=True, return_tensors='pt')
+    input_names = [k for k in ('input_ids', 'attention_mask', 'token_type_ids') if k in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    for name in output_names:
+        dynamic_axes[name] = {0: 'batch'}
+    fp32_path = os.path.join(out_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            module, tuple(sample[k] for k in input_names), fp32_path,
+            input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes,
+            opset_version=OPSET, do_constant_folding=True, dynamo=False,
+        )
+    tokenizer.save_pretrained(out_dir)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType  # type: ignore
+        quantize_dynamic(fp32_path, os.path.join(out_dir, QUANTIZED_FILE), weight_type=QuantType.QInt8)
+    return input_names
+
+
+def export_encoder(st, out_dir: str, source: str, quantize: bool = True) -> Dict[str, Any]:
+    """Export a loaded SentenceTransformer's transformer body; pooling runs in numpy."""
+    import torch
+
+    transformer = st[0]
+    model = transformer.auto_model
+
+    class _Body(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, *inputs):
+            return self.m(*inputs).last_hidden_state
+
+    pooling = 'mean'
+    for mod in list(st)[1:]:
+        mode = str(getattr(mod, 'pooling_mode', '') or '')
+        if getattr(mod, 'pooling_mode_cls_token', False) or mode == 'cls' or 'cls' in mode.lower():
+            pooling = 'cls'
+    input_names = _export(_Body(model), transformer.tokenizer, out_dir, ['last_hidden_state'], quantize)
+    meta = {
+        'kind': 'encoder',
+        'source': source,
+        'inputs': input_names,
+        'pooling': pooling,
+        'dim': int(st.get_sentence_embedding_dimension()),
+        'max_seq_length': int(getattr(st, 'max_seq_length', 256) or 256),
+        'quantized': quantize,
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def export_classifier(model, tokenizer, out_dir: str, source: str, quantize: bool = True) -> Dict[str, Any]:
+    """Export a transformers sequence-classification model (logits output)."""
+    import torch
+
+    class _Logits(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, *inputs):
+            return self.m(*inputs).logits
+
+    input_names = _export(_Logits(model), tokenizer, out_dir, ['logits'], quantize)
+    meta = {
+        'kind': 'classifier',
+        'source': source,
+        'inputs': input_names,
+        'id2label': {str(k): v for k, v in model.config.id2label.items()},
+        'max_seq_length': int(min(getattr(tokenizer, 'model_max_length', 512) or 512, 512)),
+        'quantized': quantize,
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# -------------------- inference --------------------
+class _OnnxModel:
+    def __init__(self, model_dir: str, threads: int = 0, quantized: bool = True):
+        if not available():
+            raise RuntimeError('onnxruntime and transformers are required for the ONNX backend')
+        with open(os.path.join(model_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        path = os.path.join(model_dir, QUANTIZED_FILE)
+        self.quantized = quantized and os.path.exists(path)
+        if not self.quantized:
+            path = os.path.join(model_dir, MODEL_FILE)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.inputs = self.meta['inputs']
+        self.max_len = int(self.meta.get('max_seq_length') or 256)
+        self.suffix = '+onnx-int8' if self.quantized else '+onnx'
+
+    def _run(self, texts: List[str]):
+        enc = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_len, return_tensors='np')
+        feeds = {k: enc[k].astype(np.int64) for k in self.inputs}
+        return self.session.run(None, feeds)[0], enc['attention_mask']
+
+
+class OnnxEncoder(_OnnxModel):
+    """Drop-in for SentenceTransformer.encode / get_sentence_embedding_dimension."""
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.meta['dim'])
+
+    def encode(self, texts: List[str], batch_size: int = 64, convert_to_tensor: bool = False,
+               show_progress_bar: bool = False, **kwargs):
+        out = []
+        # Length-sorted batches keep padding (and wasted FLOPs) low
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            hidden, mask = self._run([texts[j] for j in idx])
+            if self.meta.get('pooling') == 'cls':
+                pooled = hidden[:, 0]
+            else:
+                m = mask[..., None].astype(np.float32)
+                pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            out.append((idx, pooled))
+        emb = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for idx, pooled in out:
+            emb[idx] = pooled
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(emb)
+        return emb
+
+
+class _ModelInfo:
+    def __init__(self, name_or_path: str):
+        self.name_or_path = name_or_path
+
+
+class OnnxClassifier(_OnnxModel):
+    """Drop-in for a transformers 'sentiment-analysis' pipeline: returns [{'label', 'score'}]."""
+
+    def __init__(self, model_dir: str, threads: int = 0, quantized: bool = True):
+        super().__init__(model_dir, threads, quantized)
+        self.id2label = {int(k): v for k, v in self.meta['id2label'].items()}
+        self.model = _ModelInfo(self.meta['source'] + self.suffix)
+
+    def __call__(self, texts: List[str], truncation: bool = True, batch_size: int = 64, **kwargs):
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            logits, _mask = self._run([texts[j] for j in idx])
+            z = logits - logits.max(axis=1, keepdims=True)
+            probs = np.exp(z) / np.exp(z).sum(axis=1, keepdims=True)
+            best = probs.argmax(axis=1)
+            for j, b, p in zip(idx, best, probs):
+                results[j] = {'label': self.id2label[int(b)], 'score': float(p[b])}
+        return results
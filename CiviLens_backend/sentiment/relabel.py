@@ -0,0 +1,148 @@
+"""Resumable, sharded relabelling of stored sentiment (manage.py relabel_sentiment).
+
+A run splits each source collection into `_id` ranges and hands one range to
+each worker process. A worker pages through its range in `_id` order, labels a
+batch in one model call, writes the labels with an unordered bulk_write,
+applies the rollup deltas and then advances its checkpoint. A crashed or
+interrupted run restarts from the last checkpoint of every unfinished shard.
+
+Workers are spawned (not forked), so each opens its own MongoDB client and
+loads its own model.
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+RUNS = 'sentiment_relabel_runs'
+CHECKPOINTS = 'sentiment_relabel_checkpoints'
+
+
+def shard_bounds(col, shards: int) -> List[Optional[Any]]:
+    """`shards + 1` _id boundaries ([None, b1, ..., None]); open ends are unbounded."""
+    n = col.estimated_document_count()
+    bounds: List[Optional[Any]] = [None]
+    for k in range(1, shards):
+        doc = next(iter(col.find({}, {'_id': 1}).sort('_id', 1).skip(k * n // shards).limit(1)), None)
+        if doc is not None and (len(bounds) == 1 or doc['_id'] != bounds[-1]):
+            bounds.append(doc['_id'])
+    bounds.append(None)
+    return bounds
+
+
+def plan_run(mongo_db, run_id: str, sources: Dict[str, str], shards: int, restart: bool = False) -> List[Dict[str, Any]]:
+    """Create (or, unless `restart`, reuse) the shard checkpoints of a run."""
+    if restart:
+        mongo_db[RUNS].delete_one({'_id': run_id})
+        mongo_db[CHECKPOINTS].delete_many({'run_id': run_id})
+    if mongo_db[RUNS].find_one({'_id': run_id}) is None:
+        docs = []
+        for source in sources:
+            bounds = shard_bounds(mongo_db[source], shards)
+            for i in range(len(bounds) - 1):
+                docs.append({
+                    '_id': f'{run_id}:{source}:{i}',
+                    'run_id': run_id,
+                    'source': source,
+                    'shard': i,
+                    'lo': bounds[i],
+                    'hi': bounds[i + 1],
+                    'last_id': None,
+                    'done': False,
+                    'labelled': 0,
+                    'scanned': 0,
+                })
+        if docs:
+            mongo_db[CHECKPOINTS].insert_many(docs)
+        mongo_db[RUNS].insert_one({'_id': run_id, 'sources': list(sources), 'shards': shards,
+                                   'started_at': int(time.time() * 1000)})
+    return list(mongo_db[CHECKPOINTS].find({'run_id': run_id, 'done': False}).sort('_id', 1))
+
+
+def progress(mongo_db, run_id: str) -> Dict[str, int]:
+    out = {'labelled': 0, 'scanned': 0, 'shards': 0, 'done': 0}
+    for ck in mongo_db[CHECKPOINTS].find({'run_id': run_id}, {'labelled': 1, 'scanned': 1, 'done': 1}):
+        out['labelled'] += int(ck.get('labelled') or 0)
+        out['scanned'] += int(ck.get('scanned') or 0)
+        out['shards'] += 1
+        out['done'] += 1 if ck.get('done') else 0
+    return out
+
+
+def _range_filter(ck: Dict[str, Any]) -> Dict[str, Any]:
+    rng: Dict[str, Any] = {}
+    if ck.get('last_id') is not None:
+        rng['$gt'] = ck['last_id']
+    elif ck.get('lo') is not None:
+        rng['$gte'] = ck['lo']
+    if ck.get('hi') is not None:
+        rng['$lt'] = ck['hi']
+    return {'_id': rng} if rng else {}
+
+
+def init_worker():
+    """Process-pool initializer: configure Django so workers read the same settings as the parent."""
+    import os
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        import django
+        django.setup()
+    try:
+        import torch
+        torch.set_num_threads(1)  # the pool supplies the parallelism
+    except Exception:
+        pass
+
+
+def relabel_shard(checkpoint_id: str, text_field: str, batch_size: int, skip_current: bool = True) -> Dict[str, Any]:
+    """Worker entry point: relabel one shard from its checkpoint to the end of its range."""
+    from db_connection import db as mongo_db
+    from . import rollups
+    from .labeling import stored_sentiment
+    from .nlp_utils import analyze_sentiments_with_models
+
+    ck_col = mongo_db[CHECKPOINTS]
+    ck = ck_col.find_one({'_id': checkpoint_id})
+    if ck is None or ck.get('done'):
+        return {'checkpoint': checkpoint_id, 'labelled': 0}
+    col = mongo_db[ck['source']]
+    labelled = 0
+    current = set()  # model ids that produced labels in this shard (one per language route)
+    while True:
+        docs = list(col.find(_range_filter(ck), {**rollups.ROLLUP_FIELDS, text_field: 1, 'sentiment_model': 1})
+                    .sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+        todo = [d for d in docs if (d.get(text_field) or '').strip()
+                and not (skip_current and d.get('sentiment_model') in current)]
+        written = 0
+        if todo:
+            labels, model_ids = analyze_sentiments_with_models([d[text_field] for d in todo])
+            if labels is None:
+                raise RuntimeError('no sentiment model available in worker')
+            current.update(model_ids)
+            labelled_at = int(time.time() * 1000)
+            ops, changes = [], []
+            for d, lab, model_id in zip(todo, labels, model_ids):
+                if skip_current and d.get('sentiment_model') == model_id:
+                    continue  # already labelled by this model (seen before its id was known)
+                ops.append(UpdateOne({'_id': d['_id']}, {'$set': {
+                    'sentiment': lab,
+                    'sentiment_model': model_id,
+                    'labelled_at': labelled_at,
+                }}))
+                changes.append(rollups.label_change(d, d[text_field], stored_sentiment(d), lab))
+            if ops:
+                col.bulk_write(ops, ordered=False)
+                rollups.record_labels(mongo_db, changes)
+            written = len(ops)
+            labelled += written
+        # Checkpoint only after the batch's writes are acknowledged
+        ck['last_id'] = docs[-1]['_id']
+        ck_col.update_one({'_id': checkpoint_id}, {
+            '$set': {'last_id': ck['last_id'], 'updated_at': int(time.time() * 1000)},
+            '$inc': {'labelled': written, 'scanned': len(docs)},
+        })
+        if len(docs) < batch_size:
+            break
+    ck_col.update_one({'_id': checkpoint_id}, {'$set': {'done': True, 'models': sorted(current)}})
+    return {'checkpoint': checkpoint_id, 'labelled': labelled}
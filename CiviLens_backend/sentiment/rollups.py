@@ -0,0 +1,254 @@
+"""Pre-aggregated sentiment statistics maintained at labelling time.
+
+sentiment_daily: one document per (date, canonical region, category) with
+positive / neutral / negative counts; serves the overview trends and category
+ratios, the admin sparkline and the per-state heatmap.
+
+sentiment_terms_daily: one document per (date, term) with the number of texts
+containing the term (`df`) and how many of those were positive / neutral /
+negative. The reserved term DOCS_TERM holds the day's text count, which gives
+the N for idf. Keyword trends over any window merge day buckets in Mongo and
+never refit a vectorizer or scan raw text.
+
+Updates are deltas: a first label adds the text, a changed label moves its
+counts between labels, an unchanged label is a no-op. So re-running the
+labeller never double counts. `manage.py rebuild_sentiment_rollups` recomputes
+everything from the stored labels.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+DAILY = 'sentiment_daily'
+TERMS = 'sentiment_terms_daily'
+UNKNOWN_REGION = 'Unknown'
+# Source fields needed to place a document in the rollups
+ROLLUP_FIELDS = {'created_at': 1, 'sentiment': 1, 'label': 1, 'region': 1, 'state': 1, 'location': 1,
+                 'category': 1, 'topic': 1}
+DOCS_TERM = '#docs'  # never produced by the analyzer's \w\w+ token pattern
+LABELS = ('positive', 'neutral', 'negative')
+WRITE_CHUNK = 1000
+
+_analyzer = None
+
+
+def _get_analyzer():
+    """Same tokenization as top_tfidf_keywords: lowercase, English stop words, 1-2 grams."""
+    global _analyzer
+    if _analyzer is None:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        _analyzer = TfidfVectorizer(ngram_range=(1, 2), stop_words='english').build_analyzer()
+    return _analyzer
+
+
+def doc_terms(text: str) -> set:
+    return set(_get_analyzer()(text or ''))
+
+
+def parse_dt(v, default: Optional[datetime] = None) -> Optional[datetime]:
+    """created_at is a BSON date (time-series sentiment_records), epoch ms (API writes), epoch s,
+    or an ISO string (older seeds / CSV loads)."""
+    if v is None or v == '':
+        return default
+    try:
+        if isinstance(v, datetime):
+            return v.replace(tzinfo=None)
+        if isinstance(v, (int, float)):
+            ts = float(v)
+            if ts > 1e12:
+                ts /= 1000.0
+            return datetime.utcfromtimestamp(ts)
+        return datetime.fromisoformat(str(v).replace('Z', '').split('+')[0])
+    except Exception:
+        return default
+
+
+def doc_day(v) -> str:
+    return parse_dt(v, datetime.utcnow()).date().isoformat()
+
+
+def doc_region(doc: Dict[str, Any]) -> str:
+    """Canonical state/UT name from region/state/location, else UNKNOWN_REGION."""
+    from regions.views import _normalize_region, STATES
+    parts = [doc.get('region'), doc.get('state'), doc.get('location')]
+    combined = ' '.join([p for p in parts if isinstance(p, str) and p.strip()])
+    name = _normalize_region(combined) if combined else None
+    return name if name in STATES else UNKNOWN_REGION
+
+
+def doc_category(doc: Dict[str, Any]) -> str:
+    return doc.get('category') or doc.get('topic') or 'General'
+
+
+def label_change(doc: Dict[str, Any], text: str, old: Optional[str], new: str) -> Dict[str, Any]:
+    """Describe one label change of a source document (fetched with ROLLUP_FIELDS)."""
+    return {
+        'day': doc_day(doc.get('created_at')),
+        'region': doc_region(doc),
+        'category': doc_category(doc),
+        'text': text or '',
+        'old': old,
+        'new': new,
+    }
+
+
+def _label_inc(old: Optional[str], new: str) -> Counter:
+    inc = Counter()
+    if old in LABELS:
+        inc[old] -= 1
+    else:
+        inc['df'] += 1
+    inc[new] += 1
+    return inc
+
+
+# -------------------- day x region x category --------------------
+def daily_deltas(changes: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str, str], Counter]:
+    deltas: Dict[Tuple[str, str, str], Counter] = defaultdict(Counter)
+    for c in changes:
+        if c['old'] == c['new'] or c['new'] not in LABELS:
+            continue
+        inc = _label_inc(c['old'], c['new'])
+        inc['total'] = inc.pop('df', 0)
+        deltas[(c['day'], c['region'], c['category'])].update(inc)
+    return deltas
+
+
+def apply_daily_deltas(mongo_db, deltas: Dict[Tuple[str, str, str], Counter]) -> int:
+    ops = []
+    for (day, region, category), inc in deltas.items():
+        inc = {k: v for k, v in inc.items() if v}
+        if inc:
+            ops.append(UpdateOne({'date': day, 'region': region, 'category': category}, {'$inc': inc}, upsert=True))
+    for i in range(0, len(ops), WRITE_CHUNK):
+        mongo_db[DAILY].bulk_write(ops[i:i + WRITE_CHUNK], ordered=False)
+    return len(ops)
+
+
+def daily_counts(mongo_db, group_by: Optional[str], start_day: Optional[str] = None,
+                 end_day: Optional[str] = None) -> Dict[Any, Dict[str, int]]:
+    """Sum label counts over an optional [start_day, end_day] window, grouped by
+    'date', 'region', 'category' or None (one overall row keyed None)."""
+    match: Dict[str, Any] = {}
+    if start_day or end_day:
+        match['date'] = {}
+        if start_day:
+            match['date']['$gte'] = start_day
+        if end_day:
+            match['date']['$lte'] = end_day
+    rows = mongo_db[DAILY].aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': f'${group_by}' if group_by else None,
+            'positive': {'$sum': '$positive'},
+            'neutral': {'$sum': '$neutral'},
+            'negative': {'$sum': '$negative'},
+        }},
+    ])
+    return {r['_id']: {k: int(r.get(k) or 0) for k in LABELS} for r in rows}
+
+
+# -------------------- keyword terms --------------------
+def term_deltas(changes: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], Counter]:
+    """Label changes -> {(day, term): Counter of df / label deltas}."""
+    deltas: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    for c in changes:
+        if c['old'] == c['new'] or c['new'] not in LABELS:
+            continue
+        inc = _label_inc(c['old'], c['new'])
+        for term in doc_terms(c['text']) | {DOCS_TERM}:
+            deltas[(c['day'], term)].update(inc)
+    return deltas
+
+
+def apply_term_deltas(mongo_db, deltas: Dict[Tuple[str, str], Counter]) -> int:
+    ops = []
+    for (day, term), inc in deltas.items():
+        inc = {k: v for k, v in inc.items() if v}
+        if inc:
+            ops.append(UpdateOne({'date': day, 'term': term}, {'$inc': inc}, upsert=True))
+    for i in range(0, len(ops), WRITE_CHUNK):
+        mongo_db[TERMS].bulk_write(ops[i:i + WRITE_CHUNK], ordered=False)
+    return len(ops)
+
+
+def top_keywords(mongo_db, start_day: str, end_day: str, top_k: int = 12,
+                 max_df: float = 0.95) -> List[Dict[str, Any]]:
+    """Top terms over [start_day, end_day] ranked by df x smoothed idf (the corpus-level
+    analogue of mean tf-idf), with max_df applied like the old per-request vectorizer."""
+    window = {'date': {'$gte': start_day, '$lte': end_day}}
+    n_docs = 0
+    for d in mongo_db[TERMS].find({**window, 'term': DOCS_TERM}, {'df': 1}):
+        n_docs += int(d.get('df') or 0)
+    if not n_docs:
+        return []
+    rows = mongo_db[TERMS].aggregate([
+        {'$match': {**window, 'term': {'$ne': DOCS_TERM}}},
+        {'$group': {
+            '_id': '$term',
+            'df': {'$sum': '$df'},
+            'positive': {'$sum': '$positive'},
+            'neutral': {'$sum': '$neutral'},
+            'negative': {'$sum': '$negative'},
+        }},
+        {'$match': {'df': {'$gt': 0, '$lte': max_df * n_docs}}},
+        {'$addFields': {'score': {'$multiply': ['$df', {'$add': [
+            {'$ln': {'$divide': [1 + n_docs, {'$add': ['$df', 1]}]}}, 1]}]}}},
+        {'$sort': {'score': -1, '_id': 1}},
+        {'$limit': int(top_k)},
+    ])
+    out = []
+    for r in rows:
+        pos, neu, neg = (int(r.get(k) or 0) for k in LABELS)
+        # Majority label, ties resolved positive > negative > neutral as before
+        if pos >= neg and pos >= neu:
+            label = 'positive'
+        elif neg >= pos and neg >= neu:
+            label = 'negative'
+        else:
+            label = 'neutral'
+        out.append({'word': r['_id'], 'count': int(r['df']), 'sentiment': label,
+                    'score': round(float(r['score']) / n_docs, 6)})
+    return out
+
+
+# -------------------- maintenance --------------------
+def ensure_indexes(mongo_db):
+    mongo_db[DAILY].create_index([('date', 1), ('region', 1), ('category', 1)], unique=True)
+    mongo_db[TERMS].create_index([('date', 1), ('term', 1)], unique=True)
+
+
+def record_labels(mongo_db, changes: List[Dict[str, Any]]):
+    """Apply label changes (see label_change) to every rollup."""
+    if changes:
+        apply_daily_deltas(mongo_db, daily_deltas(changes))
+        apply_term_deltas(mongo_db, term_deltas(changes))
+
+
+def rebuild(mongo_db, sources: Dict[str, Tuple[str, Any]], chunk: int = 5000) -> Dict[str, int]:
+    """Drop and recompute the rollups from stored labels.
+
+    `sources` maps collection -> (text field, label getter(doc) -> label or None).
+    """
+    mongo_db[DAILY].drop()
+    mongo_db[TERMS].drop()
+    ensure_indexes(mongo_db)
+    counted = {}
+    for name, (text_field, get_label) in sources.items():
+        n = 0
+        buf: List[Dict[str, Any]] = []
+        cur = mongo_db[name].find({}, {**ROLLUP_FIELDS, text_field: 1}, batch_size=chunk)
+        for doc in cur:
+            lab = get_label(doc)
+            if lab is None:
+                continue
+            buf.append(label_change(doc, doc.get(text_field), None, lab))
+            if len(buf) >= chunk:
+                record_labels(mongo_db, buf)
+                n += len(buf)
+                buf = []
+        record_labels(mongo_db, buf)
+        counted[name] = n + len(buf)
+    return counted
@@ -1,5 +1,515 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, SimpleTestCase
+
+from adminpanel.management.commands import rebuild_sentiment_rollups, relabel_sentiment
+from core.testing import MemoryDB
+from sentiment import (broker, embedding_cache, ingest, labeling, language, nlp_utils, onnx_backend, relabel,
+                       rollups, views)
+
+try:
+    import torch
+    from transformers import BertConfig, BertModel, BertForSequenceClassification, BertTokenizer
+    from sentence_transformers import SentenceTransformer
+except Exception:  # pragma: no cover
+    torch = None
 
 class BasicTest(TestCase):
     def test_placeholder(self):
         self.assertTrue(True)
+
+
+AGREEMENT_TEXTS = [
+    'The pension was credited on time, thank you',
+    'Portal keeps crashing and nobody answers the helpline',
+    'Application status updated to under review',
+    'Ration card not received after three months of waiting',
+    'Road repaired quickly, very helpful staff',
+    'Water supply is broken again and the scheme office is late',
+    'Good service at the ration shop',
+    'Bad roads, unhappy with the delay',
+] * 8
+MIN_INT8_AGREEMENT = 0.9
+
+
+def _tiny_bert(model_dir, classifier=False):
+    """Small random BERT + word-level vocab so the export path is tested without a model download."""
+    words = sorted({w.strip(',.').lower() for t in AGREEMENT_TEXTS for w in t.split()})
+    with open(os.path.join(model_dir, 'vocab.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + words))
+    tokenizer = BertTokenizer(os.path.join(model_dir, 'vocab.txt'))
+    config = BertConfig(vocab_size=len(words) + 5, hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+                        intermediate_size=128, num_labels=3,
+                        id2label={0: 'negative', 1: 'neutral', 2: 'positive'},
+                        label2id={'negative': 0, 'neutral': 1, 'positive': 2})
+    torch.manual_seed(0)
+    model = (BertForSequenceClassification if classifier else BertModel)(config).eval()
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    return model, tokenizer
+
+
+def _prototype_labels(encoder, texts):
+    protos = nlp_utils.get_prototype_embeddings(encoder)
+    emb = encoder.encode(texts, batch_size=16, convert_to_tensor=True, show_progress_bar=False)
+    return nlp_utils.prototype_labels(nlp_utils.util.cos_sim(emb, protos))
+
+
+def _agreement(a, b):
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+@unittest.skipUnless(torch is not None and onnx_backend.available(), 'torch/onnxruntime not installed')
+class OnnxBackendAgreementTest(SimpleTestCase):
+    """ONNX Runtime labels must agree with the PyTorch path they replace."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def test_encoder_labels_match_pytorch(self):
+        src, out = os.path.join(self.tmp, 'src'), os.path.join(self.tmp, 'encoder')
+        os.makedirs(src)
+        _tiny_bert(src)
+        st = SentenceTransformer(src, device='cpu')
+        onnx_backend.export_encoder(st, out, 'tiny-bert')
+
+        expected = _prototype_labels(st, AGREEMENT_TEXTS)
+        fp32 = onnx_backend.OnnxEncoder(out, threads=1, quantized=False)
+        int8 = onnx_backend.OnnxEncoder(out, threads=1)
+        self.assertEqual(_prototype_labels(fp32, AGREEMENT_TEXTS), expected)
+        self.assertTrue(int8.quantized)
+        self.assertGreaterEqual(_agreement(_prototype_labels(int8, AGREEMENT_TEXTS), expected), MIN_INT8_AGREEMENT)
+
+    def test_classifier_labels_match_pipeline(self):
+        from transformers import pipeline
+        out = os.path.join(self.tmp, 'classifier')
+        model, tokenizer = _tiny_bert(self.tmp, classifier=True)
+        onnx_backend.export_classifier(model, tokenizer, out, 'tiny-bert-cls')
+
+        expected = [p['label'] for p in pipeline('sentiment-analysis', model=model, tokenizer=tokenizer)(AGREEMENT_TEXTS)]
+        clf = onnx_backend.OnnxClassifier(out, threads=1)
+        self.assertEqual(clf.model.name_or_path, 'tiny-bert-cls+onnx-int8')
+        got = [p['label'] for p in clf(AGREEMENT_TEXTS, truncation=True)]
+        self.assertGreaterEqual(_agreement(got, expected), MIN_INT8_AGREEMENT)
+
+    def test_exported_minilm_agrees_with_pytorch(self):
+        """Runs against a real `manage.py export_sentiment_onnx` output when one exists."""
+        model_dir = os.path.join(str(settings.SENTIMENT_ONNX_DIR), 'encoder')
+        if not os.path.exists(os.path.join(model_dir, onnx_backend.META_FILE)):
+            self.skipTest('no exported encoder in SENTIMENT_ONNX_DIR')
+        try:
+            st = SentenceTransformer(nlp_utils.ST_MODEL_NAME)
+        except Exception:
+            self.skipTest('PyTorch MiniLM model not available')
+        expected = _prototype_labels(st, AGREEMENT_TEXTS)
+        got = _prototype_labels(onnx_backend.OnnxEncoder(model_dir), AGREEMENT_TEXTS)
+        self.assertGreaterEqual(_agreement(got, expected), MIN_INT8_AGREEMENT)
+
+
+class LanguageRoutingTest(SimpleTestCase):
+    def test_detect_route(self):
+        self.assertEqual(language.detect_route('Ration card not received after three months'), language.ROUTE_ENGLISH)
+        self.assertEqual(language.detect_route('राशन कार्ड तीन महीने से नहीं मिला'), language.ROUTE_MULTILINGUAL)
+        self.assertEqual(language.detect_route('ரேஷன் கார்டு இன்னும் வரவில்லை'), language.ROUTE_MULTILINGUAL)
+        self.assertEqual(language.detect_route('Pension abhi tak nahi mila, bahut pareshani hai'),
+                         language.ROUTE_MULTILINGUAL)
+        self.assertEqual(language.detect_route(''), language.ROUTE_ENGLISH)
+
+    def test_routes_are_batched_separately_and_merged_in_order(self):
+        calls = []
+
+        def fake(model_id, label):
+            def make():
+                def infer(batch):
+                    calls.append((model_id, list(batch)))
+                    return [label] * len(batch), None
+                return model_id, 0, infer
+            return make
+
+        routes = {language.ROUTE_ENGLISH: (fake('en', 'positive'),),
+                  language.ROUTE_MULTILINGUAL: (fake('xlmr', 'negative'),)}
+        texts = ['good road', 'सड़क खराब है', 'nice staff', 'bijli nahi hai kal se']
+        with unittest.mock.patch.object(nlp_utils, '_ROUTE_BACKENDS', routes), \
+                unittest.mock.patch.object(nlp_utils, 'get_cache', return_value=None), \
+                self.settings(SENTIMENT_ROUTING=True):
+            labels, model_ids = nlp_utils.analyze_sentiments_with_models(texts)
+        self.assertEqual(labels, ['positive', 'negative', 'positive', 'negative'])
+        self.assertEqual(model_ids, ['en', 'xlmr', 'en', 'xlmr'])
+        self.assertEqual(sorted(len(batch) for _m, batch in calls), [2, 2])
+
+
+class InferenceBrokerTest(SimpleTestCase):
+    def test_concurrent_requests_share_batches_and_get_their_own_labels(self):
+        from concurrent.futures import ThreadPoolExecutor
+        b = broker.InferenceBroker(infer=lambda ts: ([t.upper() for t in ts], ['m'] * len(ts)),
+                                   max_batch=8, max_wait_ms=20)
+        self.addCleanup(b.close)
+        requests = [[f'r{i}-{j}' for j in range(1 + i % 3)] for i in range(30)]
+        with ThreadPoolExecutor(10) as ex:
+            results = list(ex.map(lambda texts: b.submit(texts).result(5), requests))
+        for texts, (labels, model_ids) in zip(requests, results):
+            self.assertEqual(labels, [t.upper() for t in texts])
+            self.assertEqual(model_ids, ['m'] * len(texts))
+        self.assertLess(b.batches, len(requests))
+
+    def test_inference_errors_reach_every_caller(self):
+        def boom(_texts):
+            raise RuntimeError('model crashed')
+        b = broker.InferenceBroker(infer=boom, max_wait_ms=1)
+        self.addCleanup(b.close)
+        with self.assertRaises(RuntimeError):
+            b.submit(['a']).result(5)
+
+
+class EmbeddingCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def cache(self, **kwargs):
+        return embedding_cache.EmbeddingCache(self.root, 'xlmr/proto-v1', dim=4, **kwargs)
+
+    def vectors(self, n, start=0):
+        return np.arange(start * 4, (start + n) * 4, dtype=np.float32).reshape(n, 4)
+
+    def keys(self, *texts):
+        return [embedding_cache.text_key('xlmr/proto-v1', t) for t in texts]
+
+    def test_lookup_hits_after_add(self):
+        cache = self.cache()
+        keys = self.keys('ration shop closed', 'pension delayed')
+        cache.add(keys, ['negative', 'neutral'], self.vectors(2))
+        hits = cache.lookup(keys + self.keys('water supply restored'))
+        self.assertEqual(sorted(hits), sorted(keys))
+        label, vec = hits[keys[1]]
+        self.assertEqual(label, 'neutral')
+        np.testing.assert_array_equal(vec, self.vectors(1, start=1)[0])
+        self.assertEqual(cache.lookup(self.keys('Ration  shop closed ')), {})
+        self.assertIn(keys[0], cache.lookup(self.keys(' ration shop   closed')))
+
+    def test_second_instance_sees_appended_rows(self):
+        writer, reader = self.cache(), self.cache()
+        self.assertEqual(len(reader), 0)
+        keys = self.keys('a', 'b', 'c')
+        writer.add(keys[:2], ['positive', 'negative'], self.vectors(2))
+        self.assertEqual(len(reader), 2)
+        writer.add(keys[2:], ['neutral'], self.vectors(1, start=2))
+        label, vec = reader.lookup(keys[2:])[keys[2]]
+        self.assertEqual(label, 'neutral')
+        np.testing.assert_array_equal(vec, self.vectors(1, start=2)[0])
+
+    def test_partial_trailing_index_line_is_ignored(self):
+        cache = self.cache()
+        keys = self.keys('a', 'b')
+        cache.add(keys[:1], ['positive'], self.vectors(1))
+        # A concurrent writer has written its vector and half of its index line
+        with open(cache.emb_path, 'ab') as f:
+            f.write(self.vectors(1, start=1).astype(np.float16).tobytes())
+        with open(cache.index_path, 'ab') as f:
+            f.write(keys[1][:10].encode())
+        reader = self.cache()
+        self.assertEqual((len(reader), reader.lookup(keys[1:])), (1, {}))
+        with open(cache.index_path, 'ab') as f:
+            f.write(f'{keys[1][10:]}\tnegative\n'.encode())
+        self.assertEqual(reader.lookup(keys[1:])[keys[1]][0], 'negative')
+
+    def test_orphan_vectors_are_truncated(self):
+        cache = self.cache()
+        keys = self.keys('a', 'b')
+        cache.add(keys[:1], ['positive'], self.vectors(1))
+        # A writer died after its vectors but before its index lines
+        with open(cache.emb_path, 'ab') as f:
+            f.write(np.full((3, 4), 99, dtype=np.float16).tobytes())
+        cache.add(keys[1:], ['negative'], self.vectors(1, start=1))
+        self.assertEqual(os.path.getsize(cache.emb_path), 2 * 4 * 2)
+        np.testing.assert_array_equal(self.cache().lookup(keys[1:])[keys[1]][1], self.vectors(1, start=1)[0])
+
+    def test_cache_stops_growing_at_max_rows(self):
+        cache = self.cache(max_rows=3)
+        keys = self.keys(*'abcde')
+        cache.add(keys[:2], ['positive'] * 2, self.vectors(2))
+        cache.add(keys[2:], ['negative'] * 3, self.vectors(3, start=2))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(sorted(cache.lookup(keys)), sorted(keys[:3]))
+        self.assertEqual(os.path.getsize(cache.emb_path), 3 * 4 * 2)
+        cache.add(keys[4:], ['neutral'], self.vectors(1))
+        self.assertEqual(len(self.cache(max_rows=3)), 3)
+
+
+def rollup_snapshot(mongo_db):
+    """Rollup rows without zero counters or empty buckets, comparable across delta and rebuild."""
+    snap = {}
+    for name, keys in ((rollups.DAILY, ('date', 'region', 'category')), (rollups.TERMS, ('date', 'term'))):
+        rows = set()
+        for doc in mongo_db[name].find({}):
+            counts = tuple(sorted((k, v) for k, v in doc.items() if k not in keys and k != '_id' and v))
+            if counts:
+                rows.add((tuple(doc[k] for k in keys), counts))
+        snap[name] = rows
+    return snap
+
+
+def fake_model(texts):
+    """Labels by keyword, as a newer model that reads 'late' as a complaint."""
+    return ['negative' if 'late' in t else 'positive' for t in texts], ['sentiment-v2'] * len(texts)
+
+
+class RollupEquivalenceTest(SimpleTestCase):
+    """Incremental rollup deltas must always equal a rebuild from the stored labels."""
+
+    def setUp(self):
+        self.db = MemoryDB()
+        self.model = unittest.mock.patch.object(labeling, 'analyze_sentiments_with_models')
+        self.infer = self.model.start()
+        self.addCleanup(self.model.stop)
+        day = 1714550400000
+        for i in range(6):
+            self.db['complaints'].insert_one({
+                'description': f'ration shop {"opened late" if i % 2 else "well stocked"} in ward {i}',
+                'region': ['Odisha', 'Kerala'][i % 2], 'category': 'Ration', 'created_at': day + i * 86400000,
+            })
+            self.db['sentiment_records'].insert_one({
+                'text': f'pension {"late" if i % 3 else "credited"} this month {i}', 'label': 'neutral',
+                'state': 'Bihar', 'topic': 'Pensions', 'created_at': datetime(2024, 5, 1 + i % 2),
+            })
+        # Deployments start from a rebuild, which counts the seeded labels
+        self.rebuild(self.db)
+
+    def label_everything(self, labels):
+        self.infer.side_effect = lambda texts: ([labels(t) for t in texts], ['m'] * len(texts))
+        for source, field in labeling.SOURCES.items():
+            labeling.enqueue_many(self.db, source, ((d['_id'], d[field]) for d in self.db[source].find({})))
+        labeling.drain(self.db, batch_size=5)
+
+    def rebuild(self, mongo_db):
+        with unittest.mock.patch.object(rebuild_sentiment_rollups, 'db', mongo_db):
+            call_command('rebuild_sentiment_rollups', stdout=io.StringIO())
+
+    def rebuilt(self):
+        copy = MemoryDB()
+        for source in labeling.SOURCES:
+            copy[source].docs = [dict(d) for d in self.db[source].docs]
+        self.rebuild(copy)
+        return rollup_snapshot(copy)
+
+    def test_deltas_match_a_rebuild_through_relabels_and_reruns(self):
+        rounds = [
+            lambda t: 'positive',                                  # first labels
+            lambda t: 'negative' if 'late' in t else 'positive',   # relabel positive -> negative
+            lambda t: 'negative' if 'late' in t else 'positive',   # same batch again
+            lambda t: 'neutral' if 'ward 1' in t else 'negative' if 'late' in t else 'positive',
+        ]
+        for labels in rounds:
+            self.label_everything(labels)
+            self.assertEqual(self.db[labeling.QUEUE].count_documents({}), 0)
+            # The seeded neutral labels are replaced, not counted next to the new ones
+            self.assertEqual(rollup_snapshot(self.db), self.rebuilt())
+        totals = Counter()
+        for doc in self.db[rollups.DAILY].find({}):
+            totals.update({k: doc.get(k, 0) for k in rollups.LABELS})
+        self.assertEqual(totals, Counter({'positive': 5, 'negative': 6, 'neutral': 1}))
+
+
+class RelabelResumeTest(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryDB()
+        for patcher in (unittest.mock.patch('db_connection.db', self.db),
+                        unittest.mock.patch.object(nlp_utils, 'analyze_sentiments_with_models',
+                                                   side_effect=fake_model)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        regions = ['Odisha', 'Kerala', 'Bihar']
+        for i in range(10):
+            self.db['sentiment_records'].insert_one({
+                'text': f'pension payment {"late again" if i % 2 else "received on time"} {i}',
+                'label': 'positive' if i % 3 else 'neutral',
+                'region': regions[i % 3], 'category': 'Pensions', 'created_at': 1714550400000 + i * 3600000,
+            })
+        self.sources = {'sentiment_records': 'text'}
+        rollups.rebuild(self.db, self.rebuild_sources())
+
+    def rebuild_sources(self):
+        return {'sentiment_records': ('text', labeling.stored_sentiment)}
+
+    def expected(self):
+        copy = MemoryDB()
+        copy['sentiment_records'].docs = [dict(d) for d in self.db['sentiment_records'].docs]
+        rollups.rebuild(copy, self.rebuild_sources())
+        return rollup_snapshot(copy)
+
+    def test_crash_resumes_from_checkpoint_without_double_counting(self):
+        (ck,) = relabel.plan_run(self.db, 'r1', self.sources, shards=1)
+        records = self.db['sentiment_records']
+        real_bulk_write, calls = records.bulk_write, []
+
+        def fail_second(ops, ordered=True):
+            calls.append(len(ops))
+            if len(calls) == 2:
+                raise RuntimeError('primary stepped down')
+            return real_bulk_write(ops, ordered=ordered)
+
+        with unittest.mock.patch.object(records, 'bulk_write', side_effect=fail_second):
+            with self.assertRaises(RuntimeError):
+                relabel.relabel_shard(ck['_id'], 'text', batch_size=4)
+        saved = self.db[relabel.CHECKPOINTS].find_one({'_id': ck['_id']})
+        self.assertEqual(saved['last_id'], records.docs[3]['_id'])
+        self.assertEqual((saved['labelled'], saved['scanned'], saved['done']), (4, 4, False))
+
+        (resumed,) = relabel.plan_run(self.db, 'r1', self.sources, shards=1)
+        self.assertEqual(relabel.relabel_shard(resumed['_id'], 'text', batch_size=4)['labelled'], 6)
+        self.assertEqual(relabel.progress(self.db, 'r1'), {'labelled': 10, 'scanned': 10, 'shards': 1, 'done': 1})
+        self.assertEqual(rollup_snapshot(self.db), self.expected())
+        self.assertEqual(relabel.plan_run(self.db, 'r1', self.sources, shards=1), [])
+
+    def test_restart_discards_checkpoints(self):
+        (ck,) = relabel.plan_run(self.db, 'r1', self.sources, shards=1)
+        relabel.relabel_shard(ck['_id'], 'text', batch_size=4)
+        (again,) = relabel.plan_run(self.db, 'r1', self.sources, shards=1, restart=True)
+        self.assertEqual((again['last_id'], again['done'], again['scanned']), (None, False, 0))
+        # Everything already carries the current model's label, so nothing is rewritten
+        self.assertEqual(relabel.relabel_shard(again['_id'], 'text', batch_size=4)['labelled'], 0)
+        self.assertEqual(rollup_snapshot(self.db), self.expected())
+
+    def test_default_run_id_follows_the_models(self):
+        run_ids = []
+        for model_ids in (['xlmr+prototypes-v1'], ['xlmr+prototypes-v1'], ['distilbert-sst2']):
+            with unittest.mock.patch.object(nlp_utils, 'current_model_ids', return_value=model_ids):
+                run_ids.append(relabel_sentiment.Command(stdout=io.StringIO()).default_run_id())
+        self.assertEqual(run_ids[0], run_ids[1])
+        self.assertNotEqual(run_ids[0], run_ids[2])
+
+
+class WindowCapTest(SimpleTestCase):
+    def test_busy_collection_does_not_crowd_out_complaints(self):
+        mem = MemoryDB()
+        now = datetime.utcnow()
+        for i in range(50):
+            mem['sentiment_records'].insert_one({'text': f'ivr {i}', 'region': 'Kerala',
+                                                 'created_at': now - timedelta(minutes=i)})
+        for i in range(3):
+            mem['complaints'].insert_one({'description': f'complaint {i}', 'region': 'Odisha',
+                                          'created_at': int((now - timedelta(hours=i)).timestamp() * 1000)})
+        seen = {}
+
+        def label(texts_by_region, workers=0):
+            seen.update(texts_by_region)
+            return {name: ['neutral'] * len(texts) for name, texts in texts_by_region.items()}
+
+        with unittest.mock.patch.object(views, 'db', mem), unittest.mock.patch.object(views, 'analyze_grouped', label):
+            counts = views._label_unlabelled_by_region(now - timedelta(days=30), 10)
+        self.assertEqual(len(seen['Odisha']), 3)
+        # The share complaints left unused goes back to sentiment_records, never past the cap
+        self.assertEqual(len(seen['Kerala']), 7)
+        self.assertEqual(counts['Odisha']['neutral'], 3)
+
+
+class IngestEndpointTest(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryDB()
+        self.key = ingest.create_partner(self.db, 'ivr-odisha')
+        patchers = [unittest.mock.patch.object(views, 'db', self.db),
+                    unittest.mock.patch.object(nlp_utils, 'analyze_sentiments_with_models',
+                                               lambda texts: (['neutral'] * len(texts), ['test'] * len(texts)))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, body: bytes, key=None, **extra):
+        request = RequestFactory().post('/api/sentiment/ingest/', data=body, content_type='application/x-ndjson',
+                                        HTTP_X_API_KEY=self.key if key is None else key, **extra)
+        response = views.SentimentIngestView.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    @staticmethod
+    def ndjson(*records):
+        return b'\n'.join(json.dumps(r).encode() for r in records) + b'\n'
+
+    def test_unknown_or_missing_key_is_rejected(self):
+        body = self.ndjson({'message_id': 'm1', 'text': 'hello', 'region': 'Odisha'})
+        self.assertEqual(self.post(body, key='')[0], 401)
+        self.assertEqual(self.post(body, key='not-a-key')[0], 401)
+        self.assertEqual(self.db[ingest.RECORDS].count_documents({}), 0)
+
+    def test_resent_batch_is_deduplicated(self):
+        body = self.ndjson(*({'message_id': f'm{i}', 'text': f'pension late {i}', 'region': 'Odisha'}
+                             for i in range(3)))
+        status, first = self.post(body)
+        self.assertEqual((status, first['data']['inserted'], first['data']['labelled']), (200, 3, 3))
+        status, again = self.post(body)
+        self.assertEqual((status, again['data']['inserted'], again['data']['duplicates']), (200, 0, 3))
+        self.assertEqual(self.db[ingest.RECORDS].count_documents({}), 3)
+
+    def test_invalid_lines_are_reported_and_skipped(self):
+        body = (self.ndjson({'message_id': 'ok', 'text': 'road fixed', 'region': 'Odisha'})
+                + b'{not json\n\n'
+                + self.ndjson({'message_id': 'bad-region', 'text': 'x', 'region': 'Atlantis'},
+                              {'text': 'no id', 'region': 'Odisha'}))
+        status, out = self.post(body)
+        self.assertEqual(status, 200)
+        self.assertEqual((out['data']['inserted'], out['data']['rejected']), (1, 3))
+        self.assertEqual([e['line'] for e in out['data']['errors']], [2, 4, 5])
+
+    def test_failed_upload_leaves_no_claims_behind(self):
+        body = self.ndjson(*({'message_id': f'm{i}', 'text': f'ration late {i}', 'region': 'Odisha'}
+                             for i in range(3)))
+        with unittest.mock.patch.object(nlp_utils, 'analyze_sentiments_with_models',
+                                        side_effect=RuntimeError('model failed to load')):
+            self.assertEqual(self.post(body)[0], 503)
+        self.assertEqual(self.db[ingest.CLAIMS].count_documents({}), 0)
+        self.assertEqual(self.post(body)[1]['data']['inserted'], 3)
+
+    def test_stale_claim_without_record_is_taken_over(self):
+        # A worker that died between claiming and writing
+        self.db[ingest.CLAIMS].insert_one({'_id': {'partner': 'ivr-odisha', 'message_id': 'm1'},
+                                           'record_id': ObjectId(), 'at': 0})
+        body = self.ndjson({'message_id': 'm1', 'text': 'pension late', 'region': 'Odisha'})
+        status, out = self.post(body)
+        self.assertEqual((out['data']['inserted'], out['data']['duplicates']), (1, 0))
+        claim = self.db[ingest.CLAIMS].find_one({})
+        self.assertEqual(claim['record_id'], self.db[ingest.RECORDS].find_one({})['_id'])
+        self.assertEqual(self.post(body)[1]['data']['duplicates'], 1)
+
+    def test_backfilled_claims_deduplicate_earlier_records(self):
+        self.db[ingest.RECORDS].insert_one({'partner': 'ivr-odisha', 'partner_message_id': 'old-1', 'text': 'x'})
+        self.db[ingest.RECORDS].insert_one({'text': 'seeded record without partner id'})
+        self.assertEqual(ingest.backfill_claims(self.db), 1)
+        self.assertEqual(ingest.backfill_claims(self.db), 0)
+        out = self.post(self.ndjson({'message_id': 'old-1', 'text': 'x', 'region': 'Odisha'}))[1]
+        self.assertEqual((out['data']['inserted'], out['data']['duplicates']), (0, 1))
+
+    def test_decompressed_size_cap_stops_a_gzip_bomb_early(self):
+        bomb = gzip.compress(b'a' * (8 << 20))  # one 8 MiB line, ~8 KB compressed
+        decompressed = []
+        read = gzip.GzipFile.read
+
+        def counting_read(gz, size=-1):
+            data = read(gz, size)
+            decompressed.append(len(data))
+            return data
+
+        with self.settings(SENTIMENT_INGEST_MAX_BYTES=1 << 20), \
+                unittest.mock.patch.object(gzip.GzipFile, 'read', counting_read):
+            status, out = self.post(bomb, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(status, 413)
+        self.assertLessEqual(sum(decompressed), (1 << 20) + ingest.READ_CHUNK)
+
+    def test_lines_split_across_reads(self):
+        records = [{'message_id': f'm{i}', 'text': 'x' * 3000, 'region': 'Odisha'} for i in range(60)]
+        body = self.ndjson(*records).rstrip(b'\n')  # last line without newline
+        lines = list(ingest.iter_lines(io.BytesIO(body), False, 1 << 30))
+        self.assertEqual([n for n, _ in lines], list(range(1, 61)))
+        self.assertEqual(json.loads(lines[-1][1])['message_id'], 'm59')
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import SentimentOverviewView, SentimentRegionsView
+from .views import SentimentOverviewView, SentimentRegionsView, SentimentIngestView
 
 urlpatterns = [
     path('overview/', SentimentOverviewView.as_view(), name='sentiment-overview'),
     path('regions/', SentimentRegionsView.as_view(), name='sentiment-regions'),
+    path('ingest/', SentimentIngestView.as_view(), name='sentiment-ingest'),
 ]
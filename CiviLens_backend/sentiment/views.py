@@ -1,178 +1,73 @@
+from django.conf import settings
 from django.views import View
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from datetime import datetime, timedelta
-from collections import Counter, defaultdict
-import re
 from db_connection import db
-from .nlp_utils import analyze_sentiments, top_tfidf_keywords
-from regions.views import _normalize_region, STATES
+from regions.views import STATES
+from . import ingest
+from .labeling import QUEUE, SOURCES
+from .nlp_utils import analyze_grouped
+from .rollups import daily_counts, top_keywords, doc_region, LABELS
+from .windows import recent_rows
 
-@method_decorator(csrf_exempt, name='dispatch')
-class SentimentOverviewView(View):
-    def get(self, request):
-        col = db['sentiment_records']
-        try:
-            # Time window: last 30 days for overview/trends/keywords
-            now = datetime.utcnow()
-            start_30 = now - timedelta(days=30)
-            start_7 = now - timedelta(days=7)
-
-            # Fetch recent sentiment_records (limit to avoid huge payloads)
-            # Accept created_at as ISO string or epoch ms; fallback to now
-            rows = list(col.find({}, {'sentiment': 1, 'category': 1, 'text': 1, 'created_at': 1}).limit(5000))
-
-            # Also merge in recent complaints so that new complaints contribute to sentiment immediately
-            # (Previously we only used complaints if sentiment_records were empty.)
-            complaints_col = db['complaints']
-            complaints = list(complaints_col.find({}, {
-                'status': 1,
-                'category': 1,
-                'topic': 1,
-                'description': 1,
-                'created_at': 1,
-            }).limit(10000))
-
-            synthetic = []
-            for c in complaints:
-                text = c.get('description') or ''
-                cat = c.get('category') or c.get('topic') or 'General'
-                status = c.get('status')
-                synthetic.append({
-                    'sentiment': None,  # let NLP decide
-                    'category': cat,
-                    'text': text,
-                    'created_at': c.get('created_at'),
-                    'status': status,
-                })
-
-            # Merge; rows from sentiment_records stay, complaints appended
-            rows.extend(synthetic)
-
-            # Attempt DS/NLP-based sentiment on available texts (overrides heuristic if available)
-            try:
-                texts_all = [(r.get('text') or '') for r in rows]
-                nlp_labels = analyze_sentiments(texts_all)
-                if nlp_labels:
-                    for i, lab in enumerate(nlp_labels):
-                        if lab in ('positive', 'neutral', 'negative'):
-                            rows[i]['sentiment'] = lab
-            except Exception:
-                pass
-
-            # No ensemble adjustments; keep pure model outputs
-
-            def parse_dt(v):
-                if not v:
-                    return now
-                try:
-                    if isinstance(v, (int, float)):
-                        # epoch ms or s
-                        ts = float(v)
-                        if ts > 1e12:
-                            ts /= 1000.0
-                        return datetime.utcfromtimestamp(ts)
-                except Exception:
-                    pass
-                try:
-                    return datetime.fromisoformat(str(v).replace('Z','').split('+')[0])
-                except Exception:
-                    return now
-
-            # Overall counts
-            counts = Counter()
-            total = 0
-            # Category -> counts
-            cat_pos = Counter()
-            cat_tot = Counter()
-
-            # Trends per day for last 7 days
-            day_buckets = defaultdict(lambda: {'positive': 0, 'neutral': 0, 'negative': 0})
 
-            # Collect texts within last 30 days for TF-IDF keywords
-            texts_30_pairs = []  # list[(text_lower, sentiment)]
+def _pct(n, d):
+    return int(round((n / d) * 100)) if d else 0
 
-            for r in rows:
-                s = (r.get('sentiment') or 'neutral').lower()
-                if s not in ('positive','neutral','negative'):
-                    s = 'neutral'
-                counts[s] += 1
-                total += 1
 
-                # Category stats
-                cat = (r.get('category') or 'General')
-                cat_tot[cat] += 1
-                if s == 'positive':
-                    cat_pos[cat] += 1
+def _window_cap(request):
+    """Newest-first sample cap for raw-row reads: ?limit= bounded by SENTIMENT_WINDOW_CAP."""
+    max_cap = int(getattr(settings, 'SENTIMENT_WINDOW_CAP', 12000))
+    try:
+        return max(1, min(int(request.GET.get('limit') or max_cap), max_cap))
+    except ValueError:
+        return max_cap
 
-                # Time-based
-                dt = parse_dt(r.get('created_at'))
-                # Trends: last 7 days buckets by date
-                if dt >= start_7:
-                    key = dt.date().isoformat()
-                    day_buckets[key][s] += 1
 
-                # Keywords source: last 30 days texts
-                if dt >= start_30:
-                    text = (r.get('text') or '')
-                    texts_30_pairs.append((text.lower(), s))
-
-            def pct(n, d):
-                return int(round((n / d) * 100)) if d else 0
+@method_decorator(csrf_exempt, name='dispatch')
+class SentimentOverviewView(View):
+    def get(self, request):
+        try:
+            # Time window: last 30 days for keywords, 7 days for trends; overall/categories all time.
+            # Everything is read from the sentiment_daily / sentiment_terms_daily rollups that the
+            # labelling worker maintains, so no model runs and no raw rows are scanned here.
+            now = datetime.utcnow()
+            today = now.date().isoformat()
+            start_30 = (now - timedelta(days=30)).date().isoformat()
+            start_7 = (now - timedelta(days=6)).date().isoformat()
 
-            overall = {
-                'positive': pct(counts['positive'], total),
-                'neutral': pct(counts['neutral'], total),
-                'negative': pct(counts['negative'], total),
-            }
+            counts = daily_counts(db, None).get(None, {k: 0 for k in LABELS})
+            total = sum(counts.values())
+            overall = {k: _pct(counts[k], total) for k in LABELS}
 
             # Build 7 days of trends chronologically
+            by_day = daily_counts(db, 'date', start_7, today)
             trends = []
             for i in range(6, -1, -1):
                 day = (now - timedelta(days=i)).date().isoformat()
-                b = day_buckets.get(day, {'positive':0,'neutral':0,'negative':0})
+                b = by_day.get(day, {'positive': 0, 'neutral': 0, 'negative': 0})
                 dsum = b['positive'] + b['neutral'] + b['negative']
                 trends.append({
                     'date': day,
-                    'positive': pct(b['positive'], dsum),
-                    'neutral': pct(b['neutral'], dsum),
-                    'negative': pct(b['negative'], dsum),
+                    'positive': _pct(b['positive'], dsum),
+                    'neutral': _pct(b['neutral'], dsum),
+                    'negative': _pct(b['negative'], dsum),
                 })
 
             # Categories: top 6 by total, show positive% per category
-            categories = []
-            for cat, tot in cat_tot.most_common(6):
-                categories.append({
-                    'name': cat,
-                    'positive': pct(cat_pos[cat], tot)
-                })
+            by_cat = daily_counts(db, 'category')
+            cat_tot = sorted(((sum(c.values()), cat) for cat, c in by_cat.items()), key=lambda x: (-x[0], x[1]))
+            categories = [{'name': cat, 'positive': _pct(by_cat[cat]['positive'], tot)}
+                          for tot, cat in cat_tot[:6] if tot]
 
-            # Keywords via TF-IDF across last 30 days texts
-            keywords = []
+            # Keywords from the per-day term rollups (maintained at labelling time)
             try:
-                texts_30 = [t for (t, _s) in texts_30_pairs]
-                tfidf_terms = top_tfidf_keywords(texts_30, top_k=12)
-                for term, _score in tfidf_terms:
-                    # Count docs containing the term and sentiment majority
-                    pos = neu = neg = cnt = 0
-                    for txt, s in texts_30_pairs:
-                        if term in txt:
-                            cnt += 1
-                            if s == 'positive':
-                                pos += 1
-                            elif s == 'negative':
-                                neg += 1
-                            else:
-                                neu += 1
-                    # choose label
-                    if pos >= neg and pos >= neu:
-                        label = 'positive'
-                    elif neg >= pos and neg >= neu:
-                        label = 'negative'
-                    else:
-                        label = 'neutral'
-                    keywords.append({'word': term, 'count': cnt, 'sentiment': label})
+                keywords = [
+                    {'word': k['word'], 'count': k['count'], 'sentiment': k['sentiment']}
+                    for k in top_keywords(db, start_30, today, top_k=12)
+                ]
             except Exception:
                 keywords = []
 
@@ -181,85 +76,100 @@ class SentimentOverviewView(View):
                 'trends': trends,
                 'categories': categories,
                 'keywords': keywords,
+                # texts still waiting for the labelling worker
+                'pending': db[QUEUE].estimated_document_count(),
             }
             return JsonResponse({'success': True, 'data': data})
         except Exception as e:
             return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
 
 
+def _label_unlabelled_by_region(since, cap):
+    """Group not-yet-labelled texts in the window by canonical region and label them all in
+    one deduplicated, length-sorted pass (optionally on a worker pool). The cap is split
+    evenly across SOURCES, so a busy collection cannot crowd the others out; a share one
+    source does not use passes to the next."""
+    texts_by_region = {}
+    sources = list(SOURCES.items())
+    spare = 0
+    for i, (source, field) in enumerate(sources):
+        share = cap // len(sources) + (cap % len(sources) if i == 0 else 0) + spare
+        rows = recent_rows(
+            db[source], since, {field: 1, 'region': 1, 'state': 1, 'location': 1}, share,
+            extra={'sentiment': {'$exists': False}, 'label': {'$exists': False}},
+        )
+        for r in rows:
+            text = r.get(field) or ''
+            name = doc_region(r)
+            if text and name in STATES:
+                texts_by_region.setdefault(name, []).append(text)
+        spare = share - len(rows)
+    if not texts_by_region:
+        return {}
+    labelled = analyze_grouped(texts_by_region, workers=int(getattr(settings, 'SENTIMENT_WORKERS', 0))) or {}
+    return {name: {k: labels.count(k) for k in LABELS} for name, labels in labelled.items()}
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class SentimentRegionsView(View):
     """Return sentiment score per region/state for heatmap preview.
     Output shape: [ { name: str, sentiment_score: int } ]
+
+    Scores come from the sentiment_daily rollup. With ?include_unlabelled=1, the newest
+    window rows the labelling worker has not reached yet (up to ?limit=, capped by
+    SENTIMENT_WINDOW_CAP) are labelled here in a single batched pass.
     """
     def get(self, request):
         try:
-            col = db['sentiment_records']
-            # Try to use explicit sentiment records first (recent window)
             now = datetime.utcnow()
-            start_30 = now - timedelta(days=30)
+            start_30 = (now - timedelta(days=30)).date().isoformat()
+            by_region = daily_counts(db, 'region', start_30, now.date().isoformat())
+            if (request.GET.get('include_unlabelled') or '').lower() in ('1', 'true', 'yes'):
+                cap = _window_cap(request)
+                for name, extra in _label_unlabelled_by_region(now - timedelta(days=30), cap).items():
+                    counts = by_region.setdefault(name, {k: 0 for k in LABELS})
+                    for k in LABELS:
+                        counts[k] += extra[k]
 
-            # Pull limited rows for performance
-            rows = list(col.find({}, {'text': 1, 'region': 1, 'state': 1, 'location': 1, 'created_at': 1, 'sentiment': 1}).limit(8000))
-
-            # If no sentiment_records, fallback to complaints descriptions as proxy
-            if not rows:
-                complaints_col = db['complaints']
-                rows = list(complaints_col.find({}, {
-                    'description': 1,
-                    'region': 1,
-                    'state': 1,
-                    'location': 1,
-                    'created_at': 1,
-                }).limit(12000))
-
-            # Group texts by normalized region name
-            by_region_texts = defaultdict(list)
-
-            def parse_dt(v):
-                try:
-                    if isinstance(v, (int, float)):
-                        ts = float(v)
-                        if ts > 1e12:
-                            ts /= 1000.0
-                        return datetime.utcfromtimestamp(ts)
-                    return datetime.fromisoformat(str(v).replace('Z','').split('+')[0])
-                except Exception:
-                    return now
-
-            for r in rows:
-                dt = parse_dt(r.get('created_at'))
-                if dt < start_30:
-                    continue
-                # Prefer explicit region fields and normalize
-                parts = [r.get('region'), r.get('state'), r.get('location')]
-                combined = ' '.join([p for p in parts if isinstance(p, str) and p.strip()])
-                region_name = _normalize_region(combined) if combined else None
-                if not region_name:
-                    continue
-                text = r.get('text') or r.get('description') or ''
-                if text:
-                    by_region_texts[region_name].append(text)
-
-            # Run model per-region in batches to keep memory lower
             out = []
-            for name, texts in by_region_texts.items():
+            for name, c in by_region.items():
                 # Keep only canonical state/UT names
                 if name not in STATES:
                     continue
-                try:
-                    labels = analyze_sentiments(texts)
-                except Exception:
-                    labels = []
-                pos = sum(1 for lab in labels if lab == 'positive')
-                neu = sum(1 for lab in labels if lab == 'neutral')
-                neg = sum(1 for lab in labels if lab == 'negative')
-                total = pos + neu + neg
-                score = int(round((pos / total) * 100)) if total else 0
-                out.append({ 'name': name, 'sentiment_score': score })
+                total = c['positive'] + c['neutral'] + c['negative']
+                if not total:
+                    continue
+                out.append({'name': name, 'sentiment_score': _pct(c['positive'], total)})
 
             # Sort by state name for stable UI
             out.sort(key=lambda x: x['name'])
             return JsonResponse({'success': True, 'data': out})
         except Exception as e:
             return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class SentimentIngestView(View):
+    """Bulk NDJSON (optionally gzip) feedback upload from IVR / SMS partners; see sentiment/ingest.py."""
+
+    def post(self, request):
+        partner = ingest.authenticate(db, request.META.get('HTTP_X_API_KEY', ''))
+        if partner is None:
+            return JsonResponse({'success': False, 'error': {'message': 'Valid X-API-Key required'}}, status=401)
+
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').lower()
+        gzipped = encoding == 'gzip' or request.content_type in ('application/gzip', 'application/x-gzip')
+        try:
+            summary = ingest.ingest(
+                db, partner['_id'],
+                ingest.iter_lines(request, gzipped, int(getattr(settings, 'SENTIMENT_INGEST_MAX_BYTES', 128 << 20))),
+                max_records=int(getattr(settings, 'SENTIMENT_INGEST_MAX_RECORDS', 100000)),
+                inline_label_max=int(getattr(settings, 'SENTIMENT_INGEST_INLINE_LABEL_MAX', 5000)),
+            )
+        except ingest.IngestError as e:
+            return JsonResponse({'success': False, 'error': {'message': str(e)}}, status=e.status)
+        except Exception as e:
+            # Claims of unwritten records were released; the whole batch can be resent
+            msg = f'Ingest failed, resend the batch: {e}'
+            return JsonResponse({'success': False, 'error': {'message': msg}}, status=503)
+        return JsonResponse({'success': True, 'data': summary})
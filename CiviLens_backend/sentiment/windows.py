@@ -0,0 +1,64 @@
+"""Time-window reads over complaints / sentiment_records.
+
+`created_at` is a BSON date on sentiment_records (core.timeseries layout),
+an epoch-ms number on API-written complaints, and an ISO string on older seeded
+rows. BSON comparisons only match values of the same type, so a window is one
+indexed range per representation. Each range is read newest first up to the
+cap, and the runs are merged.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .rollups import LABELS, parse_dt
+
+WINDOW_COLLECTIONS = ('sentiment_records', 'complaints')
+
+
+def created_ranges(since: datetime) -> List[Dict[str, Any]]:
+    """Range predicates matching created_at >= since for the date, string and numeric encodings."""
+    since_ms = int(since.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return [
+        {'created_at': {'$gte': since}},
+        {'created_at': {'$gte': since.isoformat()}},
+        {'created_at': {'$gte': since_ms}},
+    ]
+
+
+def recent_rows(col, since: datetime, projection: Dict[str, int], cap: int,
+                extra: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Up to `cap` documents created at or after `since`, newest first."""
+    if cap <= 0:
+        return []
+    rows: List[Dict[str, Any]] = []
+    for rng in created_ranges(since):
+        cur = col.find({**(extra or {}), **rng}, {**projection, 'created_at': 1}).sort('created_at', -1).limit(cap)
+        rows.extend(cur)
+    # Merge the newest-first runs
+    rows.sort(key=lambda r: parse_dt(r.get('created_at'), datetime.min), reverse=True)
+    return rows[:cap]
+
+
+def daily_label_counts(col, since: datetime, until: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+    """{day: {positive, neutral, negative}} straight from BSON-date created_at values, grouped in
+    Mongo. On a time-series collection the range is answered from bucket bounds."""
+    rng: Dict[str, Any] = {'$gte': since}
+    if until is not None:
+        rng['$lt'] = until
+    out: Dict[str, Dict[str, int]] = {}
+    for row in col.aggregate([
+        {'$match': {'created_at': rng}},
+        {'$group': {
+            '_id': {'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                    'label': {'$toLower': {'$ifNull': ['$sentiment', {'$ifNull': ['$label', '']}]}}},
+            'n': {'$sum': 1},
+        }},
+    ]):
+        label = row['_id']['label']
+        if label in LABELS:
+            out.setdefault(row['_id']['day'], dict.fromkeys(LABELS, 0))[label] += row['n']
+    return out
+
+
+def ensure_indexes(mongo_db):
+    for name in WINDOW_COLLECTIONS:
+        mongo_db[name].create_index([('created_at', -1)])
@@ -0,0 +1,11 @@
+"""Indexes behind the account write paths.
+
+Registration inserts directly and relies on the unique username / email indexes to reject
+duplicates. Refresh and logout look up refresh tokens by value.
+"""
+
+
+def ensure_indexes(mongo_db):
+    mongo_db['users'].create_index([('username', 1)], unique=True)
+    mongo_db['users'].create_index([('email', 1)], unique=True)
+    mongo_db['refresh_tokens'].create_index([('token', 1)])
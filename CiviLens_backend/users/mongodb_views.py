@@ -3,7 +3,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
 import json
-import time
+from datetime import datetime
 
 # Import the database connection from db_connection.py
 from db_connection import db
@@ -18,13 +18,12 @@ def log_user_activity(request):
             activity_type = data.get('activity_type')
             details = data.get('details', {})
             
-            # Insert activity into MongoDB
+            # Time-series layout (core.timeseries): BSON date time field, user/type as bucket metadata
             activity_collection = db['user_activities']
             activity_data = {
-                'user_id': user_id,
-                'activity_type': activity_type,
+                'meta': {'user_id': user_id, 'activity_type': activity_type},
                 'details': details,
-                'timestamp': int(time.time() * 1000)  # Store as timestamp
+                'timestamp': datetime.utcnow(),
             }
             result = activity_collection.insert_one(activity_data)
             
@@ -1,5 +1,55 @@
-from django.test import TestCase
+import json
+import unittest.mock
+from types import SimpleNamespace
+
+from bson import ObjectId
+from django.test import RequestFactory, TestCase, SimpleTestCase
+from pymongo.errors import DuplicateKeyError
+
+from core.jwt_utils import create_refresh_token
+from core.testing import RecordingDB
+from users import views
+
 
 class BasicTest(TestCase):
     def test_placeholder(self):
         self.assertTrue(True)
+
+
+class WriteRoundTripTest(SimpleTestCase):
+    """Registration and token refresh answer with the documented number of Mongo calls."""
+
+    def setUp(self):
+        self.db = RecordingDB()
+        patchers = [unittest.mock.patch.object(views, 'db', self.db),
+                    unittest.mock.patch.object(views, '_unique_user_indexes', True)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_create_user_is_one_insert(self):
+        self.db['users'].results['insert_one'] = SimpleNamespace(inserted_id=ObjectId())
+        self.assertIsNotNone(views.create_user('asha', 'asha@example.org', 'pw'))
+        self.assertEqual(self.db.calls, [('users', 'insert_one')])
+
+    def test_create_user_duplicate(self):
+        self.db['users'].results['insert_one'] = DuplicateKeyError('dup')
+        self.assertIsNone(views.create_user('asha', 'asha@example.org', 'pw'))
+        self.assertEqual(self.db.calls, [('users', 'insert_one')])
+
+    def test_refresh(self):
+        user_id = ObjectId()
+        token = create_refresh_token({'_id': user_id})
+        self.db['refresh_tokens'].results['find_one_and_update'] = {'_id': ObjectId(), 'user_id': user_id}
+        self.db['users'].results['find_one'] = {'_id': user_id}
+        req = RequestFactory().post('/', data=json.dumps({'refresh': token}), content_type='application/json')
+        resp = views.RefreshTokenView.as_view()(req)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.db.calls, [('refresh_tokens', 'find_one_and_update'), ('users', 'find_one'),
+                                         ('refresh_tokens', 'insert_one')])
+
+    def test_refresh_revoked_token(self):
+        token = create_refresh_token({'_id': ObjectId()})
+        req = RequestFactory().post('/', data=json.dumps({'refresh': token}), content_type='application/json')
+        self.assertEqual(views.RefreshTokenView.as_view()(req).status_code, 401)
+        self.assertEqual(self.db.calls, [('refresh_tokens', 'find_one_and_update')])
@@ -1,5 +1,6 @@
 import json
 import hashlib
+import logging
 import secrets
 import time
 from django.views import View
@@ -8,7 +9,10 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from core.jwt_utils import create_access_token, create_refresh_token, decode_token
 from db_connection import db
-from pymongo import errors as pymongo_errors
+from pymongo import ReturnDocument, errors as pymongo_errors
+from . import indexes as user_indexes
+
+logger = logging.getLogger(__name__)
 
 # Helper function to hash passwords
 def hash_password(password):
@@ -18,21 +22,36 @@ def hash_password(password):
 def verify_password(password, hashed):
     return hash_password(password) == hashed
 
+# Unique username / email indexes make registration a single insert. None until first tried;
+# False if existing duplicates prevent them, in which case create_user checks before inserting.
+_unique_user_indexes = None
+
+
+def _user_indexes_ready():
+    global _unique_user_indexes
+    if _unique_user_indexes is None:
+        try:
+            user_indexes.ensure_indexes(db)
+            _unique_user_indexes = True
+        except pymongo_errors.OperationFailure as e:
+            if e.code != 11000:
+                raise
+            logger.warning("Duplicate users prevent the unique username/email indexes; using a pre-insert check")
+            _unique_user_indexes = False
+    return _unique_user_indexes
+
 # Helper function to create a new user in MongoDB
 def create_user(username, email, password, role='user', region=None, first_name='', last_name='', phone='', address=''):
     print(f"Creating user: username={username}, email={email}, role={role}, region={region}")
     users_collection = db['users']
     
-    # Check if user already exists
-    try:
-        existing_user = users_collection.find_one({'$or': [{'username': username}, {'email': email}]})
-    except pymongo_errors.PyMongoError as e:
-        # Bubble up to view for a clean 503 response
-        raise
-    print(f"Existing user check result: {existing_user}")
-    if existing_user is not None:
-        print("User already exists")
-        return None
+    # Duplicates are rejected by the unique indexes; only check first without them
+    if not _user_indexes_ready():
+        existing_user = users_collection.find_one({'$or': [{'username': username}, {'email': email}]}, {'_id': 1})
+        print(f"Existing user check result: {existing_user}")
+        if existing_user is not None:
+            logger.info("Registration rejected: username or email already exists")
+            return None
     
     # Create user document
     user_doc = {
@@ -52,8 +71,9 @@ def create_user(username, email, password, role='user', region=None, first_name=
     print(f"Inserting user document: {user_doc}")
     try:
         result = users_collection.insert_one(user_doc)
-    except pymongo_errors.PyMongoError as e:
-        raise
+    except pymongo_errors.DuplicateKeyError:
+        logger.info("Registration rejected: username or email already exists")
+        return None
     user_doc['_id'] = str(result.inserted_id)
     print(f"User created successfully with ID: {user_doc['_id']}")
     return user_doc
@@ -274,18 +294,19 @@ class ProfileView(View):
         from bson import ObjectId
         users_collection = db['users']
         try:
-            result = users_collection.update_one({'_id': ObjectId(user_data['_id'])}, {'$set': update_fields})
+            # Update and read back the profile snapshot in one round trip
+            user = users_collection.find_one_and_update({'_id': ObjectId(user_data['_id'])}, {'$set': update_fields},
+                                                        projection={'password': 0},
+                                                        return_document=ReturnDocument.AFTER)
+        except pymongo_errors.DuplicateKeyError:
+            return JsonResponse({'success': False, 'error': {'message': 'Username already taken'}}, status=400)
         except pymongo_errors.PyMongoError:
             return JsonResponse({'success': False, 'error': {'message': 'Database unavailable. Please try again later.'}}, status=503)
 
-        if result.matched_count == 0:
+        if user is None:
             return JsonResponse({'success': False, 'error': {'message': 'User not found'}}, status=404)
 
         # Return updated profile snapshot
-        try:
-            user = users_collection.find_one({'_id': ObjectId(user_data['_id'])})
-        except pymongo_errors.PyMongoError:
-            return JsonResponse({'success': False, 'error': {'message': 'Database unavailable. Please try again later.'}}, status=503)
 
         data = {
             'id': str(user['_id']),
@@ -315,9 +336,14 @@ class RefreshTokenView(View):
             if not payload or payload.get('type') != 'refresh':
                 return JsonResponse({'success': False, 'error': {'message': 'Invalid refresh token'}}, status=401)
             
-            # Check if the refresh token exists in the database and is not revoked
+            # Revoke the presented token and get its record in one atomic step, so a token
+            # replayed concurrently is only ever exchanged once
             refresh_tokens_collection = db['refresh_tokens']
-            token_record = refresh_tokens_collection.find_one({'token': refresh_token, 'revoked': False})
+            token_record = refresh_tokens_collection.find_one_and_update(
+                {'token': refresh_token, 'revoked': False},
+                {'$set': {'revoked': True}},
+                projection={'user_id': 1},
+            )
             
             if not token_record:
                 return JsonResponse({'success': False, 'error': {'message': 'Refresh token not found or revoked'}}, status=401)
@@ -326,19 +352,13 @@ class RefreshTokenView(View):
             from bson import ObjectId
             users_collection = db['users']
             try:
-                user = users_collection.find_one({'_id': ObjectId(payload['user_id'])})
+                user = users_collection.find_one({'_id': ObjectId(payload['user_id'])}, {'_id': 1})
             except pymongo_errors.PyMongoError:
                 return JsonResponse({'success': False, 'error': {'message': 'Database unavailable. Please try again later.'}}, status=503)
             
             if not user:
                 return JsonResponse({'success': False, 'error': {'message': 'User not found'}}, status=404)
             
-            # Revoke the old refresh token
-            refresh_tokens_collection.update_one(
-                {'_id': token_record['_id']},
-                {'$set': {'revoked': True}}
-            )
-            
             # Create new tokens
             new_access_token = create_access_token(user)
             new_refresh_token = create_refresh_token(user)
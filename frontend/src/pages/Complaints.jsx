@@ -1,5 +1,5 @@
 import React, { useState } from 'react'
-import { useQuery } from '@tanstack/react-query'
+import { useInfiniteQuery } from '@tanstack/react-query'
 import { Link, useNavigate } from 'react-router-dom'
 import { useLanguage } from '../contexts/LanguageContext'
 import { useAuth } from '../contexts/AuthContext'
@@ -12,15 +12,25 @@ const Complaints = () => {
   const [filter, setFilter] = useState('all')
   const [searchQuery, setSearchQuery] = useState('')
 
-  const { data: complaintsData, isLoading, isError } = useQuery({
+  const {
+    data: complaintsData,
+    isLoading,
+    isError,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ['complaints', user?.id || user?._id || null],
-    queryFn: complaintsApi.listComplaints,
+    // The API pages the feed; each page carries the cursor of the next one
+    queryFn: ({ pageParam }) => complaintsApi.listComplaintsPage({ cursor: pageParam }),
+    initialPageParam: null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
     staleTime: 1000 * 60 * 5, // 5 minutes
     enabled: !loading, // wait for auth bootstrap/refresh so Authorization header is present
     retry: 1,
   })
 
-  const complaints = complaintsData || []
+  const complaints = complaintsData ? complaintsData.pages.flatMap((page) => page.complaints) : []
   
   const handleNewComplaintClick = (e) => {
     e.preventDefault()
@@ -202,6 +212,18 @@ const Complaints = () => {
                 </div>
               )}
             </div>
+
+            {hasNextPage && (
+              <div className="text-center mt-6">
+                <button
+                  onClick={() => fetchNextPage()}
+                  disabled={isFetchingNextPage}
+                  className="bg-gray-100 hover:bg-gray-200 text-gray-800 font-medium py-2 px-6 rounded-lg transition duration-300 disabled:opacity-50"
+                >
+                  {isFetchingNextPage ? 'Loading...' : 'Load more complaints'}
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -37,7 +37,29 @@ export async function createComplaint(complaintData) {
 }
 
 /**
- * Fetch list of complaints
+ * Fetch one page of complaints (the API returns at most `limit` rows, 50 by default)
+ * GET /api/complaints/?cursor=&limit=
+ * Returns { complaints, nextCursor }; nextCursor is null on the last page
+ */
+export async function listComplaintsPage({ cursor, ...params } = {}) {
+  try {
+    const query = new URLSearchParams(params)
+    if (cursor) query.set('cursor', cursor)
+    const qs = query.toString() ? `?${query.toString()}` : ''
+    const response = await apiClient.get(`/complaints/${qs}`)
+    if (response.data.success) {
+      return { complaints: response.data.data, nextCursor: response.data.page?.next_cursor || null }
+    } else {
+      throw new Error(response.data.error?.message || 'Failed to fetch complaints')
+    }
+  } catch (error) {
+    console.error('Error fetching complaints:', error)
+    throw error
+  }
+}
+
+/**
+ * Fetch the first page of complaints; use listComplaintsPage to follow next_cursor
  * GET /api/complaints/
  */
 export async function listComplaints(params) {